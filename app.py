@@ -1,6 +1,7 @@
 from flask import Flask, g
 from flask_cors import CORS
 import logging
+import os
 import uuid
 from werkzeug.exceptions import HTTPException
 from flask import request, jsonify
@@ -12,15 +13,20 @@ from backend.database import db
 # 导入所有路由蓝图
 from routes import (
     page_bp, professor_bp, email_bp, record_bp, 
-    user_bp, file_bp, import_bp, settings_bp
+    user_bp, file_bp, import_bp, settings_bp, job_bp, metrics_bp
 )
 
 # 移除原本的 basicConfig，统一使用 Config.init_app 进行日志初始化
 logger = logging.getLogger(__name__)
 
 
-def create_app():
-    """创建Flask应用实例"""
+def create_app(recover_outbox: bool = True):
+    """
+    创建Flask应用实例
+
+    Args:
+        recover_outbox: 是否接管发件箱中遗留的未发送邮件（独立发送进程模式下由发送进程处理）
+    """
     app = Flask(__name__, 
                 static_folder='frontend/static',
                 template_folder='frontend/templates')
@@ -50,9 +56,22 @@ def create_app():
     # 注册所有蓝图
     _register_blueprints(app)
     
+    # 继续发送上次进程退出时未完成的批量任务
+    if recover_outbox and Config.OUTBOX_RECOVER_ON_STARTUP and not Config.OUTBOX_EXTERNAL_WORKERS:
+        _recover_outbox(app)
+    
     return app
 
 
+def _recover_outbox(app):
+    """从发件箱恢复未完成的批量任务"""
+    from backend.batch_jobs import batch_job_manager
+    try:
+        batch_job_manager.recover(app)
+    except Exception as e:
+        logger.error(f"恢复发件箱任务失败: {e}")
+
+
 def _register_request_handlers(app):
     """注册请求处理钩子"""
     
@@ -113,8 +132,11 @@ def _register_blueprints(app):
     app.register_blueprint(file_bp)
     app.register_blueprint(import_bp)
     app.register_blueprint(settings_bp)
+    app.register_blueprint(job_bp)
+    app.register_blueprint(metrics_bp)
 
 
 if __name__ == '__main__':
-    app = create_app()
+    # 调试模式下只在实际提供服务的重载子进程中恢复发件箱任务
+    app = create_app(recover_outbox=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
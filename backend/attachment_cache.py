@@ -0,0 +1,175 @@
+"""
+附件编码缓存
+同一个附件（如简历PDF）在一次批量发送中会附加到每一封邮件上，
+这里按 (文件路径, 大小, 修改时间, 显示名称) 缓存base64编码后的MIME附件内容，
+同一批次内每个附件只读取、编码一次；超出内存预算时按LRU淘汰。
+大附件不进入缓存，由 StreamingAttachment 在发送时分块读取、编码
+"""
+
+import base64
+import os
+import threading
+import logging
+from collections import OrderedDict
+from email.header import Header
+from email.mime.base import MIMEBase
+from typing import Dict, Iterator, Optional, Tuple
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+# 缓存键：(绝对路径, 文件大小, 修改时间ns, 显示名称)
+CacheKey = Tuple[str, int, int, str]
+
+
+class EncodedAttachment:
+    """已编码的附件内容（不可变，可在多封邮件间共享）"""
+
+    __slots__ = ('filename', 'payload', 'size')
+
+    def __init__(self, filename: str, payload: str):
+        self.filename = filename
+        self.payload = payload
+        self.size = len(payload)
+
+    def to_mime_part(self) -> MIMEBase:
+        """生成新的MIME附件对象（payload字符串共享，不会重复编码）"""
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(self.payload)
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header(
+            'Content-Disposition',
+            f'attachment; filename= {Header(self.filename, "utf-8").encode()}'
+        )
+        return part
+
+
+class StreamingAttachment:
+    """
+    从磁盘流式编码的附件：每次发送时按块读取文件并生成base64行，
+    内存占用只与块大小有关，与附件大小无关
+    """
+
+    # 57字节原始数据恰好编码为一行76个字符，块大小取其整数倍以保证每块按行对齐
+    CHUNK_SIZE = 57 * 1024
+
+    __slots__ = ('file_path', 'filename', 'size')
+
+    def __init__(self, file_path: str, filename: str):
+        self.file_path = file_path
+        self.filename = filename
+        self.size = os.path.getsize(file_path)
+
+    def header_part(self) -> MIMEBase:
+        """不含内容的MIME附件对象，仅用于生成附件头"""
+        return EncodedAttachment(self.filename, '').to_mime_part()
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """逐块生成以CRLF换行的base64内容"""
+        with open(self.file_path, 'rb') as f:
+            while True:
+                block = f.read(self.CHUNK_SIZE)
+                if not block:
+                    break
+                yield base64.encodebytes(block).replace(b'\n', b'\r\n')
+
+
+class AttachmentCache:
+    """进程级附件编码缓存（LRU，线程安全）"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: 缓存的编码内容总大小上限（字节）；单个附件超过上限时不缓存
+        """
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[CacheKey, EncodedAttachment]' = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        # 正在编码中的键，并发请求同一附件时等待首个请求完成，保证只编码一次
+        self._loading: Dict[CacheKey, threading.Event] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(file_path: str, display_name: Optional[str] = None) -> CacheKey:
+        stat = os.stat(file_path)
+        filename = display_name or os.path.basename(file_path)
+        return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, filename)
+
+    def get(self, file_path: str, display_name: Optional[str] = None) -> EncodedAttachment:
+        """获取附件的编码结果（未命中时读取文件并编码）"""
+        key = self.make_key(file_path, display_name)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                loading = self._loading.get(key)
+                if loading is None:
+                    self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            loading.wait()
+            # 首个请求编码的附件超出预算未入缓存时，自行编码
+            with self._lock:
+                cached = key in self._entries
+                if not cached:
+                    self.misses += 1
+            if not cached:
+                return self._encode(file_path, key)
+
+        # 在锁外读取与编码，避免阻塞其他线程
+        try:
+            entry = self._encode(file_path, key)
+            self._put(key, entry)
+            return entry
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+    @staticmethod
+    def _encode(file_path: str, key: CacheKey) -> EncodedAttachment:
+        with open(file_path, 'rb') as f:
+            payload = base64.encodebytes(f.read()).decode('ascii')
+        return EncodedAttachment(key[3], payload)
+
+    def get_part(self, file_path: str, display_name: Optional[str] = None) -> MIMEBase:
+        """获取可直接附加到邮件的MIME附件对象"""
+        return self.get(file_path, display_name).to_mime_part()
+
+    def _put(self, key: CacheKey, entry: EncodedAttachment):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._current_bytes -= old.size
+            self._entries[key] = entry
+            self._current_bytes += entry.size
+            while self._current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._current_bytes -= evicted.size
+                logger.debug(f"附件缓存淘汰: {evicted.filename}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+# 进程级附件缓存，内存预算见 Config.ATTACHMENT_CACHE_BYTES
+attachment_cache = AttachmentCache(Config.ATTACHMENT_CACHE_BYTES)
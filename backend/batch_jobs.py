@@ -0,0 +1,901 @@
+"""
+批量发送后台任务
+批量发送接口只负责组装邮件并提交任务，实际发送在有界线程池中执行，
+HTTP请求立即返回任务ID，前端通过 /api/jobs/<id> 查询进度。
+任务提交时邮件先写入持久化发件箱，发送进度随每封邮件落盘，进程崩溃后可继续发送
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from backend.circuit_breaker import CircuitOpenError
+from backend.config import Config
+from backend.domain_throttle import DomainQueue, DomainThrottle, domain_throttle as default_domain_throttle, \
+    interleave_by_domain, recipient_domain
+from backend.email_service import EmailService
+from backend.prepared_message import PreparedMessage
+from backend.rate_limiter import DailyQuotaExceeded, RateLimiter, SendPacer, rate_limiter as default_rate_limiter, \
+    send_pacer as default_send_pacer
+from backend.outbox import Outbox, make_worker_id, outbox as default_outbox
+from backend.scheduler import ScheduledDispatcher
+from backend.render_pool import RenderAhead, RenderPool, render_pool as default_render_pool
+from backend.smtp_metrics import (
+    PHASE_PACING_WAIT, PHASE_PREPARE, PHASE_RATE_WAIT, PHASE_RENDER, PhaseHistograms, SendTimings
+)
+from backend.smtp_errors import RetryPolicy, SMTPSendError
+from backend.utils.timezone_utils import format_shanghai_time, get_shanghai_utcnow
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_SCHEDULED = 'scheduled'
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_PAUSED = 'paused'
+JOB_CANCELLED = 'cancelled'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+FINISHED_STATES = (JOB_CANCELLED, JOB_COMPLETED, JOB_FAILED)
+
+
+def distribute_by_weight(count: int, weights: List[float]) -> List[int]:
+    """
+    平滑加权轮询：把 count 个收件人按权重分配给各发件人，且分配结果在顺序上交错分布
+
+    Args:
+        count: 收件人数量
+        weights: 各发件人权重（非正权重的发件人不参与分配；全部非正时平均分配），
+            须为数字，调用方负责校验请求参数（非数字时抛出 ValueError / TypeError）
+
+    Returns:
+        List[int]: 长度为 count 的发件人下标列表
+    """
+    weights = [max(0.0, float(w or 0)) for w in weights]
+    if not any(weights):
+        weights = [1.0] * len(weights)
+    total = sum(weights)
+    current = [0.0] * len(weights)
+    assignment = []
+    for _ in range(count):
+        for i, w in enumerate(weights):
+            current[i] += w
+        best = max(range(len(weights)), key=lambda i: current[i])
+        current[best] -= total
+        assignment.append(best)
+    return assignment
+
+
+class BatchJob:
+    """批量发送任务"""
+
+    def __init__(self, kind: str, messages: List[Dict], send_interval: float = 0,
+                 failed_emails: Optional[List[Dict]] = None, job_id: Optional[str] = None,
+                 scheduled_at: Optional[datetime] = None):
+        """
+        Args:
+            kind: 任务类型（batch / document）
+            messages: 待发送邮件列表，每个元素包含收件人、内容、发件人配置及记录所需字段
+            send_interval: 发送间隔（秒）
+            failed_emails: 组装阶段已确定失败的条目（如教授不存在）
+            job_id: 任务ID（从发件箱恢复任务时沿用原ID）
+            scheduled_at: 定时发送时间（UTC），为None或已过时立即发送
+        """
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.messages = messages
+        self.send_interval = max(0, send_interval or 0)
+        self.failed_emails = list(failed_emails or [])
+        self.total = len(messages) + len(self.failed_emails)
+        self.success_count = 0
+        self.failed_count = len(self.failed_emails)
+        # 按发件邮箱统计：{sender_email: {'sent': n, 'failed': n}}
+        self.sender_stats: Dict[str, Dict[str, int]] = {}
+        # 因临时错误等待重试的邮件数
+        self.retrying = 0
+        # 当日额度用尽、暂停到额度重置的发件人：发件邮箱 -> 恢复发送的时间戳
+        self.quota_waits: Dict[str, float] = {}
+        # 本任务各发送阶段的耗时直方图
+        self.timings = PhaseHistograms()
+        if scheduled_at is not None and scheduled_at <= get_shanghai_utcnow():
+            scheduled_at = None
+        self.scheduled_at = scheduled_at
+        self.status = JOB_SCHEDULED if scheduled_at else JOB_QUEUED
+        self.error = None
+        # 由独立发送进程处理（进度从发件箱统计）
+        self.delegated = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancelled = False
+        # set 表示运行中，clear 表示暂停
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        # 用于打断限速、发送间隔与额度重置等待（暂停或取消时立即唤醒）
+        self._wake_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def processed(self) -> int:
+        return self.success_count + self.failed_count
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.processed)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> bool:
+        with self._lock:
+            if self.status in FINISHED_STATES:
+                return False
+            self._cancelled = True
+            if self.status in (JOB_QUEUED, JOB_SCHEDULED):
+                self._finish(JOB_CANCELLED)
+        self._resume_event.set()
+        self._wake_event.set()
+        return True
+
+    def pause(self) -> bool:
+        with self._lock:
+            if self.status not in (JOB_QUEUED, JOB_RUNNING):
+                return False
+            self._resume_event.clear()
+            self.status = JOB_PAUSED
+            # 唤醒正在等待的发送通道，使其停在 wait_if_paused 处
+            self._wake_event.set()
+        return True
+
+    def resume(self) -> bool:
+        with self._lock:
+            if self.status != JOB_PAUSED:
+                return False
+            self.status = JOB_RUNNING if self.started_at else JOB_QUEUED
+            if not self._cancelled:
+                self._wake_event.clear()
+            self._resume_event.set()
+        return True
+
+    def wait_if_paused(self):
+        """暂停时阻塞，直到恢复或取消"""
+        self._resume_event.wait()
+
+    def sleep(self, seconds: float):
+        """可被暂停或取消打断的等待"""
+        if seconds > 0:
+            self._wake_event.wait(seconds)
+
+    def record_result(self, success: bool, failed_info: Optional[Dict] = None,
+                      sender_email: Optional[str] = None):
+        with self._lock:
+            if success:
+                self.success_count += 1
+            else:
+                self.failed_count += 1
+                if failed_info:
+                    self.failed_emails.append(failed_info)
+            if sender_email:
+                stats = self.sender_stats.setdefault(sender_email, {'sent': 0, 'failed': 0})
+                stats['sent' if success else 'failed'] += 1
+
+    def note_retry(self, delta: int):
+        with self._lock:
+            self.retrying += delta
+
+    def note_quota_wait(self, sender_email: str, seconds: Optional[float]):
+        """记录发件人等待额度重置（seconds 为 None 时表示已恢复发送）"""
+        with self._lock:
+            if seconds is None:
+                self.quota_waits.pop(sender_email, None)
+            else:
+                self.quota_waits[sender_email] = time.time() + seconds
+
+    def _start(self):
+        with self._lock:
+            self.started_at = time.time()
+            if self.status == JOB_QUEUED:
+                self.status = JOB_RUNNING
+
+    def _finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+
+    def eta_seconds(self) -> Optional[float]:
+        """按已处理邮件的平均耗时估算剩余时间"""
+        if self.status in FINISHED_STATES:
+            return 0
+        sent_so_far = self.processed - (self.total - len(self.messages))
+        if not self.started_at or sent_so_far <= 0:
+            return None
+        elapsed = time.time() - self.started_at
+        return round(elapsed / sent_so_far * self.remaining, 1)
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'scheduled_at': format_shanghai_time(self.scheduled_at),
+            'total': self.total,
+            'sent': self.success_count,
+            'failed': self.failed_count,
+            'remaining': self.remaining,
+            'eta_seconds': self.eta_seconds(),
+            'success_count': self.success_count,
+            'failed_count': self.failed_count,
+            'retrying': self.retrying,
+            # 等待当日额度重置的发件人及剩余秒数
+            'quota_waits': {email: max(0, round(until - time.time())) for email, until in self.quota_waits.items()},
+            'failed_emails': list(self.failed_emails),
+            'senders': {email: dict(stats) for email, stats in self.sender_stats.items()},
+            'timings': self.timings.to_dict(),
+            'error': self.error,
+            'finished': self.status in FINISHED_STATES
+        }
+
+
+class BatchJobManager:
+    """批量任务管理器：有界线程池执行，内存中保存任务状态"""
+
+    def __init__(self, max_workers: int = 2, max_finished_jobs: int = 100,
+                 email_service: Optional[EmailService] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 outbox: Optional[Outbox] = None,
+                 external_workers: Optional[bool] = None,
+                 domain_throttle: Optional[DomainThrottle] = None,
+                 render_pool: Optional[RenderPool] = None,
+                 prewarm: Optional[bool] = None,
+                 send_pacer: Optional[SendPacer] = None,
+                 sender_connections: Optional[int] = None):
+        self.max_workers = max_workers
+        self.max_finished_jobs = max_finished_jobs
+        self.email_service = email_service or EmailService()
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        # 任务 send_interval 的节奏与接手同一任务的发送进程共享
+        self.send_pacer = send_pacer or default_send_pacer
+        self.retry_policy = retry_policy or RetryPolicy(
+            Config.SEND_RETRY_MAX_ATTEMPTS, Config.SEND_RETRY_BASE_DELAY, Config.SEND_RETRY_MAX_DELAY
+        )
+        self.outbox = outbox or default_outbox
+        # 按收件域名限制并发与间隔，所有任务共享
+        self.domain_throttle = domain_throttle or default_domain_throttle
+        # 大批量邮件的个性化部分交给渲染进程生成
+        self.render_pool = render_pool or default_render_pool
+        # 同一发件人同时使用的SMTP连接数（仍受该发件人的限速配额约束）
+        connections = Config.SENDER_CONNECTIONS if sender_connections is None else sender_connections
+        self.sender_connections = max(1, int(connections))
+        # 提交任务时提前建立并认证各发件人的SMTP连接
+        self.prewarm = Config.SMTP_PREWARM if prewarm is None else prewarm
+        # 为True时只写入发件箱，由独立的发送进程认领发送
+        self.external_workers = Config.OUTBOX_EXTERNAL_WORKERS if external_workers is None else external_workers
+        # 本进程认领发件箱邮件时使用的标识
+        self.worker_id = make_worker_id('web')
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: Dict[str, BatchJob] = {}
+        self._lock = threading.Lock()
+        self._heartbeat: Optional[threading.Thread] = None
+        # 定时任务调度：到期时认领发件箱中的邮件并开始发送
+        self._scheduler = ScheduledDispatcher(self._dispatch_scheduled)
+        self._app = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix='batch-job'
+                )
+            return self._executor
+
+    def submit(self, app, job: BatchJob) -> BatchJob:
+        """
+        提交任务：邮件先写入发件箱（已从发件箱认领的恢复任务除外），再交给线程池或独立发送进程；
+        定时任务写入发件箱后加入调度堆，到期再发送
+        """
+        self._app = app
+        # 立即发送的任务：写入发件箱的同时在后台完成连接与登录
+        if self.prewarm and not self.external_workers and not job.scheduled_at:
+            self._prewarm_senders(job)
+        if any('outbox_id' not in message for message in job.messages):
+            # 按收件域名轮转排列后写入，发送进程按发件箱顺序认领时同样不会集中投递到同一域名
+            job.messages = interleave_by_domain(job.messages)
+            # 定时任务在到期前不认领，进程重启后可从发件箱重建调度
+            claimed_by = None if self.external_workers or job.scheduled_at else self.worker_id
+            with app.app_context():
+                self.outbox.enqueue(
+                    job.id, job.kind, job.messages, job.send_interval,
+                    claimed_by=claimed_by, scheduled_at=job.scheduled_at
+                )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune_locked()
+        if job.scheduled_at and not self.external_workers:
+            self._scheduler.schedule(_timestamp(job.scheduled_at), job.id)
+            logger.info(
+                f"定时任务已提交: {job.id} ({job.kind}, {job.total} 封)，"
+                f"计划发送时间 {format_shanghai_time(job.scheduled_at)}"
+            )
+            return job
+        if self.external_workers:
+            job.delegated = True
+            job._start()
+            logger.info(f"批量任务已写入发件箱，等待发送进程处理: {job.id} ({job.kind}, {job.total} 封)")
+            return job
+        self._ensure_heartbeat(app)
+        self._get_executor().submit(self._run, app, job)
+        logger.info(f"批量任务已提交: {job.id} ({job.kind}, {job.total} 封)")
+        return job
+
+    def _prewarm_senders(self, job: BatchJob):
+        """为任务中的每个发件人在后台线程中预热一个连接池连接"""
+        sender_configs = {}
+        for message in job.messages:
+            config = message['sender_config']
+            sender_configs.setdefault(self.email_service.get_pool_key(config), config)
+        for config in sender_configs.values():
+            threading.Thread(
+                target=self.email_service.prewarm, args=(config,),
+                name=f"smtp-prewarm-{job.id[:8]}", daemon=True
+            ).start()
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_status(self, job_id: str) -> Optional[Dict]:
+        """
+        查询任务进度：本进程执行的任务直接返回内存状态，
+        由独立发送进程处理或本进程已不再持有的任务从发件箱统计（需在应用上下文中调用）
+        """
+        job = self.get(job_id)
+        if job and not job.delegated:
+            return job.to_dict()
+        summary = self.outbox.job_summary(job_id)
+        if summary is None:
+            return job.to_dict() if job else None
+
+        pre_failed = list(job.failed_emails) if job else []
+        total = summary['total'] + len(pre_failed)
+        failed = summary['failed'] + len(pre_failed)
+        next_attempt_at = summary['next_attempt_at']
+        if job and job.status in FINISHED_STATES:
+            status = job.status
+        elif summary['pending'] == 0:
+            status = JOB_CANCELLED if summary['cancelled'] else JOB_COMPLETED
+        elif summary['sent'] + summary['failed'] == 0 and next_attempt_at and next_attempt_at > get_shanghai_utcnow():
+            status = JOB_SCHEDULED
+        else:
+            status = JOB_RUNNING
+        return {
+            'job_id': job_id,
+            'kind': job.kind if job else None,
+            'status': status,
+            'scheduled_at': format_shanghai_time(next_attempt_at) if status == JOB_SCHEDULED else None,
+            'total': total,
+            'sent': summary['sent'],
+            'failed': failed,
+            'remaining': summary['pending'],
+            'eta_seconds': None,
+            'success_count': summary['sent'],
+            'failed_count': failed,
+            'retrying': summary['retrying'],
+            # 由其他进程发送的任务，额度等待与耗时直方图不在本进程中（保持与进程内任务相同的字段）
+            'quota_waits': {},
+            'failed_emails': pre_failed + summary['failed_emails'],
+            'senders': summary['senders'],
+            'timings': (job.timings if job else PhaseHistograms()).to_dict(),
+            'error': None,
+            'finished': status in FINISHED_STATES
+        }
+
+    def control(self, job_id: str, action: str) -> Optional[bool]:
+        """
+        执行 cancel / pause / resume（需在应用上下文中调用）
+
+        Returns:
+            Optional[bool]: 任务不存在时返回None，否则返回操作是否生效
+        """
+        job = self.get(job_id)
+        if job and not job.delegated:
+            scheduled = job.status == JOB_SCHEDULED
+            handled = getattr(job, action)()
+            if handled and scheduled and action == 'cancel':
+                # 尚未开始的定时任务：发件箱中的邮件直接标记为已取消
+                self.outbox.cancel_job(job_id)
+            return handled
+        if self.outbox.job_summary(job_id) is None and not job:
+            return None
+        # 独立发送进程处理的任务只支持取消：把未发送的邮件标记为已取消
+        if action != 'cancel':
+            return False
+        cancelled = self.outbox.cancel_job(job_id)
+        if job:
+            job.cancel()
+        return cancelled > 0
+
+    def recover(self, app) -> List[BatchJob]:
+        """
+        接管发件箱中未完成且无人持有（或租约已过期）的邮件，按原任务重新提交；
+        尚未到时间的定时任务重新加入调度堆。用于进程崩溃或重启后继续发送
+        """
+        self._app = app
+        with app.app_context():
+            for info in self.outbox.scheduled_jobs():
+                if self.get(info['job_id']):
+                    continue
+                job = BatchJob(
+                    info['kind'], [], send_interval=info['send_interval'],
+                    job_id=info['job_id'], scheduled_at=info['scheduled_at']
+                )
+                job.total = info['count']
+                with self._lock:
+                    self._jobs[job.id] = job
+                self._scheduler.schedule(_timestamp(info['scheduled_at']), job.id)
+                logger.info(f"已恢复定时任务: {job.id}，计划发送时间 {format_shanghai_time(job.scheduled_at)}")
+
+            rows = []
+            while True:
+                claimed = self.outbox.claim(self.worker_id, limit=500, due_only=False)
+                if not claimed:
+                    break
+                rows.extend(claimed)
+            groups: Dict[str, List[Dict]] = {}
+            kinds: Dict[str, tuple] = {}
+            for row in rows:
+                groups.setdefault(row.job_id, []).append(self.outbox.to_message(row))
+                kinds[row.job_id] = (row.kind, row.send_interval or 0)
+
+        jobs = []
+        for job_id, messages in groups.items():
+            kind, send_interval = kinds[job_id]
+            jobs.append(self.submit(app, BatchJob(kind, messages, send_interval=send_interval, job_id=job_id)))
+        if jobs:
+            logger.info(f"已从发件箱恢复 {len(jobs)} 个任务，共 {len(rows)} 封未发送邮件")
+        return jobs
+
+    def _dispatch_scheduled(self, job_id: str):
+        """定时任务到期：从发件箱认领该任务的邮件并开始发送（在调度线程中调用）"""
+        job = self.get(job_id)
+        app = self._app
+        if job is None or job.status != JOB_SCHEDULED or app is None:
+            return
+        with app.app_context():
+            messages = []
+            while True:
+                claimed = self.outbox.claim(self.worker_id, limit=500, job_id=job_id)
+                if not claimed:
+                    break
+                messages.extend(self.outbox.to_message(row) for row in claimed)
+        with job._lock:
+            if job.status != JOB_SCHEDULED:
+                return
+            job.messages = messages
+            job.total = len(messages) + len(job.failed_emails)
+            job.status = JOB_QUEUED
+        logger.info(f"定时任务到期，开始发送: {job_id} ({len(messages)} 封)")
+        self._ensure_heartbeat(app)
+        self._get_executor().submit(self._run, app, job)
+
+    def _ensure_heartbeat(self, app):
+        """启动租约续约线程：本进程持有的发件箱邮件在任务执行期间（含暂停、限速等待）不会被其他进程接管"""
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._heartbeat = threading.Thread(
+                target=self._heartbeat_loop, args=(app,), name='outbox-heartbeat', daemon=True
+            )
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self, app):
+        interval = max(1.0, self.outbox.lease_seconds / 3)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                active = any(job.status not in FINISHED_STATES for job in self._jobs.values())
+            if not active:
+                continue
+            try:
+                with app.app_context():
+                    self.outbox.extend_leases(self.worker_id)
+            except Exception as e:
+                logger.warning(f"发件箱租约续约出错: {e}")
+
+    def _prune_locked(self):
+        """仅保留最近的若干已结束任务"""
+        finished = sorted(
+            (j for j in self._jobs.values() if j.status in FINISHED_STATES),
+            key=lambda j: j.finished_at or 0
+        )
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            self._jobs.pop(job.id, None)
+
+    def _run(self, app, job: BatchJob):
+        """在工作线程中执行任务：每个发件人一条发送通道，多发件人时各通道并行"""
+        if job.cancelled:
+            if job.status not in FINISHED_STATES:
+                job._finish(JOB_CANCELLED)
+            self._cancel_outbox(app, job)
+            return
+        job._start()
+        try:
+            lanes: Dict[str, List[Dict]] = {}
+            for message in job.messages:
+                lane_key = self.email_service.get_rate_limit_key(message['sender_config'])
+                lanes.setdefault(lane_key, []).append(message)
+
+            if len(lanes) <= 1:
+                for messages in lanes.values():
+                    self._run_lane(app, job, messages)
+            else:
+                with ThreadPoolExecutor(max_workers=len(lanes), thread_name_prefix='batch-lane') as lane_pool:
+                    # 任一通道抛出的异常在此处重新抛出
+                    for future in [lane_pool.submit(self._run_lane, app, job, msgs) for msgs in lanes.values()]:
+                        future.result()
+
+            if job.cancelled:
+                self._cancel_outbox(app, job)
+            job._finish(JOB_CANCELLED if job.cancelled else JOB_COMPLETED)
+            logger.info(
+                f"批量任务结束: {job.id} 状态={job.status} 成功 {job.success_count} 封，失败 {job.failed_count} 封"
+            )
+        except Exception as e:
+            logger.exception(f"批量任务执行出错: {job.id} - {e}")
+            job._finish(JOB_FAILED, str(e))
+
+    def _cancel_outbox(self, app, job: BatchJob):
+        """任务取消后，发件箱中未发送的邮件标记为已取消，不再被恢复或认领"""
+        try:
+            with app.app_context():
+                self.outbox.cancel_job(job.id)
+        except Exception as e:
+            logger.error(f"取消发件箱邮件失败: {job.id} - {e}")
+
+    def _run_lane(self, app, job: BatchJob, messages: List[Dict]):
+        """
+        发送同一发件人的邮件（独立的连接与限速）。
+        每封邮件先预订发件人配额并等待发送节奏，到点后才按收件域名轮转选出邮件并占用域名名额，
+        限速等待期间不占用域名名额；选取时跳过暂时受域名并发/间隔限制的域名；
+        临时错误的邮件按退避时间放入重试堆，期间继续发送后续邮件，到期后再插队重试。
+        同一发件人最多同时使用 sender_connections 个SMTP连接，各连接线程共享待发送队列、重试堆与配额
+        """
+        with app.app_context():
+            # 同一通道内附件相同的邮件共用预构建邮件
+            prepared_messages: Dict[tuple, PreparedMessage] = {}
+            # 同一通道的邮件使用同一发件人
+            sender_config = messages[0]['sender_config']
+            # 通道级节奏：send_interval 按两次发送的开始时间计算，已花在发送上的时间不再重复等待
+            lane = _Lane(messages, self.send_pacer.job_key(job.id, sender_config['email']))
+            # 大批量时由渲染进程按待发送队列的取出顺序提前生成个性化部分，与网络发送重叠进行
+            lane.renderer = self.render_pool.render_ahead(
+                lane.pending,
+                lambda m: self._prepared_for(m, prepared_messages).skeleton,
+                lane.condition
+            )
+            connections = max(1, min(self.sender_connections, len(messages)))
+            if connections == 1:
+                self._run_lane_connection(app, job, lane, prepared_messages)
+            else:
+                with ThreadPoolExecutor(max_workers=connections, thread_name_prefix='lane-conn') as pool:
+                    # 任一连接线程抛出的异常在此处重新抛出
+                    futures = [
+                        pool.submit(self._run_lane_connection, app, job, lane, prepared_messages)
+                        for _ in range(connections)
+                    ]
+                    for future in futures:
+                        future.result()
+
+            if lane.renderer is not None:
+                lane.renderer.close()
+            # 取消时仍在等待重试的邮件记为失败，保留最后一次错误
+            for _, _, message, _, last_error in lane.retries:
+                job.note_retry(-1)
+                self._record_result(job, message, False, last_error)
+
+    def _run_lane_connection(self, app, job: BatchJob, lane: '_Lane', prepared_messages: Dict):
+        """通道中的一个连接线程：循环预订配额、取出邮件并发送，直到通道中没有邮件（或任务取消）"""
+        sender_config = lane.sender_config
+        with app.app_context():
+            # 已预订配额的下一次发送：开始时刻（time.monotonic）与记录了限速等待的耗时；None 表示尚未预订
+            start_at = None
+            timings = None
+            try:
+                while True:
+                    job.wait_if_paused()
+                    if job.cancelled:
+                        break
+                    with lane.condition:
+                        if lane.finished:
+                            break
+                        quota_wait = lane.quota_wait()
+                    if quota_wait is None:
+                        job.note_quota_wait(sender_config['email'], None)
+                    elif quota_wait > 0:
+                        # 可被暂停或取消打断；醒来后重新检查暂停与取消
+                        job.sleep(quota_wait)
+                        continue
+                    blocked = self.email_service.check_circuit(sender_config)
+                    if blocked is not None:
+                        # 发件通道熔断中：不连接服务器，也不占用限速配额、发送间隔与域名名额
+                        with lane.condition:
+                            message, attempts, last_error, wait = self._next_lane_message(
+                                lane.pending, lane.retries, acquire_domain=False
+                            )
+                            if message is None:
+                                lane.condition.wait(min(wait, 1.0))
+                                continue
+                            lane.in_flight += 1
+                        if last_error is not None:
+                            job.note_retry(-1)
+                        attempts += 1
+                        error = self._handle_send_error(job, message, blocked, attempts)
+                    else:
+                        if start_at is None:
+                            with lane.condition:
+                                wait = lane.reserve_wait()
+                                if wait > 0:
+                                    # 没有尚未预订配额的可发送邮件（只剩未到期的重试，或都已由其他连接预订）：
+                                    # 等待重试到期或其他连接发送结束（最长1秒，以便响应暂停与取消）
+                                    lane.condition.wait(min(wait, 1.0))
+                                    continue
+                                lane.reserved += 1
+                            try:
+                                wait = self._reserve_send_slot(sender_config)
+                            except DailyQuotaExceeded as e:
+                                # 额度用尽不是发送失败：邮件留在队列中，通道暂停到额度重置后继续发送
+                                logger.warning(
+                                    f"发件人今日额度已用尽，暂停发送 {e.reset_in:.0f} 秒: {sender_config['email']}"
+                                )
+                                with lane.condition:
+                                    lane.reserved -= 1
+                                    lane.quota_resume_at = time.monotonic() + e.reset_in
+                                job.note_quota_wait(sender_config['email'], e.reset_in)
+                                continue
+                            except Exception:
+                                with lane.condition:
+                                    lane.reserved -= 1
+                                raise
+                            now = time.time()
+                            start = self.send_pacer.reserve(lane.pacing_key, job.send_interval, now + wait)
+                            timings = SendTimings()
+                            timings.add(PHASE_RATE_WAIT, wait)
+                            timings.add(PHASE_PACING_WAIT, start - now - wait)
+                            start_at = time.monotonic() + (start - now)
+                        remaining = start_at - time.monotonic()
+                        if remaining > 0:
+                            # 可被暂停或取消打断；醒来后重新检查暂停与取消，已预订的配额留给下一封邮件
+                            job.sleep(remaining)
+                            continue
+                        # 到点后再选出邮件并占用其收件域名名额，名额只在实际投递期间占用
+                        with lane.condition:
+                            message, attempts, last_error, wait = self._next_lane_message(lane.pending, lane.retries)
+                            if message is None:
+                                lane.condition.wait(min(wait, 1.0))
+                                continue
+                            lane.reserved -= 1
+                            lane.in_flight += 1
+                        if last_error is not None:
+                            job.note_retry(-1)
+                        send_timings, start_at, timings = timings, None, None
+                        attempts += 1
+                        try:
+                            error = self._send_one(
+                                job, message, prepared_messages, attempts, send_timings, lane.renderer
+                            )
+                        finally:
+                            self.domain_throttle.release(recipient_domain(message['recipient_email']))
+                    if lane.renderer is not None:
+                        # 未经渲染结果发送就已处理的邮件（熔断、构建失败）释放预取窗口中的位置
+                        lane.renderer.discard(message)
+                    if error is not None:
+                        delay = self.retry_policy.next_delay(attempts)
+                        if isinstance(error, CircuitOpenError):
+                            # 熔断期间不早于下一次探测时间重试
+                            delay = max(delay, error.retry_after)
+                        logger.info(
+                            f"邮件将在 {delay:.0f} 秒后重试（第 {attempts} 次失败）: "
+                            f"{message['recipient_email']} - {error}"
+                        )
+                        job.note_retry(1)
+                        self.outbox.schedule_retry(message.get('outbox_id'), attempts, delay, str(error))
+                    with lane.condition:
+                        if error is not None:
+                            heapq.heappush(
+                                lane.retries,
+                                (time.monotonic() + delay, next(lane.sequence), message, attempts, str(error))
+                            )
+                        lane.in_flight -= 1
+                        lane.condition.notify_all()
+            finally:
+                with lane.condition:
+                    if start_at is not None:
+                        lane.reserved -= 1
+                    lane.condition.notify_all()
+
+    def _next_lane_message(self, pending: DomainQueue, retries: List, acquire_domain: bool = True):
+        """
+        选出下一封要发送的邮件并占用其收件域名名额：到期的重试优先，其次按域名轮转取新邮件。
+        acquire_domain 为False时（邮件不会实际发送）不检查也不占用域名名额
+
+        Returns:
+            (邮件, 已尝试次数, 上次错误, 0) 或无可发送邮件时 (None, 0, None, 建议等待秒数)
+        """
+        now = time.monotonic()
+        wait = math.inf
+        if retries:
+            due, _, message, attempts, last_error = retries[0]
+            if due <= now:
+                domain_wait = 0.0
+                if acquire_domain:
+                    domain_wait = self.domain_throttle.try_acquire(recipient_domain(message['recipient_email']))
+                if domain_wait == 0:
+                    heapq.heappop(retries)
+                    return message, attempts, last_error, 0.0
+                wait = domain_wait
+            else:
+                wait = due - now
+        if pending and not acquire_domain:
+            message = pending.pop()
+            return message, message.get('attempts', 0), None, 0.0
+        if pending:
+            message, domain_wait = pending.pop_ready(self.domain_throttle)
+            if message is not None:
+                return message, message.get('attempts', 0), None, 0.0
+            wait = min(wait, domain_wait)
+        return None, 0, None, wait
+
+    def _reserve_send_slot(self, sender_config: Dict) -> float:
+        """向发件人令牌桶预订配额，返回需要等待的秒数"""
+        return self.rate_limiter.reserve(
+            self.email_service.get_rate_limit_key(sender_config),
+            self.email_service.get_rate_limits(sender_config)
+        )
+
+    def _send_one(self, job: BatchJob, message: Dict,
+                  prepared_messages: Optional[Dict[tuple, PreparedMessage]] = None,
+                  attempts: int = 1,
+                  timings: Optional[SendTimings] = None,
+                  renderer: Optional[RenderAhead] = None) -> Optional[SMTPSendError]:
+        """
+        发送单封邮件并写入发送记录，各阶段耗时计入任务的耗时直方图
+
+        Returns:
+            Optional[SMTPSendError]: 需要稍后重试时返回本次的临时错误，否则返回None（结果已记录）
+        """
+        if prepared_messages is None:
+            prepared_messages = {}
+        timings = timings or SendTimings()
+        try:
+            prepared = self._prepared_for(message, prepared_messages, timings)
+            head = None
+            if renderer is not None:
+                # 等待渲染进程的结果，计入 render 阶段
+                with timings.measure(PHASE_RENDER):
+                    head = renderer.head(message)
+            self.email_service.deliver_prepared(
+                prepared,
+                message['sender_config'],
+                recipient_email=message['recipient_email'],
+                recipient_name=message['recipient_name'],
+                subject=message['subject'],
+                content=message['content'],
+                timings=timings,
+                head=head
+            )
+        except SMTPSendError as e:
+            return self._handle_send_error(job, message, e, attempts)
+        except Exception as e:
+            logger.error(f"批量任务发送出错: {message['recipient_email']} - {e}")
+            self._record_result(job, message, False, f"邮件发送失败: {e}")
+            return None
+        finally:
+            job.timings.observe(timings)
+
+        self._record_result(job, message, True, None)
+        logger.info(f"批量任务邮件发送成功: {message['recipient_name']} <{message['recipient_email']}>")
+        return None
+
+    def _prepared_for(self, message: Dict, prepared_messages: Dict[tuple, PreparedMessage],
+                      timings: Optional[SendTimings] = None) -> PreparedMessage:
+        """取得邮件对应的预构建邮件（同一通道内附件相同的邮件共用）"""
+        content_type = message.get('content_type', 'html')
+        prepared_key = self.email_service.prepared_message_key(message.get('attachments'), content_type)
+        prepared = prepared_messages.get(prepared_key)
+        if prepared is None:
+            with (timings or SendTimings()).measure(PHASE_PREPARE):
+                prepared = self.email_service.prepare_message(
+                    message['sender_config'], message.get('attachments'), content_type=content_type
+                )
+            prepared_messages[prepared_key] = prepared
+        return prepared
+
+    def _handle_send_error(self, job: BatchJob, message: Dict, error: SMTPSendError,
+                           attempts: int) -> Optional[SMTPSendError]:
+        """可重试的错误原样返回，否则记为失败并返回None"""
+        if self.retry_policy.should_retry(error, attempts):
+            return error
+        text = str(error) if attempts <= 1 else f"{error}（共尝试 {attempts} 次）"
+        self._record_result(job, message, False, text, smtp_code=error.code)
+        return None
+
+    def _record_result(self, job: BatchJob, message: Dict, success: bool, error: Optional[str],
+                       smtp_code: Optional[int] = None):
+        """写入发送记录（同时标记发件箱中的邮件已完成）并更新任务统计"""
+        self.outbox.record_delivery(message, success, error, self.worker_id)
+
+        job.record_result(success, None if success else {
+            'professor_id': message['professor_id'],
+            'professor_name': message['recipient_name'],
+            'email': message['recipient_email'],
+            'sender_email': message['sender_config']['email'],
+            'error': error,
+            'smtp_code': smtp_code
+        }, sender_email=message['sender_config']['email'])
+
+
+def _timestamp(utc_naive: datetime) -> float:
+    """数据库中的UTC时间（naive）转为时间戳"""
+    return utc_naive.replace(tzinfo=timezone.utc).timestamp()
+
+
+class _Lane:
+    """
+    一个发件通道（同一发件人）的共享状态，由该通道的各连接线程在 condition 保护下读写；
+    邮件放回重试堆、连接发送结束时通知其他连接线程
+    """
+
+    def __init__(self, messages: List[Dict], pacing_key: str):
+        self.sender_config = messages[0]['sender_config']
+        self.pacing_key = pacing_key
+        self.pending = DomainQueue(messages)
+        # 重试堆：(到期时间, 序号, 邮件, 已尝试次数, 上次错误)
+        self.retries = []
+        self.sequence = itertools.count()
+        self.renderer: Optional[RenderAhead] = None
+        # 当日额度用尽时，整个通道暂停到该时刻（time.monotonic）
+        self.quota_resume_at = 0.0
+        # 已预订配额、尚未取出邮件的连接数
+        self.reserved = 0
+        # 正在发送的邮件数（发送失败的邮件之后可能放回重试堆）
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return not self.pending and not self.retries and self.in_flight == 0
+
+    def quota_wait(self) -> Optional[float]:
+        """额度重置前还需等待的秒数；未暂停时返回0，刚到重置时间时返回None（调用方清除额度等待状态）"""
+        if not self.quota_resume_at:
+            return 0.0
+        remaining = self.quota_resume_at - time.monotonic()
+        if remaining > 0:
+            return remaining
+        self.quota_resume_at = 0.0
+        return None
+
+    def reserve_wait(self) -> float:
+        """
+        还有尚未被其他连接预订配额的可发送邮件（新邮件或已到期的重试）时返回0，
+        否则返回建议等待的秒数，避免预订了配额却无邮件可发
+        """
+        now = time.monotonic()
+        due = sum(1 for entry in self.retries if entry[0] <= now)
+        if self.reserved < len(self.pending) + due:
+            return 0.0
+        waiting = [entry[0] - now for entry in self.retries if entry[0] > now]
+        return min(waiting) if waiting else math.inf
+
+
+# 进程级任务管理器
+batch_job_manager = BatchJobManager(max_workers=Config.BATCH_JOB_WORKERS)
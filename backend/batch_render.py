@@ -0,0 +1,116 @@
+"""
+列式批量渲染
+批量发送与预览不再逐个教授读取ORM对象、组装字典再渲染：教授信息按列一次查出
+（只取渲染需要的字段），主题与正文模板按列一次生成全部结果。
+收件人很多时按分片交给渲染进程池并行生成，分片结果按原顺序拼接
+"""
+
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from backend.config import Config
+from backend.database import db, Professor
+from backend.render_pool import RenderPool, render_pool as default_render_pool
+from backend.template_engine import Column, CompiledTemplate
+
+logger = logging.getLogger(__name__)
+
+# 渲染需要的教授字段（按列查询，不构造ORM对象）
+PROFESSOR_COLUMNS = (
+    Professor.id, Professor.name, Professor.email,
+    Professor.university, Professor.department, Professor.research_area
+)
+
+# SQLite 单条语句的参数数量有限，IN 查询分块执行
+_IN_CHUNK = 900
+
+
+def load_professors(professor_ids: Iterable) -> Dict[int, object]:
+    """
+    按ID批量查询教授（分块 IN 查询），返回 教授ID -> 行（可按属性访问 name、email 等字段）。
+    无法转换为整数的ID与不存在的教授不在结果中
+    """
+    ids = []
+    for professor_id in professor_ids:
+        try:
+            ids.append(int(professor_id))
+        except (TypeError, ValueError):
+            continue
+    ids = list(dict.fromkeys(ids))
+    rows = {}
+    for start in range(0, len(ids), _IN_CHUNK):
+        chunk = ids[start:start + _IN_CHUNK]
+        for row in db.session.query(*PROFESSOR_COLUMNS).filter(Professor.id.in_(chunk)):
+            rows[row.id] = row
+    return rows
+
+
+def load_departments(departments: Iterable[str]) -> Dict[str, List]:
+    """按院系批量查询教授，返回 院系 -> 行列表（按教授ID排序）"""
+    names = list(dict.fromkeys(departments))
+    grouped: Dict[str, List] = {name: [] for name in names}
+    for start in range(0, len(names), _IN_CHUNK):
+        chunk = names[start:start + _IN_CHUNK]
+        query = db.session.query(*PROFESSOR_COLUMNS).filter(Professor.department.in_(chunk))
+        for row in query.order_by(Professor.id):
+            grouped[row.department].append(row)
+    return grouped
+
+
+def render_batch(templates: Sequence[CompiledTemplate], columns: Dict[str, Column], count: int,
+                 pool: Optional[RenderPool] = None,
+                 shard_size: Optional[int] = None) -> List[List[str]]:
+    """
+    按列批量渲染多个模板（如主题与正文），返回与 templates 对应的结果列表
+
+    Args:
+        templates: 已编译的模板
+        columns: 字段名 -> 值列表或共用字符串，见 CompiledTemplate.render_columns
+        count: 收件人数
+        pool: 渲染进程池，None 使用进程级共享进程池；未启用时在当前线程渲染
+        shard_size: 每个分片的收件人数，None 使用 Config.RENDER_SHARD_SIZE；
+            收件人数不超过两个分片时不使用进程池（跨进程传输不划算）
+    """
+    pool = pool or default_render_pool
+    shard_size = max(1, int(shard_size or Config.RENDER_SHARD_SIZE))
+    if pool.enabled and count > shard_size * 2:
+        try:
+            return _render_sharded(pool, templates, columns, count, shard_size)
+        except (BrokenProcessPool, RuntimeError) as e:
+            logger.warning(f"渲染进程池不可用，改为在当前线程批量渲染: {e}")
+    return render_shard(templates, columns, count)
+
+
+def render_shard(templates: Sequence[CompiledTemplate], columns: Dict[str, Column],
+                 count: int) -> List[List[str]]:
+    """在当前进程中渲染（也是渲染进程执行的分片任务）"""
+    return [template.render_columns(columns, count) for template in templates]
+
+
+def _render_sharded(pool: RenderPool, templates: Sequence[CompiledTemplate], columns: Dict[str, Column],
+                    count: int, shard_size: int) -> List[List[str]]:
+    # 只传输模板用到的字段，共用字符串原样传给每个分片
+    needed = {field for template in templates for field in template.fields}
+    columns = {field: value for field, value in columns.items() if field in needed}
+    executor = pool.executor()
+    futures = []
+    try:
+        for start in range(0, count, shard_size):
+            end = min(start + shard_size, count)
+            shard_columns = {
+                field: value if isinstance(value, str) else value[start:end]
+                for field, value in columns.items()
+            }
+            futures.append(executor.submit(render_shard, templates, shard_columns, end - start))
+        results: List[List[str]] = [[] for _ in templates]
+        for future in futures:
+            for merged, part in zip(results, future.result()):
+                merged.extend(part)
+        return results
+    except BrokenProcessPool:
+        pool.reset(executor)
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
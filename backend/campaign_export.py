@@ -0,0 +1,226 @@
+"""
+批量邮件离线导出（仅渲染，不发送）
+使用与实际发送相同的 PreparedMessage 生成每位收件人的完整邮件字节，
+逐封写入 mbox 文件、Maildir 目录或 .eml 文件的 zip 包，用于发送前检查或归档。
+写入是流式的：同一时刻内存中只有一封邮件的个性化部分，附件字节由批次共享，不会连接SMTP服务器
+"""
+
+import os
+import re
+import time
+import uuid
+import socket
+import logging
+import zipfile
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional
+
+from backend.config import Config
+from backend.prepared_message import PreparedMessage
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('mbox', 'maildir', 'eml')
+
+# 渲染结果是SMTP线路格式（行首点号已转义），导出前还原为原始邮件内容
+_STUFFED_DOT = re.compile(rb'(?m)^\.\.')
+# mboxrd 格式：行首的 "From "（含已被引用的 ">From "）再加一个 ">"
+_MBOX_FROM = re.compile(rb'(?m)^(>*From )')
+
+
+def _unstuff(chunk: bytes) -> bytes:
+    """去掉DATA流中的行首点号转义（渲染产出的每一块都从行首开始）"""
+    return _STUFFED_DOT.sub(b'.', chunk)
+
+
+def _to_lf(chunk: bytes) -> bytes:
+    return _unstuff(chunk).replace(b'\r\n', b'\n')
+
+
+def _safe_name(text: str) -> str:
+    return re.sub(r'[^A-Za-z0-9._@-]+', '_', text or '')[:80] or 'message'
+
+
+class _ChunkMemo:
+    """
+    缓存块的格式转换结果。批次共享的附件字节是同一个对象，在每封邮件中重复出现，
+    按对象缓存后只转换一次；持有原对象引用，保证 id 不会被复用
+    """
+
+    MIN_SIZE = 4096
+
+    def __init__(self, transform: Callable[[bytes], bytes], max_entries: int = 64):
+        self._transform = transform
+        self._max_entries = max_entries
+        self._entries: 'OrderedDict[int, tuple]' = OrderedDict()
+
+    def __call__(self, chunk: bytes) -> bytes:
+        if len(chunk) < self.MIN_SIZE:
+            return self._transform(chunk)
+        entry = self._entries.get(id(chunk))
+        if entry is not None and entry[0] is chunk:
+            self._entries.move_to_end(id(chunk))
+            return entry[1]
+        result = self._transform(chunk)
+        self._entries[id(chunk)] = (chunk, result)
+        if len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        return result
+
+
+class _MboxWriter:
+    """mboxrd 格式：每封邮件前加 "From 发件人 时间" 分隔行，LF换行"""
+
+    extension = '.mbox'
+
+    @staticmethod
+    def transform(chunk: bytes) -> bytes:
+        return _MBOX_FROM.sub(rb'>\1', _to_lf(chunk))
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'wb')
+
+    def add(self, index: int, message: Dict, chunks: Iterable[bytes]):
+        """chunks 为已经过 transform 的邮件内容块"""
+        sender = message['sender_config']['email']
+        self._file.write(f"From {sender} {time.asctime(time.gmtime())}\n".encode('ascii'))
+        for chunk in chunks:
+            self._file.write(chunk)
+        # 邮件之间以空行分隔
+        self._file.write(b'\n')
+
+    def close(self):
+        self._file.close()
+
+
+class _MaildirWriter:
+    """Maildir 目录：先写入 tmp/，写完后改名到 new/，其它程序不会读到写了一半的邮件"""
+
+    extension = ''
+    transform = staticmethod(_to_lf)
+
+    def __init__(self, path: str):
+        self.path = path
+        for sub in ('tmp', 'new', 'cur'):
+            os.makedirs(os.path.join(path, sub), exist_ok=True)
+        self._hostname = socket.gethostname().replace('/', r'\057').replace(':', r'\072')
+
+    def add(self, index: int, message: Dict, chunks: Iterable[bytes]):
+        name = f"{int(time.time())}.M{uuid.uuid4().hex}P{os.getpid()}Q{index}.{self._hostname}"
+        tmp_path = os.path.join(self.path, 'tmp', name)
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, os.path.join(self.path, 'new', name))
+
+    def close(self):
+        pass
+
+
+class _EmlZipWriter:
+    """zip 包，每封邮件一个 .eml 文件，保留SMTP发送时的CRLF换行"""
+
+    extension = '.zip'
+    transform = staticmethod(_unstuff)
+
+    def __init__(self, path: str):
+        self.path = path
+        # 压缩是导出 .eml 的主要耗时，使用最快的压缩级别
+        self._zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+
+    def add(self, index: int, message: Dict, chunks: Iterable[bytes]):
+        name = f"{index + 1:06d}_{_safe_name(message['recipient_email'])}.eml"
+        with self._zip.open(name, 'w', force_zip64=True) as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+    def close(self):
+        self._zip.close()
+
+
+_WRITERS = {
+    'mbox': _MboxWriter,
+    'maildir': _MaildirWriter,
+    'eml': _EmlZipWriter,
+}
+
+
+class CampaignExporter:
+    """把批量发送接口组装好的邮件列表导出为文件，不经过发件箱与SMTP"""
+
+    def __init__(self, email_service, export_dir: Optional[str] = None):
+        self.email_service = email_service
+        self.export_dir = export_dir or Config.EXPORT_FOLDER
+
+    def export(self, messages: Iterable[Dict], export_format: str, name_prefix: str = 'campaign') -> Dict:
+        """
+        逐封渲染并写入导出文件
+
+        Args:
+            messages: 与 BatchJob 相同结构的邮件（可以是逐封生成的迭代器，导出时不会整体保存在内存中）
+            export_format: 'mbox'、'maildir' 或 'eml'（zip包）
+            name_prefix: 导出文件名前缀
+
+        Returns:
+            Dict: 导出结果（导出目录中的文件名、成功与失败数量；不含服务器上的绝对路径）
+        """
+        if export_format not in _WRITERS:
+            raise ValueError(f"不支持的导出格式: {export_format}")
+        os.makedirs(self.export_dir, exist_ok=True)
+        writer_cls = _WRITERS[export_format]
+        name = f"{_safe_name(name_prefix)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        filename = name + writer_cls.extension
+        writer = writer_cls(os.path.join(self.export_dir, filename))
+        convert = _ChunkMemo(writer_cls.transform)
+
+        # 同一发件人、同一附件组合的邮件共用预构建邮件
+        prepared_messages: Dict[tuple, PreparedMessage] = {}
+        exported = 0
+        failed_emails = []
+        start = time.perf_counter()
+        try:
+            for index, message in enumerate(messages):
+                try:
+                    content_type = message.get('content_type', 'html')
+                    key = (
+                        message['sender_config']['email'],
+                        self.email_service.prepared_message_key(message.get('attachments'), content_type)
+                    )
+                    prepared = prepared_messages.get(key)
+                    if prepared is None:
+                        prepared = prepared_messages[key] = self.email_service.prepare_message(
+                            message['sender_config'], message.get('attachments'), content_type=content_type
+                        )
+                    chunks = prepared.render(
+                        message['recipient_email'], message['recipient_name'],
+                        message['subject'], message['content']
+                    )
+                    writer.add(index, message, (convert(chunk) for chunk in chunks))
+                    exported += 1
+                except Exception as e:
+                    logger.error(f"导出邮件失败: {message.get('recipient_email')} - {e!r}")
+                    failed_emails.append({
+                        'professor_id': message.get('professor_id'),
+                        'professor_name': message.get('recipient_name'),
+                        'email': message.get('recipient_email'),
+                        'error': str(e)
+                    })
+        finally:
+            writer.close()
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"邮件导出完成: {filename}，成功 {exported} 封，失败 {len(failed_emails)} 封，耗时 {elapsed:.2f}s")
+        return {
+            'format': export_format,
+            'filename': filename,
+            'exported': exported,
+            'failed': len(failed_emails),
+            'failed_emails': failed_emails,
+            'elapsed_seconds': round(elapsed, 3)
+        }
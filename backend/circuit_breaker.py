@@ -0,0 +1,205 @@
+"""
+发件通道熔断器
+按 (SMTP服务器, 发件邮箱) 统计连续的连接/认证失败，达到阈值后熔断：
+熔断期间的邮件不再连接服务器，直接快速失败（认证失败）或按剩余熔断时间延后重试（连接失败）；
+熔断到期后放行一封邮件作为探测（半开），成功则恢复，失败则重新熔断
+"""
+
+import smtplib
+import threading
+import time
+import logging
+from typing import Dict, Hashable, Optional
+
+from backend.config import Config
+from backend.smtp_errors import SMTPSendError, classify_smtp_error
+from backend.smtp_pool import _credential_fingerprint
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+# 说明发件通道本身不可用（而不是某封邮件或某个收件人有问题）的错误
+_CHANNEL_SMTP_ERRORS = (
+    smtplib.SMTPAuthenticationError,
+    smtplib.SMTPConnectError,
+    smtplib.SMTPHeloError,
+    smtplib.SMTPNotSupportedError,
+    smtplib.SMTPServerDisconnected,
+)
+
+
+def is_channel_failure(error: Exception) -> bool:
+    """是否为连接或认证失败（计入熔断）；收件人被拒、内容被拒等说明通道正常"""
+    if isinstance(error, _CHANNEL_SMTP_ERRORS):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    # 超时、连接被拒、DNS解析失败等网络错误
+    return isinstance(error, OSError)
+
+
+class CircuitOpenError(SMTPSendError):
+    """发件通道熔断中，邮件未实际发送"""
+
+    def __init__(self, message: str, code: Optional[int] = None, temporary: bool = False,
+                 retry_after: float = 0.0):
+        self.retry_after = retry_after
+        super().__init__(message, code, temporary)
+
+
+class _Circuit:
+    def __init__(self, credential: Optional[str]):
+        self.credential = credential
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.probe_started: Optional[float] = None
+        self.last_error: Optional[SMTPSendError] = None
+
+
+class CircuitBreaker:
+    """按发件通道熔断（线程安全）"""
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60.0):
+        """
+        Args:
+            failure_threshold: 连续多少次连接/认证失败后熔断
+            reset_timeout: 熔断持续时间（秒），到期后放行一封邮件探测
+        """
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = max(0.0, float(reset_timeout))
+        self._circuits: Dict[Hashable, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    def check(self, key: Hashable, password: Optional[str] = None) -> Optional[CircuitOpenError]:
+        """
+        查询通道是否熔断（不占用探测名额），用于在限速等待之前跳过注定失败的邮件
+
+        Returns:
+            Optional[CircuitOpenError]: 熔断中返回对应错误，否则返回None
+        """
+        with self._lock:
+            circuit = self._circuit_locked(key, password)
+            if circuit is None or self._probe_allowed_locked(circuit, time.monotonic()):
+                return None
+            return self._open_error_locked(key, circuit)
+
+    def acquire(self, key: Hashable, password: Optional[str] = None):
+        """
+        发送前调用：通道正常时直接返回；熔断到期时占用探测名额（半开）；仍在熔断中时抛出错误
+
+        Raises:
+            CircuitOpenError: 通道熔断中
+        """
+        with self._lock:
+            circuit = self._circuit_locked(key, password)
+            if circuit is None:
+                return
+            now = time.monotonic()
+            if not self._probe_allowed_locked(circuit, now):
+                raise self._open_error_locked(key, circuit)
+            circuit.state = CIRCUIT_HALF_OPEN
+            circuit.probe_started = now
+        logger.info(f"发件通道熔断到期，放行探测邮件: {key}")
+
+    def record_result(self, key: Hashable, error: Optional[Exception] = None, password: Optional[str] = None):
+        """
+        发送结束后调用
+
+        Args:
+            error: 发送抛出的原始异常，成功时为None；只有连接/认证失败计入熔断
+        """
+        if error is not None and is_channel_failure(error):
+            self._record_failure(key, classify_smtp_error(error), password)
+            return
+        with self._lock:
+            circuit = self._circuits.pop(key, None)
+        if circuit is not None and circuit.state != CIRCUIT_CLOSED:
+            logger.info(f"发件通道已恢复: {key}")
+
+    def reset(self, key: Hashable):
+        with self._lock:
+            self._circuits.pop(key, None)
+
+    def state(self, key: Hashable) -> str:
+        with self._lock:
+            circuit = self._circuits.get(key)
+            return circuit.state if circuit else CIRCUIT_CLOSED
+
+    def stats(self) -> Dict[str, Dict]:
+        """非正常状态的通道"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                str(key): {
+                    'state': circuit.state,
+                    'failures': circuit.failures,
+                    'retry_after': round(max(0.0, circuit.open_until - now), 1),
+                    'last_error': str(circuit.last_error) if circuit.last_error else None
+                }
+                for key, circuit in self._circuits.items()
+            }
+
+    def _record_failure(self, key: Hashable, error: SMTPSendError, password: Optional[str]):
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None:
+                circuit = self._circuits[key] = _Circuit(self._fingerprint(password))
+            circuit.failures += 1
+            circuit.last_error = error
+            circuit.probe_started = None
+            if circuit.state == CIRCUIT_CLOSED and circuit.failures < self.failure_threshold:
+                return
+            reopened = circuit.state == CIRCUIT_HALF_OPEN
+            circuit.state = CIRCUIT_OPEN
+            circuit.open_until = time.monotonic() + self.reset_timeout
+            failures = circuit.failures
+        if reopened:
+            logger.warning(f"发件通道探测失败，继续熔断 {self.reset_timeout:.0f} 秒: {key} - {error}")
+        else:
+            logger.warning(
+                f"发件通道连续 {failures} 次连接/认证失败，熔断 {self.reset_timeout:.0f} 秒: {key} - {error}"
+            )
+
+    def _circuit_locked(self, key: Hashable, password: Optional[str]) -> Optional[_Circuit]:
+        """取得非正常状态的通道；发件凭据已更换（如更新了授权码）时清除熔断状态"""
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            return None
+        if password is not None and circuit.credential not in (None, self._fingerprint(password)):
+            del self._circuits[key]
+            return None
+        if circuit.state == CIRCUIT_CLOSED:
+            return None
+        return circuit
+
+    def _probe_allowed_locked(self, circuit: _Circuit, now: float) -> bool:
+        if now < circuit.open_until:
+            return False
+        # 同一时刻只放行一封探测邮件；探测超过一个熔断周期仍未返回时允许重新探测
+        return circuit.probe_started is None or now - circuit.probe_started > self.reset_timeout
+
+    def _open_error_locked(self, key: Hashable, circuit: _Circuit) -> CircuitOpenError:
+        last_error = circuit.last_error
+        retry_after = max(circuit.open_until - time.monotonic(), 0.0)
+        if retry_after == 0:
+            # 探测邮件仍在发送中，等待其结果
+            retry_after = min(self.reset_timeout, 5.0)
+        return CircuitOpenError(
+            f"发件通道已熔断（连续 {circuit.failures} 次连接/认证失败，约 {retry_after:.0f} 秒后恢复探测）: "
+            f"{last_error.message if last_error else ''}",
+            code=last_error.code if last_error else None,
+            temporary=last_error.temporary if last_error else True,
+            retry_after=retry_after
+        )
+
+    @staticmethod
+    def _fingerprint(password: Optional[str]) -> Optional[str]:
+        return None if password is None else _credential_fingerprint(password)
+
+
+# 进程级熔断器，所有 EmailService 实例共享
+circuit_breaker = CircuitBreaker(Config.CIRCUIT_FAILURE_THRESHOLD, Config.CIRCUIT_RESET_TIMEOUT)
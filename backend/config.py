@@ -26,9 +26,57 @@ class Config:
     MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'false').lower() in ['true', 'on', '1']
     MAIL_USE_SSL = os.environ.get('MAIL_USE_SSL', 'false').lower() in ['true', 'on', '1']
     
+    # 批量发送任务配置
+    BATCH_JOB_WORKERS = int(os.environ.get('BATCH_JOB_WORKERS') or 2)
+    # 批量任务中同一发件人同时使用的SMTP连接数（各连接共享该发件人的限速配额与发送间隔）
+    SENDER_CONNECTIONS = int(os.environ.get('SENDER_CONNECTIONS') or 1)
+    # 临时错误（4xx、连接断开、超时）的重试：最多尝试次数与指数退避的基础/最大等待（秒）
+    SEND_RETRY_MAX_ATTEMPTS = int(os.environ.get('SEND_RETRY_MAX_ATTEMPTS') or 4)
+    SEND_RETRY_BASE_DELAY = float(os.environ.get('SEND_RETRY_BASE_DELAY') or 30)
+    SEND_RETRY_MAX_DELAY = float(os.environ.get('SEND_RETRY_MAX_DELAY') or 900)
+    # 发件通道熔断：同一 (SMTP服务器, 发件邮箱) 连续多少次连接/认证失败后熔断，以及熔断持续时间（秒）
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD') or 3)
+    CIRCUIT_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_RESET_TIMEOUT') or 60)
+    # 发件凭据验证成功后的缓存时长（秒，0 表示每次都重新登录验证）；提交批量任务时是否提前建立并认证发件人的SMTP连接
+    CREDENTIAL_CACHE_TTL = float(os.environ.get('CREDENTIAL_CACHE_TTL') or 600)
+    SMTP_PREWARM = os.environ.get('SMTP_PREWARM', 'true').lower() in ['true', 'on', '1']
+    # 持久化发件箱：认领租约时长（秒）；为true时Web进程只写入发件箱，由独立的发送进程
+    # （python -m backend.outbox_worker）认领发送；Web进程启动时是否接管租约过期的遗留邮件
+    OUTBOX_LEASE_SECONDS = float(os.environ.get('OUTBOX_LEASE_SECONDS') or 300)
+    OUTBOX_EXTERNAL_WORKERS = os.environ.get('OUTBOX_EXTERNAL_WORKERS', 'false').lower() in ['true', 'on', '1']
+    OUTBOX_RECOVER_ON_STARTUP = os.environ.get('OUTBOX_RECOVER_ON_STARTUP', 'true').lower() in ['true', 'on', '1']
+    
+    # 收件域名节流：同一域名同时在途的邮件数、两次投递的最小间隔（秒），
+    # DOMAIN_LIMITS 为按域名覆盖的JSON，如 {"tsinghua.edu.cn": {"concurrency": 1, "min_interval": 5}}
+    DOMAIN_MAX_CONCURRENCY = int(os.environ.get('DOMAIN_MAX_CONCURRENCY') or 2)
+    DOMAIN_MIN_INTERVAL = float(os.environ.get('DOMAIN_MIN_INTERVAL') or 1.0)
+    DOMAIN_LIMITS = json.loads(os.environ.get('DOMAIN_LIMITS') or '{}')
+    
+    # 多进程渲染个性化邮件头与正文：进程数（默认 0，即在发送线程中渲染；多核主机上的大批量任务可按核数开启）、
+    # 启用所需的最少邮件数（单个发件通道）、每个通道最多提前渲染的邮件数
+    RENDER_PROCESSES = int(os.environ.get('RENDER_PROCESSES') or 0)
+    RENDER_MIN_BATCH = int(os.environ.get('RENDER_MIN_BATCH') or 50)
+    RENDER_WINDOW = int(os.environ.get('RENDER_WINDOW') or 64)
+    # 按列批量渲染主题与正文时每个分片的收件人数（超过两个分片才交给渲染进程池）
+    RENDER_SHARD_SIZE = int(os.environ.get('RENDER_SHARD_SIZE') or 20000)
+
+    # 附件编码缓存的内存预算（字节）
+    ATTACHMENT_CACHE_BYTES = int(os.environ.get('ATTACHMENT_CACHE_BYTES') or 64 * 1024 * 1024)
+    # 超过该大小（字节）的附件不进入缓存，发送时从磁盘分块编码后直接写入SMTP数据流
+    ATTACHMENT_STREAM_THRESHOLD = int(os.environ.get('ATTACHMENT_STREAM_THRESHOLD') or 1024 * 1024)
+    
     # 文件上传配置
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+    # /api/convert-document 上传的文档保留目录与保留时间（秒），期间可通过返回的下载地址取回原文件
+    CONVERTED_FOLDER = os.environ.get('CONVERTED_FOLDER') or os.path.join(UPLOAD_FOLDER, 'converted')
+    CONVERTED_DOCUMENT_TTL = int(os.environ.get('CONVERTED_DOCUMENT_TTL') or 3600)
+    # 文档转换结果缓存：内存预算（字符数）与磁盘缓存目录（设为空字符串则只使用内存）
+    CONVERSION_CACHE_BYTES = int(os.environ.get('CONVERSION_CACHE_BYTES') or 16 * 1024 * 1024)
+    CONVERSION_CACHE_DIR = os.environ.get('CONVERSION_CACHE_DIR', os.path.join(UPLOAD_FOLDER, '.conversion_cache'))
+    # 批量邮件离线导出（mbox/Maildir/.eml）目录，以及导出时每次渲染主题与正文的收件人数
+    EXPORT_FOLDER = os.environ.get('EXPORT_FOLDER') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'exports')
+    EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE') or 500)
     
     # 日志配置
     LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
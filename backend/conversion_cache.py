@@ -0,0 +1,181 @@
+"""
+文档转换缓存
+套磁信模板很少变化，但每次预览、发送都要用 python-docx 重新打开并转换整个 .docx。
+这里按 (文件路径, 大小, 修改时间, 输出格式, 转换器版本) 缓存转换结果，分两级：
+内存LRU（进程内）与磁盘（uploads 下的缓存目录，重启后仍可命中）。
+文件被替换或修改后大小/修改时间变化，自然不会命中旧结果
+"""
+
+import hashlib
+import os
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+# 缓存键：(绝对路径, 文件大小, 修改时间ns, 输出格式, 转换器版本)
+ConversionKey = Tuple[str, int, int, str, int]
+
+
+class ConversionCache:
+    """文档转换结果缓存（内存LRU + 磁盘，线程安全）"""
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, cache_dir: Optional[str] = None,
+                 max_disk_entries: int = 256):
+        """
+        Args:
+            max_bytes: 内存中缓存的转换结果总大小上限（按字符数计）
+            cache_dir: 磁盘缓存目录，None 表示只使用内存
+            max_disk_entries: 磁盘缓存最多保留的文件数，超出时删除最久未写入的
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self._entries: 'OrderedDict[ConversionKey, str]' = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        # 正在转换中的键，并发请求同一文档时等待首个请求完成，保证只转换一次
+        self._loading: Dict[ConversionKey, threading.Event] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(file_path: str, output_format: str, version: int = 0) -> ConversionKey:
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, output_format, version)
+
+    def get(self, file_path: str, output_format: str, convert: Callable[[], str], version: int = 0) -> str:
+        """
+        获取文档的转换结果，未命中时调用 convert() 转换并写入缓存
+
+        Args:
+            file_path: 文档路径
+            output_format: 输出格式（如 'html'、'text'）
+            convert: 转换函数，返回转换结果字符串
+            version: 转换器版本，转换逻辑变化时递增，使旧的磁盘缓存失效
+        """
+        key = self.make_key(file_path, output_format, version)
+        while True:
+            with self._lock:
+                content = self._entries.get(key)
+                if content is not None:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return content
+                loading = self._loading.get(key)
+                if loading is None:
+                    self._loading[key] = threading.Event()
+                    break
+            loading.wait()
+            # 首个请求转换失败或结果超出预算未入缓存时，自行处理
+            with self._lock:
+                cached = key in self._entries
+            if not cached:
+                return self._load(key, convert)
+
+        try:
+            content = self._load(key, convert)
+            self._put(key, content)
+            return content
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+    def _load(self, key: ConversionKey, convert: Callable[[], str]) -> str:
+        """依次尝试磁盘缓存与实际转换（在锁外执行）"""
+        content = self._read_disk(key)
+        if content is not None:
+            with self._lock:
+                self.disk_hits += 1
+            return content
+        with self._lock:
+            self.misses += 1
+        content = convert()
+        self._write_disk(key, content)
+        return content
+
+    def _put(self, key: ConversionKey, content: str):
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._current_bytes -= len(old)
+            self._entries[key] = content
+            self._current_bytes += len(content)
+            while self._current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._current_bytes -= len(evicted)
+
+    def _disk_path(self, key: ConversionKey) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.{key[3]}')
+
+    def _read_disk(self, key: ConversionKey) -> Optional[str]:
+        path = self._disk_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError as e:
+            logger.warning(f"读取文档转换缓存失败: {path} - {e}")
+            return None
+
+    def _write_disk(self, key: ConversionKey, content: str):
+        path = self._disk_path(key)
+        if path is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # 先写临时文件再替换，并发读取不会读到写了一半的内容
+            temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+            self._prune_disk()
+        except OSError as e:
+            logger.warning(f"写入文档转换缓存失败: {path} - {e}")
+
+    def _prune_disk(self):
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.is_file()]
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in entries[:len(entries) - self.max_disk_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def clear(self, disk: bool = False):
+        """清空内存缓存，disk 为 True 时同时删除磁盘缓存文件"""
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+        if disk and self.cache_dir and os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file():
+                    os.remove(entry.path)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._current_bytes,
+                'max_bytes': self.max_bytes,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses
+            }
+
+
+# 进程级文档转换缓存，见 Config.CONVERSION_CACHE_BYTES / CONVERSION_CACHE_DIR
+conversion_cache = ConversionCache(Config.CONVERSION_CACHE_BYTES, Config.CONVERSION_CACHE_DIR or None)
@@ -0,0 +1,57 @@
+"""
+发件凭据验证缓存
+验证发件配置需要完整的连接、TLS握手与登录（通常 1-3 秒）。验证成功的结果按
+(发件邮箱, SMTP服务器, 端口, 加密方式, 凭据指纹) 缓存一段时间，有效期内重复验证直接返回；
+授权码变更后指纹不同，自然不会命中旧结果
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from backend.config import Config
+
+# (发件邮箱, SMTP服务器, 端口, 加密方式, 凭据指纹)
+CredentialKey = Tuple[str, str, int, str, str]
+
+
+class CredentialCheckCache:
+    """最近验证成功的发件凭据（进程内，线程安全）"""
+
+    def __init__(self, ttl: float = 600):
+        """
+        Args:
+            ttl: 验证成功结果的有效期（秒），0 表示不缓存
+        """
+        self.ttl = ttl
+        self._verified: Dict[CredentialKey, float] = {}
+        self._lock = threading.Lock()
+
+    def is_valid(self, key: CredentialKey) -> bool:
+        """该凭据是否在有效期内验证成功过"""
+        with self._lock:
+            verified_at = self._verified.get(key)
+            if verified_at is None:
+                return False
+            if time.monotonic() - verified_at > self.ttl:
+                del self._verified[key]
+                return False
+            return True
+
+    def mark_valid(self, key: CredentialKey):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._verified[key] = time.monotonic()
+
+    def invalidate(self, key: Optional[CredentialKey] = None):
+        """清除某个凭据的验证结果，key为None时全部清除"""
+        with self._lock:
+            if key is None:
+                self._verified.clear()
+            else:
+                self._verified.pop(key, None)
+
+
+# 进程级验证缓存，有效期见 Config.CREDENTIAL_CACHE_TTL
+credential_cache = CredentialCheckCache(Config.CREDENTIAL_CACHE_TTL)
@@ -10,27 +10,37 @@ import re
 from docx import Document
 from docx.shared import Inches
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+from docx.table import Table
 from typing import Dict, List, Tuple, Optional
 import base64
 from io import BytesIO
+from backend.conversion_cache import ConversionCache, conversion_cache as default_conversion_cache
 from backend.database import db
 from backend.models.user_file import UserFile
 import logging
 
 logger = logging.getLogger(__name__)
 
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# 转换器版本：HTML/文本转换逻辑变化时递增，使旧的磁盘缓存失效
+CONVERTER_VERSION = 2
+
 class DocumentService:
     """文档转换服务类"""
     
-    def __init__(self):
+    def __init__(self, conversion_cache: Optional[ConversionCache] = None):
         self.supported_formats = ['.docx']
+        # 转换结果缓存：同一模板文档未修改时，重复预览、发送不再重新解析
+        self.conversion_cache = conversion_cache or default_conversion_cache
     
-    def docx_to_html(self, file_path: str) -> Dict[str, any]:
+    def docx_to_html(self, file_path: str, include_attachment_content: bool = False) -> Dict[str, any]:
         """
         将docx文件转换为HTML格式
         
         Args:
             file_path: docx文件路径
+            include_attachment_content: 是否在附件信息中附带base64内容（默认只返回元数据，不读取文件）
             
         Returns:
             包含HTML内容和附件信息的字典
@@ -48,8 +58,8 @@ class DocumentService:
             # 转换为HTML
             html_content = self._convert_document_to_html(doc)
             
-            # 提取图片和其他媒体文件
-            attachments = self._extract_attachments(doc, file_path)
+            # 附件信息（原始文件）
+            attachments = self._extract_attachments(file_path, include_attachment_content)
             
             return {
                 'html_content': html_content,
@@ -72,31 +82,17 @@ class DocumentService:
         """
         html_parts = []
         
-        # 按文档顺序处理所有元素
-        # 使用document的element属性来获取正确的顺序
-        try:
-            # 遍历文档的所有元素，保持原始顺序
-            for element in doc.element.body:
-                if element.tag.endswith('p'):  # 段落
-                    # 找到对应的段落对象
-                    for paragraph in doc.paragraphs:
-                        if paragraph._element == element:
-                            html_parts.append(self._convert_paragraph_to_html(paragraph))
-                            break
-                elif element.tag.endswith('tbl'):  # 表格
-                    # 找到对应的表格对象
-                    for table in doc.tables:
-                        if table._element == element:
-                            html_parts.append(self._convert_table_to_html(table))
-                            break
-        except Exception as e:
-            # 如果无法按顺序处理，回退到原来的方法
-            logger.warning(f"无法按文档顺序处理元素，使用备用方法: {e}")
-            for paragraph in doc.paragraphs:
-                html_parts.append(self._convert_paragraph_to_html(paragraph))
-            
-            for table in doc.tables:
-                html_parts.append(self._convert_table_to_html(table))
+        # 样式ID -> 样式名称：python-docx 每次读取 paragraph.style 都要在样式表中查找（未设置样式的段落会遍历全部样式），
+        # 同一文档内只解析一次
+        style_names: Dict[Optional[str], str] = {}
+        
+        # 单次遍历正文的直接子元素，按文档顺序直接包装为段落/表格对象
+        # （不再为每个元素在 doc.paragraphs / doc.tables 中查找，转换耗时与文档长度成线性关系）
+        for block in doc.iter_inner_content():
+            if isinstance(block, Table):
+                html_parts.append(self._convert_table_to_html(block))
+            else:
+                html_parts.append(self._convert_paragraph_to_html(block, style_names))
         
         # 将内容包装在样式容器中，确保邮件发送时保持一致的格式（移除边框等视觉包装）
         content = '\n'.join(html_parts)
@@ -104,12 +100,13 @@ class DocumentService:
         
         return wrapped_content
     
-    def _convert_paragraph_to_html(self, paragraph) -> str:
+    def _convert_paragraph_to_html(self, paragraph, style_names: Optional[Dict[Optional[str], str]] = None) -> str:
         """
         将段落转换为HTML
         
         Args:
             paragraph: docx段落对象
+            style_names: 样式ID到样式名称的缓存（同一文档内共用）
             
         Returns:
             HTML字符串
@@ -182,8 +179,15 @@ class DocumentService:
         html_text = self._convert_runs_to_html(paragraph.runs)
         
         # 判断是否为标题
-        if paragraph.style.name.startswith('Heading'):
-            level = paragraph.style.name.replace('Heading ', '')
+        if style_names is None:
+            style_name = paragraph.style.name
+        else:
+            style_id = paragraph._p.style
+            style_name = style_names.get(style_id)
+            if style_name is None:
+                style_name = style_names[style_id] = paragraph.style.name
+        if style_name.startswith('Heading'):
+            level = style_name.replace('Heading ', '')
             try:
                 level = int(level)
                 if 1 <= level <= 6:
@@ -307,10 +311,12 @@ class DocumentService:
             html_parts.append('<tr>')
             for cell in row.cells:
                 cell_text = ''
-                for paragraph in cell.paragraphs:
+                paragraphs = cell.paragraphs
+                for paragraph in paragraphs:
                     if paragraph.text.strip():  # 只处理非空段落
                         cell_text += self._convert_runs_to_html(paragraph.runs)
-                        if paragraph != cell.paragraphs[-1]:  # 不是最后一个段落时添加换行
+                        # 不是最后一个段落时添加换行（段落对象每次访问都会重新创建，按底层元素比较）
+                        if paragraph._p is not paragraphs[-1]._p:
                             cell_text += '<br>'
                 
                 # 表头和普通单元格的不同样式
@@ -341,13 +347,14 @@ class DocumentService:
         html_parts.append('</table>')
         return '\n'.join(html_parts)
     
-    def _extract_attachments(self, doc: Document, file_path: str) -> List[Dict[str, any]]:
+    def _extract_attachments(self, file_path: str, include_content: bool = False) -> List[Dict[str, any]]:
         """
-        提取文档中的附件（主要是图片）
+        提取文档的附件信息（目前为原始docx文件）
         
         Args:
-            doc: Document对象
             file_path: 原始文件路径
+            include_content: 是否读取文件并附带base64内容；默认只返回文件名、类型与大小，
+                需要内容时通过下载接口或 read_attachment 按需读取
             
         Returns:
             附件信息列表
@@ -356,21 +363,25 @@ class DocumentService:
         
         # 添加原始docx文件作为附件
         try:
-            with open(file_path, 'rb') as f:
-                file_content = f.read()
-                file_base64 = base64.b64encode(file_content).decode('utf-8')
-                
-                attachments.append({
-                    'filename': os.path.basename(file_path),
-                    'content': file_base64,
-                    'content_type': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                    'size': len(file_content)
-                })
+            attachment = {
+                'filename': os.path.basename(file_path),
+                'content_type': DOCX_CONTENT_TYPE,
+                'size': os.path.getsize(file_path)
+            }
+            if include_content:
+                attachment['content'] = self.read_attachment(file_path)
+            attachments.append(attachment)
         except Exception as e:
-            print(f"添加原始文件作为附件失败: {str(e)}")
+            logger.warning(f"添加原始文件作为附件失败: {str(e)}")
         
         return attachments
     
+    @staticmethod
+    def read_attachment(file_path: str) -> str:
+        """读取附件内容（base64编码）"""
+        with open(file_path, 'rb') as f:
+            return base64.b64encode(f.read()).decode('utf-8')
+    
     def validate_document(self, file_path: str) -> Dict[str, any]:
         """
         验证文档是否可以转换
@@ -452,6 +463,14 @@ class DocumentService:
         except Exception as e:
             return f"预览失败: {str(e)}"
     
+    def _convert_document_to_text(self, doc: Document) -> str:
+        """提取非空段落的纯文本（段落间空一行）"""
+        content_parts = []
+        for paragraph in doc.paragraphs:
+            if paragraph.text.strip():
+                content_parts.append(paragraph.text.strip())
+        return '\n\n'.join(content_parts)
+    
     def get_file_content(self, file_id: int, output_format: str = 'text') -> Tuple[Optional[str], Optional[str]]:
         """获取文件内容
         
@@ -475,21 +494,20 @@ class DocumentService:
             if file_ext in ['.docx']:
                 # 处理docx文件
                 try:
+                    file_path = user_file.file_path
                     if output_format == 'html':
                         # 转换为HTML格式
-                        result = self.docx_to_html(user_file.file_path)
-                        return result['html_content'], None
+                        content = self.conversion_cache.get(
+                            file_path, 'html', lambda: self._convert_document_to_html(Document(file_path)),
+                            CONVERTER_VERSION
+                        )
                     else:
                         # 返回纯文本格式
-                        doc = Document(user_file.file_path)
-                        content_parts = []
-                        
-                        for paragraph in doc.paragraphs:
-                            if paragraph.text.strip():
-                                content_parts.append(paragraph.text.strip())
-                        
-                        content = '\n\n'.join(content_parts)
-                        return content, None
+                        content = self.conversion_cache.get(
+                            file_path, 'text', lambda: self._convert_document_to_text(Document(file_path)),
+                            CONVERTER_VERSION
+                        )
+                    return content, None
                     
                 except Exception as e:
                     logger.error(f'读取docx文件失败: {str(e)}')
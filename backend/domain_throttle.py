@@ -0,0 +1,277 @@
+"""
+收件域名节流
+高校邮件服务器会对短时间内大量投递到同一域名的发件人做灰名单或限流。
+这里按收件人邮箱域名限制同时在途的邮件数与两次投递之间的最小间隔，
+批量任务在各域名之间轮转发送，整体吞吐不变而单个域名不会收到突发流量。
+在途名额与投递间隔保存在数据库中，Web进程与所有发送进程共同遵守同一份限制
+"""
+
+import math
+import os
+import socket
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+
+from backend.config import Config
+from backend.database import db
+from backend.models.domain_slot import DomainSlot
+from backend.models.send_pacing import SendPacing
+
+logger = logging.getLogger(__name__)
+
+
+def recipient_domain(email: str) -> str:
+    """收件人邮箱的域名（小写）"""
+    return email.rsplit('@', 1)[-1].strip().lower() if email else ''
+
+
+def interleave_by_domain(messages: List[Dict], key: str = 'recipient_email') -> List[Dict]:
+    """按收件域名轮转重排邮件：各域名内保持原有顺序，相邻邮件尽量落在不同域名"""
+    groups: 'OrderedDict[str, deque]' = OrderedDict()
+    for message in messages:
+        groups.setdefault(recipient_domain(message[key]), deque()).append(message)
+    ordered = []
+    while groups:
+        for domain in list(groups):
+            queue = groups[domain]
+            ordered.append(queue.popleft())
+            if not queue:
+                del groups[domain]
+    return ordered
+
+
+class DomainThrottle:
+    """按收件域名限制并发与发送间隔（状态在数据库中，进程间共享；需在应用上下文中调用）"""
+
+    # 数据库繁忙时建议的等待秒数
+    BUSY_WAIT = 0.5
+
+    def __init__(self, max_concurrency: int = 2, min_interval: float = 1.0,
+                 overrides: Optional[Dict[str, Dict]] = None, slot_lease: float = 300):
+        """
+        Args:
+            max_concurrency: 同一域名同时在途的邮件数上限
+            min_interval: 同一域名两次开始投递之间的最小间隔（秒）
+            overrides: 按域名覆盖的限制，如 {'tsinghua.edu.cn': {'concurrency': 1, 'min_interval': 5}}，
+                同时作用于其子域名（如 mails.tsinghua.edu.cn）
+            slot_lease: 名额租约（秒），占用名额的进程崩溃后名额最多保留这么久
+        """
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_interval = max(0.0, float(min_interval))
+        self.overrides = {domain.lower(): limits for domain, limits in (overrides or {}).items()}
+        self.slot_lease = slot_lease
+        # 本进程占用的名额数与已知的下一次可投递时间（time.time()），用于免去注定失败的数据库写入
+        self._held: Dict[str, int] = {}
+        self._next_start: Dict[str, float] = {}
+        self._condition = threading.Condition()
+
+    def limits_for(self, domain: str) -> Tuple[int, float]:
+        """域名的 (并发上限, 最小间隔)，按最长匹配的覆盖配置计算"""
+        parts = domain.split('.')
+        for i in range(len(parts)):
+            limits = self.overrides.get('.'.join(parts[i:]))
+            if limits:
+                return (
+                    max(1, int(limits.get('concurrency', self.max_concurrency))),
+                    max(0.0, float(limits.get('min_interval', self.min_interval)))
+                )
+        return self.max_concurrency, self.min_interval
+
+    def try_acquire(self, domain: str) -> float:
+        """
+        尝试占用该域名的一个发送名额。
+        清理过期名额、按在途数量条件插入名额、推进投递间隔在同一个事务中完成，任一条件不满足则整体回滚
+
+        Returns:
+            float: 0 表示已占用；否则为建议等待的秒数（并发已满时为 inf，需等待其他邮件发送结束）
+        """
+        concurrency, interval = self.limits_for(domain)
+        now = time.time()
+        with self._condition:
+            if self._held.get(domain, 0) >= concurrency:
+                return math.inf
+            wait = self._next_start.get(domain, 0.0) - now
+            if wait > 0:
+                return wait
+        try:
+            db.session.execute(delete(DomainSlot).where(DomainSlot.domain == domain, DomainSlot.expires_at <= now))
+            in_flight = (
+                select(func.count()).select_from(DomainSlot).where(DomainSlot.domain == domain).scalar_subquery()
+            )
+            inserted = db.session.execute(
+                insert(DomainSlot).from_select(
+                    ['domain', 'holder', 'expires_at'],
+                    select(literal(domain), literal(self._holder()), literal(now + self.slot_lease))
+                    .where(in_flight < concurrency)
+                )
+            )
+            if inserted.rowcount == 0:
+                db.session.rollback()
+                return math.inf
+            if interval > 0:
+                next_start = self._advance_interval(domain, now, interval)
+                if next_start is not None:
+                    db.session.rollback()
+                    with self._condition:
+                        self._next_start[domain] = next_start
+                    return max(next_start - now, 0.001)
+            db.session.commit()
+        except OperationalError as e:
+            db.session.rollback()
+            logger.debug(f"占用收件域名名额时数据库繁忙: {domain} - {e}")
+            return self.BUSY_WAIT
+        with self._condition:
+            self._held[domain] = self._held.get(domain, 0) + 1
+            self._next_start[domain] = now + interval
+        return 0.0
+
+    @staticmethod
+    def _advance_interval(domain: str, now: float, interval: float) -> Optional[float]:
+        """到了可投递时间则把下一次可投递时间推进到 now+interval 并返回None，否则返回下一次可投递时间"""
+        key = f"domain:{domain}"
+        row = db.session.execute(
+            insert(SendPacing).values(key=key, next_start=now + interval)
+            .on_conflict_do_update(
+                index_elements=[SendPacing.key],
+                set_={'next_start': now + interval},
+                where=SendPacing.next_start <= now
+            )
+            .returning(SendPacing.next_start)
+        ).first()
+        if row is not None:
+            return None
+        return db.session.execute(select(SendPacing.next_start).where(SendPacing.key == key)).scalar()
+
+    def release(self, domain: str):
+        """释放本进程占用的一个名额；写入失败时该名额在租约到期后自动失效"""
+        slot_id = (
+            select(DomainSlot.id)
+            .where(DomainSlot.domain == domain, DomainSlot.holder == self._holder())
+            .limit(1)
+            .scalar_subquery()
+        )
+        try:
+            db.session.execute(delete(DomainSlot).where(DomainSlot.id == slot_id))
+            db.session.commit()
+        except OperationalError as e:
+            db.session.rollback()
+            logger.warning(f"释放收件域名名额失败，将在租约到期后失效: {domain} - {e}")
+        with self._condition:
+            remaining = self._held.get(domain, 0) - 1
+            if remaining > 0:
+                self._held[domain] = remaining
+            else:
+                self._held.pop(domain, None)
+            self._condition.notify_all()
+
+    @staticmethod
+    def _holder() -> str:
+        # 按调用时的进程号计算，fork 出的发送进程各自记名
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def wait(self, timeout: float):
+        """等待本进程释放任一域名名额或超时（其他进程释放名额不会唤醒，由调用方按超时重试）"""
+        with self._condition:
+            self._condition.wait(timeout)
+
+    @contextmanager
+    def slot(self, domain: str, max_wait: float = 1.0,
+             cancelled: Optional[Callable[[], bool]] = None):
+        """
+        阻塞直到占用该域名的发送名额，退出时释放
+
+        Args:
+            max_wait: 单次等待上限（秒），期间会检查 cancelled
+            cancelled: 返回True时放弃等待并抛出 InterruptedError
+        """
+        while True:
+            wait = self.try_acquire(domain)
+            if wait == 0:
+                break
+            if cancelled and cancelled():
+                raise InterruptedError(domain)
+            self.wait(min(wait, max_wait))
+        try:
+            yield
+        finally:
+            self.release(domain)
+
+    def stats(self) -> Dict[str, int]:
+        """所有进程在各域名的在途邮件数"""
+        rows = db.session.execute(
+            select(DomainSlot.domain, func.count())
+            .where(DomainSlot.expires_at > time.time())
+            .group_by(DomainSlot.domain)
+        ).all()
+        return {domain: count for domain, count in rows}
+
+
+class DomainQueue:
+    """待发送邮件按域名分组轮转，取出时跳过暂不可发送的域名"""
+
+    def __init__(self, messages: List[Dict], key: str = 'recipient_email'):
+        self._key = key
+        self._groups: 'OrderedDict[str, deque]' = OrderedDict()
+        for message in messages:
+            self._groups.setdefault(recipient_domain(message[key]), deque()).append(message)
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._groups.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._groups)
+
+    def pop(self) -> Dict:
+        """按轮转顺序取出下一封邮件（不检查域名限制）"""
+        domain, queue = next(iter(self._groups.items()))
+        del self._groups[domain]
+        message = queue.popleft()
+        if queue:
+            self._groups[domain] = queue
+        return message
+
+    def upcoming(self, limit: int) -> List[Dict]:
+        """按轮转顺序列出接下来最多 limit 封邮件（不取出；各域名都可立即发送时即为实际取出顺序）"""
+        result = []
+        queues = list(self._groups.values())
+        depth = 0
+        while queues and len(result) < limit:
+            for queue in queues:
+                if len(result) >= limit:
+                    break
+                result.append(queue[depth])
+            depth += 1
+            queues = [queue for queue in queues if len(queue) > depth]
+        return result
+
+    def pop_ready(self, throttle: DomainThrottle) -> Tuple[Optional[Dict], float]:
+        """
+        按轮转顺序取出第一封所在域名可以立即发送的邮件（同时占用该域名名额）
+
+        Returns:
+            (邮件, 0) 或 (None, 最短等待秒数)
+        """
+        shortest = math.inf
+        for domain in list(self._groups):
+            wait = throttle.try_acquire(domain)
+            if wait == 0:
+                queue = self._groups.pop(domain)
+                message = queue.popleft()
+                # 已取出的域名移到队尾，下一次优先其他域名
+                if queue:
+                    self._groups[domain] = queue
+                return message, 0.0
+            shortest = min(shortest, wait)
+        return None, shortest
+
+
+# 进程级域名节流器（状态在数据库中，各进程共享），限制见 Config.DOMAIN_MAX_CONCURRENCY / DOMAIN_MIN_INTERVAL / DOMAIN_LIMITS
+domain_throttle = DomainThrottle(Config.DOMAIN_MAX_CONCURRENCY, Config.DOMAIN_MIN_INTERVAL, Config.DOMAIN_LIMITS)
@@ -1,27 +1,55 @@
-import smtplib
 import os
+import time
 import logging
-from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 from email.header import Header
-from datetime import datetime
 from typing import List, Dict, Optional
 import base64
+from backend.smtp_pool import SMTPConnectionPool, _credential_fingerprint, smtp_pool
+from backend.rate_limiter import DEFAULT_RATE_LIMIT, RateLimiter
+from backend.config import Config
+from backend.circuit_breaker import CircuitBreaker, CircuitOpenError, circuit_breaker as default_circuit_breaker
+from backend.credential_cache import CredentialCheckCache, CredentialKey, credential_cache as default_credential_cache
+from backend.attachment_cache import AttachmentCache, StreamingAttachment, attachment_cache as default_attachment_cache
+from backend.prepared_message import PreparedMessage
+from backend.smtp_errors import SMTPSendError, classify_smtp_error
+from backend.smtp_metrics import PHASE_TOTAL, SendTimings, smtp_metrics
+from backend.template_engine import PLACEHOLDER_PATTERN, compile_template
 
 logger = logging.getLogger(__name__)
 
 class EmailService:
     """邮件发送服务类"""
     
-    def __init__(self):
+    def __init__(self, pool: Optional[SMTPConnectionPool] = None,
+                 attachment_cache: Optional[AttachmentCache] = None,
+                 stream_threshold: Optional[int] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 credential_cache: Optional[CredentialCheckCache] = None):
+        # 默认使用进程级共享连接池，保证不同路由/实例间复用同一批已认证会话
+        self.pool = pool or smtp_pool
+        # 附件编码缓存：同一附件在批量发送中只读取、编码一次
+        self.attachment_cache = attachment_cache or default_attachment_cache
+        # 超过该大小的附件改为发送时从磁盘流式编码，单封邮件的内存占用与附件大小无关
+        self.stream_threshold = Config.ATTACHMENT_STREAM_THRESHOLD if stream_threshold is None else stream_threshold
+        # 发件通道熔断：授权码失效或服务器宕机时，剩余邮件不再逐封等待连接超时
+        self.circuit_breaker = circuit_breaker or default_circuit_breaker
+        # 最近验证成功的发件凭据，有效期内重复验证不再登录
+        self.credential_cache = credential_cache or default_credential_cache
+        # rate_limit: 服务商默认限额（每小时速率、突发量、每日上限），可被 sender_config['rate_limit'] 覆盖
         self.smtp_servers = {
-            '163.com': {'server': 'smtp.163.com', 'port': 465},
-            'qq.com': {'server': 'smtp.qq.com', 'port': 587},
-            'gmail.com': {'server': 'smtp.gmail.com', 'port': 587},
-            'outlook.com': {'server': 'smtp-mail.outlook.com', 'port': 587},
-            'sina.com': {'server': 'smtp.sina.com', 'port': 25}
+            '163.com': {'server': 'smtp.163.com', 'port': 465,
+                        'rate_limit': {'per_hour': 50, 'burst': 5, 'daily_cap': 200}},
+            'qq.com': {'server': 'smtp.qq.com', 'port': 587,
+                       'rate_limit': {'per_hour': 100, 'burst': 10, 'daily_cap': 500}},
+            'gmail.com': {'server': 'smtp.gmail.com', 'port': 587,
+                          'rate_limit': {'per_hour': 100, 'burst': 10, 'daily_cap': 500}},
+            'outlook.com': {'server': 'smtp-mail.outlook.com', 'port': 587,
+                            'rate_limit': {'per_hour': 60, 'burst': 5, 'daily_cap': 300}},
+            'sina.com': {'server': 'smtp.sina.com', 'port': 25,
+                         'rate_limit': {'per_hour': 30, 'burst': 3, 'daily_cap': 200}}
         }
 
     def get_smtp_config(self, email: str) -> Dict[str, any]:
@@ -31,7 +59,60 @@ class EmailService:
             'server': 'smtp.' + domain,
             'port': 587
         })
+
+    def resolve_smtp_settings(self, sender_config: Dict[str, str]) -> Dict[str, any]:
+        """计算SMTP连接参数，优先使用用户在sender_config中配置的服务器与端口"""
+        default_cfg = self.get_smtp_config(sender_config['email'])
+        smtp_server = (sender_config.get('smtp_server') or default_cfg['server']).strip()
+        smtp_port = int(sender_config.get('smtp_port') or default_cfg['port'])
+        use_ssl = bool(sender_config.get('use_ssl')) or smtp_port == 465
+        use_starttls = bool(sender_config.get('use_starttls')) or (smtp_port == 587 and not use_ssl)
+        return {
+            'server': smtp_server,
+            'port': smtp_port,
+            'use_ssl': use_ssl,
+            'use_starttls': use_starttls,
+            'security': 'SSL' if use_ssl else ('STARTTLS' if use_starttls else 'PLAIN')
+        }
+
+    def get_rate_limits(self, sender_config: Dict[str, str]) -> Dict[str, any]:
+        """获取发件人的限速配置：自定义配置 > 服务商默认（按邮箱域名或SMTP主机匹配）> 全局默认"""
+        if sender_config.get('rate_limit'):
+            return {**DEFAULT_RATE_LIMIT, **sender_config['rate_limit']}
+        domain = sender_config['email'].split('@')[1].lower()
+        provider = self.smtp_servers.get(domain)
+        if provider is None:
+            smtp_server = (sender_config.get('smtp_server') or '').strip().lower()
+            provider = next((cfg for cfg in self.smtp_servers.values() if cfg['server'] == smtp_server), None)
+        if provider and provider.get('rate_limit'):
+            return dict(provider['rate_limit'])
+        return dict(DEFAULT_RATE_LIMIT)
+
+    def get_rate_limit_key(self, sender_config: Dict[str, str]) -> str:
+        """获取发件人对应的限速键 (发件账号, SMTP主机)"""
+        settings = self.resolve_smtp_settings(sender_config)
+        return RateLimiter.make_key(sender_config['email'], settings['server'])
+
+    def get_pool_key(self, sender_config: Dict[str, str]):
+        """获取发件人对应的连接池键"""
+        settings = self.resolve_smtp_settings(sender_config)
+        return self.pool.make_key(settings['server'], settings['port'], sender_config['email'], settings['security'])
     
+    def get_circuit_key(self, sender_config: Dict[str, str]) -> tuple:
+        """熔断器键：(SMTP服务器, 发件邮箱)"""
+        settings = self.resolve_smtp_settings(sender_config)
+        return settings['server'].lower(), sender_config['email'].lower()
+
+    def get_credential_key(self, sender_config: Dict[str, str]) -> CredentialKey:
+        """凭据验证缓存键：连接池键加授权码指纹"""
+        smtp_server, smtp_port, sender_email, security = self.get_pool_key(sender_config)
+        return (sender_email.lower(), smtp_server, smtp_port, security,
+                _credential_fingerprint(sender_config.get('password')))
+
+    def check_circuit(self, sender_config: Dict[str, str]) -> Optional[CircuitOpenError]:
+        """发件通道熔断中时返回对应错误（不连接服务器），否则返回None"""
+        return self.circuit_breaker.check(self.get_circuit_key(sender_config), sender_config.get('password'))
+
     def send_email(self, 
                    recipient_email: str,
                    recipient_name: str,
@@ -57,107 +138,174 @@ class EmailService:
         Returns:
             bool: 发送是否成功
         """
+        try:
+            prepared = self.prepare_message(sender_config, attachments, attachment_data, content_type)
+        except Exception as e:
+            logger.error(
+                f"邮件发送失败: {recipient_name} <{recipient_email}> - {e!r}"
+            )
+            return False
+        return self.send_prepared(prepared, sender_config, recipient_email, recipient_name, subject, content)
+
+    def prepare_message(self,
+                        sender_config: Dict[str, str],
+                        attachments: Optional[List] = None,
+                        attachment_data: Optional[List[Dict[str, any]]] = None,
+                        content_type: str = 'html') -> PreparedMessage:
+        """
+        预构建邮件：发件人头与附件只构建、序列化一次，可供同一批次的所有收件人复用
+
+        Args:
+            sender_config: 发件人配置
+            attachments: 附件文件路径列表（或包含file_path和display_name的字典列表）
+            attachment_data: base64编码的附件数据列表
+            content_type: 内容类型 'html' 或 'plain'
+
+        Returns:
+            PreparedMessage: 预构建的邮件
+        """
+        # 借用 MIMEMultipart 收集附件部分，沿用原有的附件处理逻辑
+        container = MIMEMultipart()
+
+        # 添加文件路径附件
+        if attachments:
+            for attachment in attachments:
+                if isinstance(attachment, str):
+                    # 兼容旧格式：直接传递文件路径
+                    if os.path.isfile(attachment):
+                        self._add_attachment(container, attachment)
+                    else:
+                        logger.warning(f"附件文件不存在: {attachment}")
+                elif isinstance(attachment, dict):
+                    # 新格式：包含file_path和display_name的字典
+                    file_path = attachment.get('file_path')
+                    display_name = attachment.get('display_name')
+                    if file_path and os.path.isfile(file_path):
+                        self._add_attachment(container, file_path, display_name)
+                    else:
+                        logger.warning(f"附件文件不存在: {file_path}")
+
+        # 添加base64编码的附件数据
+        if attachment_data:
+            for attachment in attachment_data:
+                self._add_attachment_from_data(container, attachment)
+
+        sender_name = sender_config.get('name', sender_config['email'])
+        return PreparedMessage(
+            sender_config['email'], sender_name, container.get_payload(), content_type
+        )
+
+    @staticmethod
+    def prepared_message_key(attachments: Optional[List] = None, content_type: str = 'html') -> tuple:
+        """同一发件人下可共用同一个预构建邮件的判断依据（附件与正文类型相同）"""
+        files = []
+        for attachment in attachments or []:
+            if isinstance(attachment, dict):
+                files.append((attachment.get('file_path'), attachment.get('display_name')))
+            else:
+                files.append((attachment, None))
+        return (tuple(files), content_type)
+
+    def send_prepared(self,
+                      prepared: PreparedMessage,
+                      sender_config: Dict[str, str],
+                      recipient_email: str,
+                      recipient_name: str,
+                      subject: str,
+                      content: str) -> bool:
+        """
+        向单个收件人发送预构建的邮件
+
+        Returns:
+            bool: 发送是否成功
+        """
+        try:
+            self.deliver_prepared(prepared, sender_config, recipient_email, recipient_name, subject, content)
+            return True
+        except SMTPSendError:
+            return False
+
+    def deliver_prepared(self,
+                         prepared: PreparedMessage,
+                         sender_config: Dict[str, str],
+                         recipient_email: str,
+                         recipient_name: str,
+                         subject: str,
+                         content: str,
+                         timings: Optional[SendTimings] = None,
+                         head: Optional[bytes] = None):
+        """
+        向单个收件人发送预构建的邮件，失败时抛出分类后的错误。
+        各阶段耗时写入 timings（如传入）并汇总到 smtp_metrics；
+        head 为已由渲染进程生成的个性化部分（邮件头与正文）
+
+
+        Raises:
+            SMTPSendError: 包含SMTP响应码与文本，temporary 表示可稍后重试；
+                发件通道熔断中时为 CircuitOpenError（邮件未实际发送）
+        """
+        circuit_key = None
+        timings = timings or SendTimings()
+        start = None
         try:
             # 计算SMTP配置，优先使用用户在sender_config中配置的服务器与端口
-            default_cfg = self.get_smtp_config(sender_config['email'])
-            smtp_server = (sender_config.get('smtp_server') or default_cfg['server']).strip()
-            smtp_port = int(sender_config.get('smtp_port') or default_cfg['port'])
-            use_ssl = bool(sender_config.get('use_ssl')) or smtp_port == 465
-            use_starttls = bool(sender_config.get('use_starttls')) or (smtp_port == 587 and not use_ssl)
+            settings = self.resolve_smtp_settings(sender_config)
+            circuit_key = self.get_circuit_key(sender_config)
+            self.circuit_breaker.acquire(circuit_key, sender_config['password'])
 
             logger.info(
                 f"准备发送邮件: to={recipient_name} <{recipient_email}>, "
-                f"server={smtp_server}, port={smtp_port}, "
-                f"security={'SSL' if use_ssl else ('STARTTLS' if use_starttls else 'PLAIN')}"
+                f"server={settings['server']}, port={settings['port']}, "
+                f"security={settings['security']}"
             )
-            
-            # 创建邮件对象
-            message = MIMEMultipart()
-            
-            # 设置发件人信息
-            sender_name = sender_config.get('name', sender_config['email'])
-            message['From'] = f"{Header(sender_name, 'utf-8').encode()} <{sender_config['email']}>"
-            message['To'] = f"{Header(recipient_name, 'utf-8').encode()} <{recipient_email}>"
-            message['Subject'] = Header(subject, 'utf-8')
-            
-            # 添加邮件内容
-            content_part = MIMEText(content, content_type, 'utf-8')
-            message.attach(content_part)
-            
-            # 添加文件路径附件
-            if attachments:
-                for attachment in attachments:
-                    if isinstance(attachment, str):
-                        # 兼容旧格式：直接传递文件路径
-                        if os.path.isfile(attachment):
-                            self._add_attachment(message, attachment)
-                        else:
-                            logger.warning(f"附件文件不存在: {attachment}")
-                    elif isinstance(attachment, dict):
-                        # 新格式：包含file_path和display_name的字典
-                        file_path = attachment.get('file_path')
-                        display_name = attachment.get('display_name')
-                        if file_path and os.path.isfile(file_path):
-                            self._add_attachment(message, file_path, display_name)
-                        else:
-                            logger.warning(f"附件文件不存在: {file_path}")
-            
-            # 添加base64编码的附件数据
-            if attachment_data:
-                for attachment in attachment_data:
-                    self._add_attachment_from_data(message, attachment)
-            
-            # 发送邮件：根据端口/配置自动选择SSL或STARTTLS
-            if use_ssl:
-                with smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=30) as smtp_obj:
-                    smtp_obj.login(sender_config['email'], sender_config['password'])
-                    smtp_obj.sendmail(
-                        sender_config['email'], 
-                        recipient_email, 
-                        message.as_string()
-                    )
-            else:
-                with smtplib.SMTP(smtp_server, smtp_port, timeout=30) as smtp_obj:
-                    if use_starttls:
-                        smtp_obj.starttls()
-                    smtp_obj.login(sender_config['email'], sender_config['password'])
-                    smtp_obj.sendmail(
-                        sender_config['email'], 
-                        recipient_email, 
-                        message.as_string()
-                    )
-            
-            logger.info(f"邮件发送成功: {recipient_name} <{recipient_email}>")
-            return True
-            
+
+            # 发送邮件：通过连接池复用已认证的SSL/STARTTLS会话，邮件内容逐块写入DATA流
+            pool_key = self.pool.make_key(
+                settings['server'], settings['port'], sender_config['email'], settings['security']
+            )
+            start = time.perf_counter()
+            self.pool.send_stream(
+                pool_key,
+                sender_config['password'],
+                sender_config['email'],
+                recipient_email,
+                lambda: prepared.render(recipient_email, recipient_name, subject, content, head),
+                timings
+            )
+
+        except CircuitOpenError as e:
+            logger.warning(f"发件通道熔断中，跳过发送: {recipient_name} <{recipient_email}> - {e}")
+            raise
         except Exception as e:
+            if circuit_key is not None:
+                self.circuit_breaker.record_result(circuit_key, e, sender_config['password'])
+            if start is not None:
+                timings.add(PHASE_TOTAL, time.perf_counter() - start)
+                smtp_metrics.observe(settings['server'], sender_config['email'], timings, success=False)
+            error = classify_smtp_error(e)
             logger.error(
-                f"邮件发送失败: {recipient_name} <{recipient_email}> - {e!r}"
+                f"邮件发送失败{'（临时错误）' if error.temporary else ''}: "
+                f"{recipient_name} <{recipient_email}> - {error}"
             )
-            return False
+            raise error from e
+
+        self.circuit_breaker.record_result(circuit_key)
+        timings.add(PHASE_TOTAL, time.perf_counter() - start)
+        smtp_metrics.observe(settings['server'], sender_config['email'], timings, success=True)
+        logger.info(
+            f"邮件发送成功: {recipient_name} <{recipient_email}> "
+            f"({timings.get(PHASE_TOTAL) * 1000:.0f}ms)"
+        )
 
     def _add_attachment(self, message: MIMEMultipart, file_path: str, display_name: Optional[str] = None):
-        """添加附件到邮件"""
+        """添加附件到邮件（小附件的编码结果来自附件缓存，大附件在发送时流式编码）"""
         try:
-            # 读取文件内容
-            with open(file_path, 'rb') as file:
-                part = MIMEBase('application', 'octet-stream')
-                part.set_payload(file.read())
-            
-            # 编码附件
-            encoders.encode_base64(part)
-            
-            # 获取文件名
-            filename = display_name or os.path.basename(file_path)
-            
-            # 设置附件头信息
-            part.add_header(
-                'Content-Disposition',
-                f'attachment; filename= {Header(filename, "utf-8").encode()}'
-            )
-            
+            if os.path.getsize(file_path) > self.stream_threshold:
+                part = StreamingAttachment(file_path, display_name or os.path.basename(file_path))
+            else:
+                part = self.attachment_cache.get_part(file_path, display_name)
             message.attach(part)
-            logger.info(f"成功添加附件: {filename}")
+            logger.info(f"成功添加附件: {display_name or os.path.basename(file_path)}")
             
         except Exception as e:
             logger.error(f"添加附件失败: {file_path} - {str(e)}")
@@ -209,20 +357,27 @@ class EmailService:
         Returns:
             Dict: 发送统计 {'success': 成功数量, 'failed': 失败数量}
         """
-        import time
-        
         stats = {'success': 0, 'failed': 0}
-        
+
+        # 附件相同的邮件共用一个预构建邮件，附件只编码、序列化一次
+        prepared_messages = {}
         for i, email_info in enumerate(email_list):
             try:
-                success = self.send_email(
+                content_type = email_info.get('content_type', 'html')
+                prepared_key = self.prepared_message_key(email_info.get('attachments'), content_type)
+                prepared = prepared_messages.get(prepared_key)
+                if prepared is None:
+                    prepared = self.prepare_message(
+                        sender_config, email_info.get('attachments'), content_type=content_type
+                    )
+                    prepared_messages[prepared_key] = prepared
+                success = self.send_prepared(
+                    prepared,
+                    sender_config,
                     recipient_email=email_info['recipient_email'],
                     recipient_name=email_info['recipient_name'],
                     subject=email_info['subject'],
-                    content=email_info['content'],
-                    sender_config=sender_config,
-                    attachments=email_info.get('attachments'),
-                    content_type=email_info.get('content_type', 'html')
+                    content=email_info['content']
                 )
                 
                 if success:
@@ -230,8 +385,8 @@ class EmailService:
                 else:
                     stats['failed'] += 1
                 
-                # 如果不是最后一封邮件，等待指定间隔
-                if i < len(email_list) - 1:
+                # 如果不是最后一封邮件，等待指定间隔（发件通道熔断时后续邮件会快速失败，无需等待）
+                if i < len(email_list) - 1 and self.check_circuit(sender_config) is None:
                     time.sleep(interval_seconds)
                     
             except Exception as e:
@@ -241,13 +396,18 @@ class EmailService:
         logger.info(f"批量邮件发送完成: 成功 {stats['success']} 封，失败 {stats['failed']} 封")
         return stats
 
-    def validate_email_config(self, sender_config: Dict[str, str]) -> bool:
+    def validate_email_config(self, sender_config: Dict[str, str], use_cache: bool = True) -> bool:
         """
         验证邮件配置是否有效
-        
+
+        通过连接池建立（或复用）已认证的连接，验证通过的连接留在池中供随后的发送使用；
+        验证成功的结果在 CREDENTIAL_CACHE_TTL 内缓存
+
         Args:
             sender_config: 发件人配置
-            
+            use_cache: 是否使用缓存的验证结果与池中已登录的连接；False 时总是新建连接并重新登录，
+                授权码被撤销后不会因为池中仍有旧会话而验证通过
+
         Returns:
             bool: 配置是否有效
         """
@@ -257,33 +417,60 @@ class EmailService:
                 if not sender_config.get(field):
                     logger.error(f"邮件配置缺少必要字段: {field}")
                     return False
-            
-            # 计算SMTP配置（优先使用用户自定义）
-            default_cfg = self.get_smtp_config(sender_config['email'])
-            smtp_server = (sender_config.get('smtp_server') or default_cfg['server']).strip()
-            smtp_port = int(sender_config.get('smtp_port') or default_cfg['port'])
-            use_ssl = bool(sender_config.get('use_ssl')) or smtp_port == 465
-            use_starttls = bool(sender_config.get('use_starttls')) or (smtp_port == 587 and not use_ssl)
 
+            credential_key = self.get_credential_key(sender_config)
+            if use_cache and self.credential_cache.is_valid(credential_key):
+                logger.debug(f"邮件配置近期已验证，跳过登录: {sender_config['email']}")
+                return True
+
+            # 计算SMTP配置（优先使用用户自定义）
+            settings = self.resolve_smtp_settings(sender_config)
             logger.info(
-                f"验证邮件配置: server={smtp_server}, port={smtp_port}, "
-                f"security={'SSL' if use_ssl else ('STARTTLS' if use_starttls else 'PLAIN')}"
+                f"验证邮件配置: server={settings['server']}, port={settings['port']}, "
+                f"security={settings['security']}"
             )
-            
-            if use_ssl:
-                with smtplib.SMTP_SSL(smtp_server, smtp_port, timeout=15) as smtp_obj:
-                    smtp_obj.login(sender_config['email'], sender_config['password'])
+
+            pool_key = self.get_pool_key(sender_config)
+            if use_cache:
+                conn = self.pool.acquire(pool_key, sender_config['password'])
             else:
-                with smtplib.SMTP(smtp_server, smtp_port, timeout=15) as smtp_obj:
-                    if use_starttls:
-                        smtp_obj.starttls()
-                    smtp_obj.login(sender_config['email'], sender_config['password'])
-            
+                conn = self.pool.connect(pool_key, sender_config['password'])
+            self.pool.release(conn)
+
             logger.info(f"邮件配置验证成功: {sender_config['email']}")
+            self.credential_cache.mark_valid(credential_key)
+            # 配置已验证可用，清除该发件通道的熔断状态
+            self.circuit_breaker.reset(self.get_circuit_key(sender_config))
             return True
             
         except Exception as e:
             logger.error(f"邮件配置验证失败: {e!r}")
+            if sender_config.get('email') and sender_config.get('password'):
+                self.credential_cache.invalidate(self.get_credential_key(sender_config))
+            return False
+
+    def prewarm(self, sender_config: Dict[str, str]) -> bool:
+        """
+        提前建立并认证发件人的连接池连接，批量任务的第一封邮件不必再等待握手与登录
+
+        Returns:
+            bool: 是否已有可用连接（新建成功或池中已有）
+        """
+        if not sender_config.get('password'):
+            return False
+        # 发件通道熔断中：不连接服务器
+        if self.check_circuit(sender_config) is not None:
+            return False
+        try:
+            start = time.perf_counter()
+            if self.pool.prewarm(self.get_pool_key(sender_config), sender_config['password']):
+                logger.info(f"SMTP连接已预热: {sender_config['email']}，耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+                # 只有本次确实完成了登录才记为验证成功（已有空闲连接或他人正在预热时不更新缓存）
+                self.credential_cache.mark_valid(self.get_credential_key(sender_config))
+            return True
+        except Exception as e:
+            logger.warning(f"SMTP连接预热失败: {sender_config['email']} - {e!r}")
+            self.credential_cache.invalidate(self.get_credential_key(sender_config))
             return False
 
     def create_html_content(self, template_content: str, replacements: Dict[str, str]) -> str:
@@ -297,10 +484,15 @@ class EmailService:
         Returns:
             str: 生成的HTML内容
         """
-        html_content = template_content
-        
-        # 执行替换
+        values = {}
         for placeholder, replacement in replacements.items():
-            html_content = html_content.replace(placeholder, replacement)
-        
-        return html_content
\ No newline at end of file
+            match = PLACEHOLDER_PATTERN.fullmatch(placeholder)
+            if match is None:
+                # 非 {{字段}} 形式的替换键：按原方式逐个替换
+                html_content = template_content
+                for key, value in replacements.items():
+                    html_content = html_content.replace(key, value)
+                return html_content
+            values[match.group(1)] = replacement
+
+        return compile_template(template_content, values.keys()).render(values)
\ No newline at end of file
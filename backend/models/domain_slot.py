@@ -0,0 +1,13 @@
+from backend.database import db
+
+class DomainSlot(db.Model):
+    """收件域名发送名额模型：每封在途邮件占用一行，发送结束后删除；进程崩溃遗留的名额在租约到期后失效"""
+    __tablename__ = 'domain_slots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    domain = db.Column(db.String(255), nullable=False, index=True, comment='收件域名')
+    holder = db.Column(db.String(100), nullable=False, comment='占用名额的进程（主机名:进程号）')
+    expires_at = db.Column(db.Float, nullable=False, comment='名额租约到期时间（Unix时间戳）')
+
+    def __repr__(self):
+        return f'<DomainSlot {self.domain} {self.holder}>'
@@ -0,0 +1,41 @@
+from backend.database import db
+from backend.utils.timezone_utils import get_shanghai_utcnow
+
+class OutboxMessage(db.Model):
+    """待发送邮件（发件箱）模型：批量任务提交时每封邮件一行，发送进程通过租约认领"""
+    __tablename__ = 'outbox_messages'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(32), nullable=False, index=True, comment='批量任务ID')
+    kind = db.Column(db.String(20), nullable=False, default='batch', comment='任务类型: batch, document')
+    professor_id = db.Column(db.Integer, nullable=False, comment='教授ID')
+    recipient_email = db.Column(db.String(255), nullable=False, comment='收件人邮箱')
+    recipient_name = db.Column(db.String(100), comment='收件人姓名')
+    subject = db.Column(db.String(500), nullable=False, comment='邮件主题')
+    content = db.Column(db.Text, nullable=False, comment='邮件内容')
+    content_type = db.Column(db.String(10), nullable=False, default='html', comment='内容类型: html, plain')
+    sender_config = db.Column(db.Text, nullable=False, comment='发件人配置JSON（不含密码）')
+    sender_user_id = db.Column(db.Integer, comment='发件用户ID，发送时据此读取授权码')
+    attachments = db.Column(db.Text, comment='附件列表JSON')
+    send_interval = db.Column(db.Float, default=0, comment='同一发件人的发送间隔（秒）')
+
+    # 状态与租约
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True,
+                       comment='状态: pending, sent, failed, cancelled')
+    attempts = db.Column(db.Integer, nullable=False, default=0, comment='已尝试次数')
+    next_attempt_at = db.Column(db.DateTime, default=get_shanghai_utcnow, comment='最早可发送时间')
+    claimed_by = db.Column(db.String(100), comment='认领该邮件的发送进程')
+    lease_until = db.Column(db.DateTime, comment='租约到期时间，过期后可被其他进程重新认领')
+    last_error = db.Column(db.Text, comment='最近一次错误')
+    email_record_id = db.Column(db.Integer, comment='发送记录ID')
+
+    # 时间戳
+    created_at = db.Column(db.DateTime, default=get_shanghai_utcnow, comment='创建时间')
+    updated_at = db.Column(db.DateTime, default=get_shanghai_utcnow, onupdate=get_shanghai_utcnow, comment='更新时间')
+
+    __table_args__ = (
+        db.Index('ix_outbox_claimable', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<OutboxMessage {self.id} {self.recipient_email} - {self.status}>'
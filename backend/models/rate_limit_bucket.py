@@ -0,0 +1,14 @@
+from backend.database import db
+
+class RateLimitBucket(db.Model):
+    """发件限速令牌桶模型：每个限速键一行，Web进程与所有发送进程共享同一份配额"""
+    __tablename__ = 'rate_limit_buckets'
+
+    key = db.Column(db.String(320), primary_key=True, comment='限速键: 发件邮箱|SMTP主机')
+    tokens = db.Column(db.Float, nullable=False, comment='剩余令牌数（允许透支为负数）')
+    updated_at = db.Column(db.Float, nullable=False, comment='令牌最近一次结算的时间（Unix时间戳）')
+    day = db.Column(db.String(10), nullable=False, comment='每日计数所属日期（上海时区）')
+    day_count = db.Column(db.Integer, nullable=False, default=0, comment='当日已预订的邮件数')
+
+    def __repr__(self):
+        return f'<RateLimitBucket {self.key} tokens={self.tokens:.2f} {self.day}:{self.day_count}>'
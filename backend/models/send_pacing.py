@@ -0,0 +1,11 @@
+from backend.database import db
+
+class SendPacing(db.Model):
+    """发送节奏模型：同一节奏键（任务+发件人、收件域名）下一次最早可以开始发送的时间，所有进程共享"""
+    __tablename__ = 'send_pacing'
+
+    key = db.Column(db.String(400), primary_key=True, comment='节奏键，如 job:<任务ID>|<发件邮箱>、domain:<收件域名>')
+    next_start = db.Column(db.Float, nullable=False, comment='下一次最早开始发送的时间（Unix时间戳）')
+
+    def __repr__(self):
+        return f'<SendPacing {self.key} {self.next_start:.3f}>'
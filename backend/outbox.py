@@ -0,0 +1,366 @@
+"""
+持久化发件箱
+批量任务提交时先把每封邮件写入 outbox_messages 表，再由发送进程认领发送。
+认领通过租约实现：claimed_by 记录认领者，lease_until 为租约到期时间；
+发送进程崩溃后租约到期，其余进程（或重启后的Web进程）会自动重新认领未完成的邮件
+"""
+
+import json
+import os
+import socket
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import OperationalError
+
+from backend.config import Config
+from backend.database import db, EmailRecord
+from backend.models.outbox_message import OutboxMessage
+from backend.models.user_profile import UserProfile
+from backend.utils.timezone_utils import get_shanghai_utcnow
+
+logger = logging.getLogger(__name__)
+
+# 发件箱状态
+OUTBOX_PENDING = 'pending'
+OUTBOX_SENT = 'sent'
+OUTBOX_FAILED = 'failed'
+OUTBOX_CANCELLED = 'cancelled'
+
+
+def make_worker_id(role: str = 'worker') -> str:
+    """生成发送进程标识（主机名:进程号:随机后缀）"""
+    return f"{role}:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class Outbox:
+    """发件箱的读写操作（需在应用上下文中调用）"""
+
+    def __init__(self, lease_seconds: float = 300):
+        """
+        Args:
+            lease_seconds: 认领租约时长（秒），发送进程需在到期前续约
+        """
+        self.lease_seconds = lease_seconds
+
+    def _lease_deadline(self):
+        return get_shanghai_utcnow() + timedelta(seconds=self.lease_seconds)
+
+    def enqueue(self, job_id: str, kind: str, messages: List[Dict],
+                send_interval: float = 0, claimed_by: Optional[str] = None,
+                scheduled_at: Optional[datetime] = None):
+        """
+        在一个事务中写入一批待发送邮件，并把行ID回填到 message['outbox_id']
+
+        Args:
+            claimed_by: 由提交方直接发送时传入其进程标识，写入即认领；为None时等待发送进程认领
+            scheduled_at: 定时发送时间（UTC），到期前不会被认领
+        """
+        lease_until = self._lease_deadline() if claimed_by else None
+        next_attempt_at = scheduled_at or get_shanghai_utcnow()
+        rows = []
+        for message in messages:
+            sender_config = {k: v for k, v in message['sender_config'].items() if k != 'password'}
+            rows.append(OutboxMessage(
+                job_id=job_id,
+                kind=kind,
+                professor_id=message['professor_id'],
+                recipient_email=message['recipient_email'],
+                recipient_name=message['recipient_name'],
+                subject=message['subject'],
+                content=message['content'],
+                content_type=message.get('content_type', 'html'),
+                sender_config=json.dumps(sender_config, ensure_ascii=False),
+                sender_user_id=message['sender_config'].get('user_id'),
+                attachments=json.dumps(message.get('attachments') or [], ensure_ascii=False),
+                send_interval=send_interval,
+                # 重发已有记录时指向原记录，发送结果更新该记录
+                email_record_id=message.get('email_record_id'),
+                next_attempt_at=next_attempt_at,
+                claimed_by=claimed_by,
+                lease_until=lease_until
+            ))
+        try:
+            db.session.add_all(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        for message, row in zip(messages, rows):
+            message['outbox_id'] = row.id
+        logger.info(f"发件箱写入 {len(rows)} 封邮件: 任务 {job_id}")
+
+    def claim(self, worker_id: str, limit: int = 20, job_id: Optional[str] = None,
+              due_only: bool = True) -> List[OutboxMessage]:
+        """
+        认领最多 limit 封可发送的邮件（未认领或租约已过期、且已到发送时间）
+
+        单条UPDATE语句完成认领，多个进程并发认领时不会重复
+
+        Args:
+            due_only: 为False时，租约已过期的邮件即使未到重试时间也一并认领（崩溃恢复时整体接管）；
+                无人认领的邮件（含定时发送）始终要到时间才会被认领
+        """
+        now = get_shanghai_utcnow()
+        lease_until = self._lease_deadline()
+        unclaimed_due = OutboxMessage.claimed_by.is_(None) & (OutboxMessage.next_attempt_at <= now)
+        lease_expired = OutboxMessage.claimed_by.isnot(None) & (OutboxMessage.lease_until < now)
+        if due_only:
+            lease_expired = lease_expired & (OutboxMessage.next_attempt_at <= now)
+        claimable = (OutboxMessage.status == OUTBOX_PENDING) & or_(unclaimed_due, lease_expired)
+        if job_id:
+            claimable = claimable & (OutboxMessage.job_id == job_id)
+        candidate_ids = (
+            select(OutboxMessage.id)
+            .where(claimable)
+            .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+            .limit(limit)
+        )
+        try:
+            db.session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(candidate_ids.scalar_subquery()), claimable)
+                .values(claimed_by=worker_id, lease_until=lease_until)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except OperationalError as e:
+            # SQLite写锁竞争：本轮放弃认领，稍后重试
+            db.session.rollback()
+            logger.debug(f"认领发件箱邮件时数据库繁忙: {e}")
+            return []
+        return (
+            OutboxMessage.query
+            .filter_by(claimed_by=worker_id, lease_until=lease_until, status=OUTBOX_PENDING)
+            .order_by(OutboxMessage.id)
+            .all()
+        )
+
+    def extend_leases(self, worker_id: str) -> int:
+        """为该进程认领的全部未完成邮件续约"""
+        try:
+            result = db.session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.claimed_by == worker_id, OutboxMessage.status == OUTBOX_PENDING)
+                .values(lease_until=self._lease_deadline())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            return result.rowcount
+        except OperationalError as e:
+            db.session.rollback()
+            logger.warning(f"发件箱续约失败: {e}")
+            return 0
+
+    def release(self, worker_id: str):
+        """释放该进程认领的全部未完成邮件（正常退出时调用）"""
+        db.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.claimed_by == worker_id, OutboxMessage.status == OUTBOX_PENDING)
+            .values(claimed_by=None, lease_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+    def record_delivery(self, message: Dict, success: bool, error: Optional[str],
+                        worker_id: Optional[str] = None) -> Optional[EmailRecord]:
+        """
+        写入发送记录并在同一事务中把发件箱中的邮件标记为已完成；
+        重发的邮件（带 email_record_id）直接更新原记录
+
+        Returns:
+            Optional[EmailRecord]: 写入的发送记录，写入失败时返回None
+        """
+        try:
+            email_record = None
+            if message.get('email_record_id'):
+                email_record = db.session.get(EmailRecord, message['email_record_id'])
+            if email_record is None:
+                email_record = EmailRecord(
+                    professor_id=message['professor_id'],
+                    subject=message['subject'],
+                    content=message['content']
+                )
+                db.session.add(email_record)
+            email_record.status = 'sent' if success else 'failed'
+            email_record.error_message = error
+            email_record.sender_name = message['sender_config'].get('name')
+            email_record.sender_email = message['sender_config']['email']
+            email_record.sent_at = get_shanghai_utcnow() if success else None
+            outbox_id = message.get('outbox_id')
+            if outbox_id:
+                db.session.flush()
+                conditions = [OutboxMessage.id == outbox_id, OutboxMessage.status == OUTBOX_PENDING]
+                if worker_id:
+                    conditions.append(OutboxMessage.claimed_by == worker_id)
+                result = db.session.execute(
+                    update(OutboxMessage)
+                    .where(*conditions)
+                    .values(
+                        status=OUTBOX_SENT if success else OUTBOX_FAILED,
+                        attempts=OutboxMessage.attempts + 1,
+                        last_error=error,
+                        email_record_id=email_record.id,
+                        claimed_by=None,
+                        lease_until=None
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 0:
+                    logger.warning(f"发件箱邮件 {outbox_id} 的租约已被其他进程接管: {message['recipient_email']}")
+            db.session.commit()
+            return email_record
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"写入发送记录失败: {message['recipient_email']} - {e}")
+            return None
+
+    def schedule_retry(self, outbox_id: Optional[int], attempts: int, delay: float, error: str,
+                       release: bool = False):
+        """
+        记录临时失败与下次尝试时间
+
+        Args:
+            release: 是否同时释放认领，让任意发送进程在到期后重试
+        """
+        if not outbox_id:
+            return
+        values = {
+            'attempts': attempts,
+            'last_error': error,
+            'next_attempt_at': get_shanghai_utcnow() + timedelta(seconds=delay)
+        }
+        if release:
+            values.update(claimed_by=None, lease_until=None)
+        try:
+            db.session.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id == outbox_id, OutboxMessage.status == OUTBOX_PENDING)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"记录发件箱重试时间失败: {outbox_id} - {e}")
+
+    def cancel_job(self, job_id: str) -> int:
+        """取消任务中尚未发送的邮件"""
+        result = db.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.job_id == job_id, OutboxMessage.status == OUTBOX_PENDING)
+            .values(status=OUTBOX_CANCELLED, claimed_by=None, lease_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount
+
+    def is_cancelled(self, outbox_id: int) -> bool:
+        status = db.session.execute(
+            select(OutboxMessage.status).where(OutboxMessage.id == outbox_id)
+        ).scalar()
+        return status == OUTBOX_CANCELLED
+
+    def scheduled_jobs(self) -> List[Dict]:
+        """尚未到发送时间、也无人认领的定时任务（启动时据此重建调度堆）"""
+        rows = db.session.execute(
+            select(
+                OutboxMessage.job_id,
+                func.min(OutboxMessage.kind),
+                func.max(OutboxMessage.send_interval),
+                func.min(OutboxMessage.next_attempt_at),
+                func.count()
+            )
+            .where(
+                OutboxMessage.status == OUTBOX_PENDING,
+                OutboxMessage.claimed_by.is_(None),
+                OutboxMessage.next_attempt_at > get_shanghai_utcnow()
+            )
+            .group_by(OutboxMessage.job_id)
+        ).all()
+        return [
+            {'job_id': job_id, 'kind': kind, 'send_interval': send_interval or 0,
+             'scheduled_at': scheduled_at, 'count': count}
+            for job_id, kind, send_interval, scheduled_at, count in rows
+        ]
+
+    def job_summary(self, job_id: str) -> Optional[Dict]:
+        """按发件箱统计任务进度（任务不在当前进程内存中时使用）"""
+        rows = db.session.execute(
+            select(OutboxMessage.status, OutboxMessage.sender_config, func.count())
+            .where(OutboxMessage.job_id == job_id)
+            .group_by(OutboxMessage.status, OutboxMessage.sender_config)
+        ).all()
+        if not rows:
+            return None
+        counts = {OUTBOX_PENDING: 0, OUTBOX_SENT: 0, OUTBOX_FAILED: 0, OUTBOX_CANCELLED: 0}
+        senders: Dict[str, Dict[str, int]] = {}
+        for status, sender_config, count in rows:
+            counts[status] = counts.get(status, 0) + count
+            if status in (OUTBOX_SENT, OUTBOX_FAILED):
+                sender_email = json.loads(sender_config).get('email')
+                stats = senders.setdefault(sender_email, {'sent': 0, 'failed': 0})
+                stats['sent' if status == OUTBOX_SENT else 'failed'] += count
+        retrying = OutboxMessage.query.filter(
+            OutboxMessage.job_id == job_id,
+            OutboxMessage.status == OUTBOX_PENDING,
+            OutboxMessage.attempts > 0
+        ).count()
+        next_attempt_at = db.session.execute(
+            select(func.min(OutboxMessage.next_attempt_at))
+            .where(OutboxMessage.job_id == job_id, OutboxMessage.status == OUTBOX_PENDING)
+        ).scalar()
+        failed_emails = [
+            {
+                'professor_id': row.professor_id,
+                'professor_name': row.recipient_name,
+                'email': row.recipient_email,
+                'sender_email': json.loads(row.sender_config).get('email'),
+                'error': row.last_error
+            }
+            for row in OutboxMessage.query.filter_by(job_id=job_id, status=OUTBOX_FAILED).order_by(OutboxMessage.id)
+        ]
+        return {
+            'total': sum(counts.values()),
+            'pending': counts[OUTBOX_PENDING],
+            'sent': counts[OUTBOX_SENT],
+            'failed': counts[OUTBOX_FAILED],
+            'cancelled': counts[OUTBOX_CANCELLED],
+            'retrying': retrying,
+            'next_attempt_at': next_attempt_at,
+            'failed_emails': failed_emails,
+            'senders': senders
+        }
+
+    @staticmethod
+    def to_message(row: OutboxMessage) -> Dict:
+        """把发件箱中的一行还原为批量任务使用的邮件字典（授权码从用户配置中读取）"""
+        sender_config = json.loads(row.sender_config)
+        profile = None
+        if row.sender_user_id:
+            profile = db.session.get(UserProfile, row.sender_user_id)
+        if profile is None:
+            profile = UserProfile.query.filter_by(email=sender_config['email']).first()
+        sender_config['password'] = profile.email_password if profile else ''
+        return {
+            'outbox_id': row.id,
+            'job_id': row.job_id,
+            'email_record_id': row.email_record_id,
+            'professor_id': row.professor_id,
+            'recipient_email': row.recipient_email,
+            'recipient_name': row.recipient_name,
+            'subject': row.subject,
+            'content': row.content,
+            'content_type': row.content_type,
+            'sender_config': sender_config,
+            'attachments': json.loads(row.attachments or '[]'),
+            'send_interval': row.send_interval or 0,
+            'attempts': row.attempts or 0
+        }
+
+
+# 进程级发件箱
+outbox = Outbox(Config.OUTBOX_LEASE_SECONDS)
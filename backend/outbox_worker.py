@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+发件箱发送进程
+独立于Web进程运行，循环认领发件箱中的邮件并发送；可同时启动多个进程并行消费同一个发件箱。
+
+用法:
+    OUTBOX_EXTERNAL_WORKERS=true python -m backend.outbox_worker --processes 2
+"""
+
+import argparse
+import multiprocessing
+import signal
+import threading
+import time
+import logging
+from typing import Dict, Optional
+
+from backend.circuit_breaker import CircuitOpenError
+from backend.config import Config
+from backend.domain_throttle import DomainThrottle, domain_throttle as default_domain_throttle, recipient_domain
+from backend.email_service import EmailService
+from backend.outbox import Outbox, make_worker_id, outbox as default_outbox
+from backend.rate_limiter import DailyQuotaExceeded, RateLimiter, SendPacer, rate_limiter as default_rate_limiter, \
+    send_pacer as default_send_pacer
+from backend.smtp_errors import RetryPolicy, SMTPSendError
+from backend.smtp_metrics import PHASE_PACING_WAIT, PHASE_PREPARE, PHASE_RATE_WAIT, SendTimings
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """发件箱消费者：认领 → 限速 → 发送 → 记录，临时错误释放认领并按退避时间重新排队"""
+
+    def __init__(self, app,
+                 worker_id: Optional[str] = None,
+                 batch_size: int = 20,
+                 poll_interval: float = 2.0,
+                 email_service: Optional[EmailService] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 outbox: Optional[Outbox] = None,
+                 domain_throttle: Optional[DomainThrottle] = None,
+                 send_pacer: Optional[SendPacer] = None):
+        """
+        Args:
+            app: Flask应用（提供数据库连接）
+            worker_id: 进程标识，默认按主机名与进程号生成
+            batch_size: 每次认领的邮件数
+            poll_interval: 发件箱为空时的等待间隔（秒）
+        """
+        self.app = app
+        self.worker_id = worker_id or make_worker_id('worker')
+        self.batch_size = max(1, int(batch_size))
+        self.poll_interval = poll_interval
+        self.email_service = email_service or EmailService()
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy(
+            Config.SEND_RETRY_MAX_ATTEMPTS, Config.SEND_RETRY_BASE_DELAY, Config.SEND_RETRY_MAX_DELAY
+        )
+        self.outbox = outbox or default_outbox
+        self.domain_throttle = domain_throttle or default_domain_throttle
+        # 任务的 send_interval 按 (任务ID, 发件邮箱) 在所有进程之间共享
+        self.send_pacer = send_pacer or default_send_pacer
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        """循环消费发件箱，直到 stop() 被调用"""
+        logger.info(f"发件箱发送进程启动: {self.worker_id}")
+        with self.app.app_context():
+            try:
+                while not self.stop_event.is_set():
+                    if not self.run_once():
+                        self.stop_event.wait(self.poll_interval)
+            finally:
+                # 正常退出时释放未发送的邮件，其他进程无需等待租约过期即可接手
+                self.outbox.release(self.worker_id)
+                self.email_service.pool.close_all()
+                logger.info(f"发件箱发送进程退出: {self.worker_id}")
+
+    def run_once(self) -> int:
+        """认领并处理一批邮件，返回认领数量（需在应用上下文中调用）"""
+        rows = self.outbox.claim(self.worker_id, self.batch_size)
+        messages = [self.outbox.to_message(row) for row in rows]
+        prepared_messages = {}
+        for message in messages:
+            if self.stop_event.is_set():
+                break
+            self._deliver(message, prepared_messages)
+        return len(messages)
+
+    def _deliver(self, message: Dict, prepared_messages: Dict):
+        if self.outbox.is_cancelled(message['outbox_id']):
+            return
+        sender_config = message['sender_config']
+        blocked = self.email_service.check_circuit(sender_config)
+        if blocked is not None:
+            # 发件通道熔断中：不连接服务器、不占用限速配额，按熔断剩余时间重新排队或记为失败
+            self._handle_error(message, blocked, message['attempts'] + 1)
+            return
+        try:
+            wait = self.rate_limiter.reserve(
+                self.email_service.get_rate_limit_key(sender_config),
+                self.email_service.get_rate_limits(sender_config)
+            )
+        except DailyQuotaExceeded as e:
+            # 额度用尽不是发送失败：释放认领，额度重置后再由任意发送进程发送
+            logger.warning(f"发件人今日额度已用尽，推迟到额度重置后发送: {message['recipient_email']} - {e}")
+            self.outbox.schedule_retry(message['outbox_id'], message['attempts'], e.reset_in, str(e), release=True)
+            return
+
+        now = time.time()
+        start = self.send_pacer.reserve(
+            self.send_pacer.job_key(message['job_id'], sender_config['email']), message['send_interval'], now + wait
+        )
+        timings = SendTimings()
+        timings.add(PHASE_RATE_WAIT, wait)
+        timings.add(PHASE_PACING_WAIT, start - now - wait)
+        wait = start - time.time()
+        if wait > 0:
+            self.outbox.extend_leases(self.worker_id)
+            if self.stop_event.wait(wait):
+                return
+
+        attempts = message['attempts'] + 1
+        try:
+            # 同一收件域名的并发与间隔在所有任务之间共享
+            with self.domain_throttle.slot(recipient_domain(message['recipient_email']),
+                                           cancelled=self.stop_event.is_set):
+                self._send(message, prepared_messages, timings)
+        except InterruptedError:
+            return
+        except SMTPSendError as e:
+            self._handle_error(message, e, attempts)
+            return
+        except Exception as e:
+            logger.error(f"发件箱邮件发送出错: {message['recipient_email']} - {e}")
+            self.outbox.record_delivery(message, False, f"邮件发送失败: {e}", self.worker_id)
+            return
+
+        self.outbox.record_delivery(message, True, None, self.worker_id)
+
+    def _handle_error(self, message: Dict, error: SMTPSendError, attempts: int):
+        """临时错误释放认领并按退避时间重新排队，否则记为失败"""
+        if self.retry_policy.should_retry(error, attempts):
+            delay = self.retry_policy.next_delay(attempts)
+            if isinstance(error, CircuitOpenError):
+                delay = max(delay, error.retry_after)
+            logger.info(
+                f"邮件将在 {delay:.0f} 秒后重试（第 {attempts} 次失败）: {message['recipient_email']} - {error}"
+            )
+            self.outbox.schedule_retry(message['outbox_id'], attempts, delay, str(error), release=True)
+            return
+        text = str(error) if attempts <= 1 else f"{error}（共尝试 {attempts} 次）"
+        self.outbox.record_delivery(message, False, text, self.worker_id)
+
+    def _send(self, message: Dict, prepared_messages: Dict, timings: SendTimings):
+        sender_config = message['sender_config']
+        content_type = message.get('content_type', 'html')
+        prepared_key = (sender_config['email'],) + self.email_service.prepared_message_key(
+            message.get('attachments'), content_type
+        )
+        prepared = prepared_messages.get(prepared_key)
+        if prepared is None:
+            with timings.measure(PHASE_PREPARE):
+                prepared = self.email_service.prepare_message(
+                    sender_config, message.get('attachments'), content_type=content_type
+                )
+            prepared_messages[prepared_key] = prepared
+        self.email_service.deliver_prepared(
+            prepared,
+            sender_config,
+            recipient_email=message['recipient_email'],
+            recipient_name=message['recipient_name'],
+            subject=message['subject'],
+            content=message['content'],
+            timings=timings
+        )
+
+
+def _worker_main(batch_size: int, poll_interval: float):
+    """单个发送进程的入口"""
+    from app import create_app
+
+    app = create_app(recover_outbox=False)
+    worker = OutboxWorker(app, batch_size=batch_size, poll_interval=poll_interval)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='发件箱发送进程')
+    parser.add_argument('--processes', type=int, default=1, help='并行的发送进程数')
+    parser.add_argument('--batch-size', type=int, default=20, help='每次认领的邮件数')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='发件箱为空时的等待间隔（秒）')
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        _worker_main(args.batch_size, args.poll_interval)
+        return
+
+    processes = [
+        multiprocessing.Process(
+            target=_worker_main, args=(args.batch_size, args.poll_interval), name=f'outbox-worker-{i}'
+        )
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def _terminate(*_):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+预构建邮件
+批量发送时同一批邮件的发件人、附件完全相同，只有收件人、主题和正文不同。
+PreparedMessage 在批次开始时一次性生成公共邮件头与附件部分的序列化字节，
+每个收件人只需生成个性化的 To/Subject/正文，再与共享字节拼接后逐块写入SMTP的DATA流
+"""
+
+import re
+import uuid
+import logging
+from email import policy
+from email.generator import BytesGenerator
+from email.header import Header
+from email.mime.text import MIMEText
+from io import BytesIO
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from backend.attachment_cache import StreamingAttachment
+
+logger = logging.getLogger(__name__)
+
+# SMTP线路格式：CRLF换行，沿用 email 库默认的 compat32 行为
+SMTP_POLICY = policy.compat32.clone(linesep='\r\n')
+
+_LEADING_DOT = re.compile(rb'(?m)^\.')
+
+
+def serialize_part(part) -> bytes:
+    """把MIME部分序列化为SMTP线路格式字节（CRLF结尾，行首点号已转义）"""
+    buffer = BytesIO()
+    BytesGenerator(buffer, mangle_from_=False, policy=SMTP_POLICY).flatten(part)
+    data = buffer.getvalue()
+    if not data.endswith(b'\r\n'):
+        data += b'\r\n'
+    return _LEADING_DOT.sub(b'..', data)
+
+
+def _header_line(name: str, value: str) -> bytes:
+    return f"{name}: {value}\r\n".encode('ascii')
+
+
+def _encode_display_name(name: str, header_name: str) -> str:
+    """编码显示名称；名称较长被折行时同样使用CRLF（DATA流不经过smtplib的换行修正）"""
+    return Header(name, 'utf-8', header_name=header_name).encode(linesep='\r\n')
+
+
+class MessageSkeleton:
+    """
+    生成个性化部分（邮件头、正文）所需的最小状态，不含附件数据，
+    体积很小，可以序列化后交给渲染进程使用
+    """
+
+    def __init__(self, common_headers: bytes, delimiter: bytes, content_type: str):
+        self.common_headers = common_headers
+        self.delimiter = delimiter
+        self.content_type = content_type
+
+    def render_head(self, recipient_email: str, recipient_name: str, subject: str, content: str) -> bytes:
+        """生成某个收件人的邮件头与正文部分（含正文前的分隔线），可直接写入DATA流"""
+        to_value = f"{_encode_display_name(recipient_name, 'To')} <{recipient_email}>"
+        subject_value = Header(subject, 'utf-8', header_name='Subject').encode(linesep='\r\n')
+        return b''.join([
+            self.common_headers,
+            _header_line('To', to_value),
+            _header_line('Subject', subject_value),
+            b'\r\n',
+            self.delimiter,
+            serialize_part(MIMEText(content, self.content_type, 'utf-8')),
+        ])
+
+
+def render_heads(skeleton: MessageSkeleton, items: Sequence[Tuple[str, str, str, str]]) -> List[bytes]:
+    """批量生成个性化部分，供渲染进程调用；items 为 (收件邮箱, 收件人姓名, 主题, 正文)"""
+    return [skeleton.render_head(*item) for item in items]
+
+
+class PreparedMessage:
+    """发件人与附件固定、收件人相关内容按需填充的邮件"""
+
+    def __init__(self, sender_email: str, sender_name: str,
+                 attachment_parts: List, content_type: str = 'html'):
+        """
+        Args:
+            sender_email: 发件人邮箱
+            sender_name: 发件人显示名称
+            attachment_parts: 已构建的附件MIME对象列表（在此处序列化一次），
+                或 StreamingAttachment（仅序列化附件头，内容在发送时从磁盘流式编码）
+            content_type: 正文类型 'html' 或 'plain'
+        """
+        self.sender_email = sender_email
+        self.content_type = content_type
+        self.boundary = f"==============={uuid.uuid4().hex}=="
+        self.attachment_count = len(attachment_parts)
+
+        # 公共邮件头：与 MIMEMultipart 默认生成的头部顺序一致
+        self._delimiter = f"--{self.boundary}\r\n".encode('ascii')
+        self.skeleton = MessageSkeleton(
+            b''.join([
+                _header_line('Content-Type', f'multipart/mixed; boundary="{self.boundary}"'),
+                _header_line('MIME-Version', '1.0'),
+                _header_line('From', f"{_encode_display_name(sender_name, 'From')} <{sender_email}>"),
+            ]),
+            self._delimiter,
+            content_type
+        )
+        self._close_delimiter = f"--{self.boundary}--\r\n".encode('ascii')
+        # 每个附件为 (序列化后的附件头或完整附件, 流式附件或None)
+        self._attachments = []
+        for part in attachment_parts:
+            if isinstance(part, StreamingAttachment):
+                self._attachments.append((serialize_part(part.header_part()), part))
+            else:
+                self._attachments.append((serialize_part(part), None))
+
+    @property
+    def attachment_bytes(self) -> int:
+        """常驻内存的附件字节数（流式附件只计附件头）"""
+        return sum(len(data) for data, _ in self._attachments)
+
+    def render(self, recipient_email: str, recipient_name: str,
+               subject: str, content: str, head: Optional[bytes] = None) -> Iterator[bytes]:
+        """
+        逐块生成某个收件人的完整邮件字节（可直接写入DATA流）
+
+        附件部分直接产出批次共享的字节对象，不会为每个收件人复制或重新编码；
+        流式附件在此时从磁盘分块读取编码，每次只有一块在内存中
+
+        Args:
+            head: 已由渲染进程生成的个性化部分（skeleton.render_head 的结果），为None时在此生成
+        """
+        if head is None:
+            head = self.skeleton.render_head(recipient_email, recipient_name, subject, content)
+        yield head
+        for data, streaming in self._attachments:
+            yield self._delimiter
+            yield data
+            if streaming is not None:
+                yield from streaming.iter_chunks()
+        yield self._close_delimiter
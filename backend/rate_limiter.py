@@ -0,0 +1,191 @@
+"""
+发件限速器
+按 (发件账号, SMTP主机) 维护令牌桶：rate 控制平均速率，burst 控制突发量，daily_cap 控制每日上限。
+令牌桶与发送节奏保存在数据库中，每次预订都是一条带条件的原子UPDATE：
+Web进程与多个发送进程（python -m backend.outbox_worker --processes N）共享同一份配额，重启后继续沿用
+"""
+
+import time
+import logging
+from datetime import timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+
+from backend.database import db
+from backend.models.rate_limit_bucket import RateLimitBucket
+from backend.models.send_pacing import SendPacing
+from backend.utils.timezone_utils import get_shanghai_now
+
+logger = logging.getLogger(__name__)
+
+# 未识别服务商时的默认限额
+DEFAULT_RATE_LIMIT = {'per_hour': 60, 'burst': 5, 'daily_cap': 500}
+
+
+class DailyQuotaExceeded(Exception):
+    """发件人当日额度已用尽"""
+
+    def __init__(self, key: str, reset_in: float):
+        self.key = key
+        self.reset_in = reset_in
+        super().__init__(f"发件人今日发送量已达上限，约 {int(reset_in // 3600)} 小时后重置")
+
+
+def _today() -> str:
+    """上海时区的当前日期，作为每日额度的统计周期"""
+    return get_shanghai_now().strftime('%Y-%m-%d')
+
+
+def _seconds_until_tomorrow() -> float:
+    now = get_shanghai_now()
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds()
+
+
+def _write_returning(statement, attempts: int = 3):
+    """执行一条带 RETURNING 的写语句并提交，返回第一行（条件不满足时为None）；SQLite写锁竞争时回滚后重试"""
+    for attempt in range(attempts):
+        try:
+            row = db.session.execute(statement).first()
+            db.session.commit()
+            return row
+        except OperationalError:
+            db.session.rollback()
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.1 * (attempt + 1))
+
+
+class RateLimiter:
+    """按发件账号与SMTP主机限速（令牌桶保存在数据库中，进程间共享；需在应用上下文中调用）"""
+
+    @staticmethod
+    def make_key(sender_email: str, smtp_host: str) -> str:
+        return f"{sender_email.lower()}|{smtp_host.lower()}"
+
+    def reserve(self, key: str, limits: Dict) -> float:
+        """
+        为一封邮件预订发送配额。
+        令牌按经过的时间补充（不超过 burst），允许透支为负数，后续调用方按透支量排队等待；
+        补充、扣减与每日计数在同一条语句中完成，多个进程并发预订时不会重复使用同一份配额
+
+        Args:
+            key: 限速键（make_key 生成）
+            limits: {'per_hour': 每小时速率, 'burst': 突发量, 'daily_cap': 每日上限}
+
+        Returns:
+            float: 需要等待的秒数
+
+        Raises:
+            DailyQuotaExceeded: 当日额度已用尽
+        """
+        rate, burst, daily_cap = self._normalize(limits)
+        if daily_cap is not None and daily_cap <= 0:
+            raise DailyQuotaExceeded(key, _seconds_until_tomorrow())
+        now = time.time()
+        today = _today()
+        bucket = RateLimitBucket
+        refilled = func.min(float(burst), bucket.tokens + func.max(0.0, now - bucket.updated_at) * rate)
+        statement = insert(bucket).values(
+            key=key, tokens=burst - 1.0, updated_at=now, day=today, day_count=1
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[bucket.key],
+            set_={
+                'tokens': refilled - 1,
+                'updated_at': func.max(bucket.updated_at, now),
+                'day': today,
+                'day_count': case((bucket.day == today, bucket.day_count + 1), else_=1)
+            },
+            # 当日额度已用尽时不更新（也不扣令牌），RETURNING 不返回行
+            where=(bucket.day != today) | (bucket.day_count < daily_cap) if daily_cap is not None else None
+        ).returning(bucket.tokens)
+        row = _write_returning(statement)
+        if row is None:
+            raise DailyQuotaExceeded(key, _seconds_until_tomorrow())
+        tokens = row[0]
+        if tokens >= 0:
+            return 0.0
+        wait = -tokens / rate
+        logger.debug(f"发件限速: {key} 需等待 {wait:.1f} 秒")
+        return wait
+
+    def remaining_today(self, key: str, limits: Dict) -> Optional[int]:
+        """当日剩余额度（无每日上限时返回None）"""
+        _, _, daily_cap = self._normalize(limits)
+        if daily_cap is None:
+            return None
+        row = db.session.execute(
+            select(RateLimitBucket.day, RateLimitBucket.day_count).where(RateLimitBucket.key == key)
+        ).first()
+        used = row.day_count if row is not None and row.day == _today() else 0
+        return max(0, daily_cap - used)
+
+    @staticmethod
+    def _normalize(limits: Dict):
+        """(每秒速率, 突发量, 每日上限)"""
+        per_hour = limits.get('per_hour', DEFAULT_RATE_LIMIT['per_hour'])
+        burst = limits.get('burst', DEFAULT_RATE_LIMIT['burst'])
+        daily_cap = limits.get('daily_cap', DEFAULT_RATE_LIMIT['daily_cap'])
+        return (
+            max(float(per_hour), 0.001) / 3600.0,
+            max(int(burst), 1),
+            int(daily_cap) if daily_cap is not None else None
+        )
+
+
+class SendPacer:
+    """
+    发送节奏：同一节奏键两次开始发送之间至少间隔 interval 秒（如批量任务的 send_interval）。
+    下一次最早开始时间保存在数据库中，同一任务的邮件分散在Web进程与多个发送进程中发送时同样生效
+    """
+
+    # 每预订这么多次顺带清理一次早已过期的节奏记录
+    PRUNE_EVERY = 500
+
+    def __init__(self):
+        self._reservations = 0
+
+    @staticmethod
+    def job_key(job_id: str, sender_email: str) -> str:
+        return f"job:{job_id}|{sender_email.lower()}"
+
+    def reserve(self, key: str, interval: float, earliest: float) -> float:
+        """
+        预订一次发送：开始时间不早于 earliest，且与该键上一次预订的开始时间相隔至少 interval 秒
+
+        Args:
+            earliest: 调用方最早可以开始的时间（Unix时间戳，如加上限速等待后的时刻）
+
+        Returns:
+            float: 预订到的开始时间（Unix时间戳）
+        """
+        if interval <= 0:
+            return earliest
+        statement = insert(SendPacing).values(key=key, next_start=earliest + interval)
+        statement = statement.on_conflict_do_update(
+            index_elements=[SendPacing.key],
+            set_={'next_start': func.max(SendPacing.next_start, earliest) + interval}
+        ).returning(SendPacing.next_start)
+        start = _write_returning(statement)[0] - interval
+        self._reservations += 1
+        if self._reservations % self.PRUNE_EVERY == 0:
+            self.prune()
+        return start
+
+    def prune(self, max_age: float = 86400):
+        """删除一天前就已过期的节奏记录（已结束任务遗留的行）"""
+        try:
+            db.session.execute(delete(SendPacing).where(SendPacing.next_start < time.time() - max_age))
+            db.session.commit()
+        except OperationalError as e:
+            db.session.rollback()
+            logger.debug(f"清理发送节奏记录时数据库繁忙: {e}")
+
+
+# 进程级限速器与发送节奏（状态均在数据库中，多个实例共享同一份数据）
+rate_limiter = RateLimiter()
+send_pacer = SendPacer()
@@ -0,0 +1,213 @@
+"""
+多进程邮件渲染
+个性化部分（邮件头编码、正文序列化与编码）是纯CPU工作，在发送线程中执行时受GIL限制。
+RenderPool 维护一个进程池，RenderAhead 按待发送队列的取出顺序提前把一批邮件交给渲染进程，
+渲染结果保存在有界的预取窗口中，发送线程取用一封就补充一封：渲染与网络发送重叠进行，
+多核主机上渲染可以并行使用多个核心。附件字节不经过渲染进程，仍由发送线程直接写出
+"""
+
+import contextlib
+import itertools
+import multiprocessing
+import threading
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+from backend.config import Config
+from backend.domain_throttle import DomainQueue
+from backend.prepared_message import MessageSkeleton, render_heads
+
+logger = logging.getLogger(__name__)
+
+
+class RenderPool:
+    """懒创建的渲染进程池（进程级共享）"""
+
+    def __init__(self, processes: int = 0, min_batch: int = 50,
+                 window: int = 64, chunk_size: int = 8):
+        """
+        Args:
+            processes: 渲染进程数，0 表示不使用进程池（在发送线程中渲染）
+            min_batch: 邮件数达到该值的发送通道才使用进程池，小批量不值得跨进程传输
+            window: 每个发送通道最多提前渲染的邮件数（预取窗口，限制内存占用）
+            chunk_size: 每个渲染任务包含的邮件数，减少进程间通信次数
+        """
+        self.processes = max(0, int(processes))
+        self.min_batch = max(1, int(min_batch))
+        self.window = max(1, int(window))
+        self.chunk_size = max(1, int(chunk_size))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0
+
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Web进程中有多个线程，使用 spawn 避免 fork 复制锁状态
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context('spawn')
+                )
+                logger.info(f"邮件渲染进程池已启动: {self.processes} 个进程")
+            return self._executor
+
+    def reset(self, broken: ProcessPoolExecutor):
+        """渲染进程异常退出后丢弃进程池，下次使用时重建"""
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def render_ahead(self, pending: DomainQueue, skeleton_for: Callable[[Dict], MessageSkeleton],
+                     lock=None) -> Optional['RenderAhead']:
+        """
+        为一个发送通道创建预渲染器；未启用或邮件数不足时返回None
+
+        Args:
+            pending: 通道的待发送队列，按其当前的取出顺序预渲染
+            skeleton_for: 邮件 -> 预构建骨架
+            lock: 保护 pending 的锁（通道的多个连接线程同时取出邮件时传入）
+        """
+        if not self.enabled or len(pending) < self.min_batch:
+            return None
+        return RenderAhead(self, pending, skeleton_for, lock)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+class RenderAhead:
+    """
+    单个发送通道的预渲染器（可由该通道的多个连接线程共用）。
+    按待发送队列当前的取出顺序提交渲染任务，最多保留 window 封已提交未取用的邮件；
+    队列的轮转顺序因域名限制而变化时，预渲染随之调整
+    """
+
+    def __init__(self, pool: RenderPool, pending: DomainQueue,
+                 skeleton_for: Callable[[Dict], MessageSkeleton], lock=None):
+        self._pool = pool
+        self._pending = pending
+        self._pending_lock = lock if lock is not None else contextlib.nullcontext()
+        self._skeleton_for = skeleton_for
+        # 渲染令牌 -> (渲染任务, 任务内序号)；令牌在提交时写入邮件，进程内唯一
+        self._submitted: Dict[int, Tuple[Future, int]] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # 构建失败或进程池不可用后不再提交，剩余邮件在发送线程中渲染
+        self._stopped = False
+        # 保护预取窗口的簿记；取用结果与在发送线程中渲染都在锁外进行
+        self._lock = threading.Lock()
+        self._fill()
+
+    def head(self, message: Dict) -> bytes:
+        """
+        取得邮件的个性化部分：渲染进程已完成的直接取用，
+        未提交（如重试邮件）、尚未完成或渲染失败的在当前线程生成，发送线程不会因渲染而停顿
+        """
+        with self._lock:
+            entry = self._release(message)
+        head = None
+        # 渲染结果尚未就绪（如进程池仍在启动、渲染落后于发送）时不等待，直接在发送线程中渲染
+        if entry is not None and entry[0].done():
+            future, index = entry
+            try:
+                head = future.result()[index]
+            except BrokenProcessPool as e:
+                logger.warning(f"渲染进程异常退出，改为在发送线程中渲染: {e}")
+                if self._executor is not None:
+                    self._pool.reset(self._executor)
+            except Exception as e:
+                logger.warning(f"邮件渲染失败，改为在发送线程中渲染: {message['recipient_email']} - {e!r}")
+        if head is None:
+            head = self._skeleton_for(message).render_head(*_render_item(message))
+        self._fill()
+        return head
+
+    def discard(self, message: Dict):
+        """
+        邮件未经 head 取用就已处理（如熔断时记为失败或改为稍后重试）：释放它在预取窗口中的位置。
+        对已取用的邮件调用没有影响；之后再次发送（重试）时在发送线程中渲染
+        """
+        with self._lock:
+            self._release(message)
+        self._fill()
+
+    def _release(self, message: Dict) -> Optional[Tuple[Future, int]]:
+        """取出邮件已提交的渲染任务；未提交或已取用过的返回None"""
+        token = message.get(_TOKEN_KEY)
+        return None if token is None else self._submitted.pop(token, None)
+
+    def _fill(self):
+        """按待发送队列当前的取出顺序补充渲染任务，直到预取窗口填满"""
+        if self._stopped:
+            return
+        # 先在队列锁内取出候选邮件，再获取预取窗口的锁，两把锁不会嵌套持有
+        with self._pending_lock:
+            upcoming = self._pending.upcoming(self._pool.window)
+        with self._lock:
+            batch = []
+            skeleton = None
+            for message in upcoming:
+                if self._stopped or len(self._submitted) + len(batch) >= self._pool.window:
+                    break
+                if message.get(_TOKEN_KEY) in self._submitted:
+                    continue
+                try:
+                    message_skeleton = self._skeleton_for(message)
+                except Exception as e:
+                    # 邮件构建失败（如附件缺失）：停止预渲染，错误在发送该邮件时按原流程记录
+                    logger.warning(f"预渲染准备邮件失败，停止预渲染: {message['recipient_email']} - {e!r}")
+                    self._stopped = True
+                    break
+                # 同一任务中的邮件必须使用同一个骨架（同一附件组合）
+                if batch and (message_skeleton is not skeleton or len(batch) >= self._pool.chunk_size):
+                    self._submit(skeleton, batch)
+                    batch = []
+                skeleton = message_skeleton
+                batch.append(message)
+            if batch:
+                self._submit(skeleton, batch)
+
+    def _submit(self, skeleton: MessageSkeleton, batch: List[Dict]):
+        if self._stopped:
+            return
+        try:
+            self._executor = self._pool.executor()
+            future = self._executor.submit(render_heads, skeleton, [_render_item(message) for message in batch])
+        except (BrokenProcessPool, RuntimeError) as e:
+            # 进程池不可用：剩余邮件都在发送线程中渲染
+            logger.warning(f"渲染进程池不可用，改为在发送线程中渲染: {e}")
+            self._stopped = True
+            return
+        for index, message in enumerate(batch):
+            token = message.get(_TOKEN_KEY)
+            if token is None:
+                token = message[_TOKEN_KEY] = next(_tokens)
+            self._submitted[token] = (future, index)
+
+    def close(self):
+        """发送结束（或任务取消）时取消尚未开始的渲染任务"""
+        with self._lock:
+            self._stopped = True
+            for future, _ in self._submitted.values():
+                future.cancel()
+            self._submitted.clear()
+
+
+# 邮件字典中保存渲染令牌的键；令牌在进程内唯一，同一封邮件重试或换到其他预渲染器时不会错配
+_TOKEN_KEY = '_render_token'
+_tokens = itertools.count()
+
+
+def _render_item(message: Dict) -> Tuple[str, str, str, str]:
+    return message['recipient_email'], message['recipient_name'], message['subject'], message['content']
+
+
+# 进程级渲染进程池，配置见 Config.RENDER_PROCESSES / RENDER_MIN_BATCH / RENDER_WINDOW
+render_pool = RenderPool(Config.RENDER_PROCESSES, Config.RENDER_MIN_BATCH, Config.RENDER_WINDOW)
@@ -0,0 +1,170 @@
+"""
+发送记录重发
+按筛选条件（状态、发件人、日期范围、记录ID）分批读取 EmailRecord，还原为批量任务的邮件字典，
+交给批量发送流程（发件箱、连接池复用、限速与重试）重新投递。
+邮件字典带 email_record_id，发送结果直接更新原记录，不会产生重复记录
+"""
+
+import json
+import re
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import exists
+
+from backend.database import Professor, EmailRecord
+from backend.models.outbox_message import OutboxMessage
+from backend.models.user_profile import UserProfile
+
+logger = logging.getLogger(__name__)
+
+# 允许重发的记录状态（pending 表示正在发送中，不允许重发）
+RESENDABLE_STATUSES = ('failed', 'sent')
+
+_HTML_TAG = re.compile(r'<(html|body|p|div|br|span|table|h[1-6])\b', re.IGNORECASE)
+
+
+class ResendService:
+    """发送记录重发服务（需在应用上下文中调用）"""
+
+    def __init__(self, batch_size: int = 500):
+        """
+        Args:
+            batch_size: 每次从数据库读取的记录数
+        """
+        self.batch_size = batch_size
+
+    def build_query(self, status: str = 'failed', sender_email: Optional[str] = None,
+                    date_from: Optional[str] = None, date_to: Optional[str] = None,
+                    record_ids: Optional[List[int]] = None):
+        """
+        构建待重发记录的查询
+
+        Args:
+            status: 记录状态，'failed' 或 'sent'
+            sender_email: 发件邮箱
+            date_from / date_to: 创建日期范围（YYYY-MM-DD，包含当天）
+            record_ids: 记录ID列表
+
+        Raises:
+            ValueError: 筛选条件无效
+        """
+        if status not in RESENDABLE_STATUSES:
+            raise ValueError(f'不支持重发该状态的记录: {status}')
+        query = EmailRecord.query.filter(EmailRecord.status == status)
+        if sender_email:
+            query = query.filter(EmailRecord.sender_email == sender_email)
+        if date_from:
+            query = query.filter(EmailRecord.created_at >= datetime.strptime(date_from, '%Y-%m-%d'))
+        if date_to:
+            # 包含整天
+            date_to_obj = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
+            query = query.filter(EmailRecord.created_at < date_to_obj)
+        if record_ids:
+            query = query.filter(EmailRecord.id.in_([int(record_id) for record_id in record_ids]))
+        # 已在发件箱中等待重发的记录不再重复提交
+        query = query.filter(~exists().where(
+            OutboxMessage.email_record_id == EmailRecord.id,
+            OutboxMessage.status == 'pending'
+        ))
+        return query.order_by(EmailRecord.id)
+
+    def build_messages(self, query) -> Tuple[List[Dict], List[Dict]]:
+        """
+        分批读取记录并还原为邮件字典
+
+        Returns:
+            Tuple[List[Dict], List[Dict]]: (邮件列表, 无法重发的记录)
+        """
+        messages = []
+        failed_emails = []
+        sender_configs: Dict[str, Optional[Dict]] = {}
+        professors: Dict[int, Optional[Professor]] = {}
+        batch = []
+        for record in query.yield_per(self.batch_size):
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self._build_batch(batch, messages, failed_emails, sender_configs, professors)
+                batch = []
+        if batch:
+            self._build_batch(batch, messages, failed_emails, sender_configs, professors)
+        return messages, failed_emails
+
+    def build_message(self, record: EmailRecord) -> Tuple[Optional[Dict], Optional[str]]:
+        """还原单条记录，返回 (邮件字典, 错误信息)"""
+        messages, failed_emails = [], []
+        self._build_batch([record], messages, failed_emails, {}, {})
+        if failed_emails:
+            return None, failed_emails[0]['error']
+        return messages[0], None
+
+    def _build_batch(self, records: List[EmailRecord], messages: List[Dict], failed_emails: List[Dict],
+                     sender_configs: Dict[str, Optional[Dict]], professors: Dict[int, Optional[Professor]]):
+        # 批量任务发出的记录在发件箱中保留了正文类型与附件
+        originals = {
+            row.email_record_id: row
+            for row in OutboxMessage.query.filter(
+                OutboxMessage.email_record_id.in_([record.id for record in records])
+            )
+        }
+        missing = {record.professor_id for record in records} - professors.keys()
+        if missing:
+            for professor in Professor.query.filter(Professor.id.in_(missing)):
+                professors[professor.id] = professor
+
+        for record in records:
+            professor = professors.get(record.professor_id)
+            if record.sender_email not in sender_configs:
+                sender_configs[record.sender_email] = self._sender_config(record.sender_email)
+            sender_config = sender_configs[record.sender_email]
+            error = None
+            if professor is None:
+                error = '教授信息不存在'
+            elif sender_config is None:
+                error = f'发件用户不存在或未激活: {record.sender_email}'
+            if error:
+                failed_emails.append({
+                    'record_id': record.id,
+                    'professor_id': record.professor_id,
+                    'professor_name': professor.name if professor else f'ID:{record.professor_id}',
+                    'email': professor.email if professor else 'unknown',
+                    'error': error
+                })
+                continue
+
+            original = originals.get(record.id)
+            if original is not None:
+                content_type = original.content_type
+                attachments = json.loads(original.attachments or '[]')
+            else:
+                # 单封发送的记录没有保存正文类型与附件，按内容判断类型
+                content_type = 'html' if _HTML_TAG.search(record.content or '') else 'plain'
+                attachments = []
+            messages.append({
+                'email_record_id': record.id,
+                'professor_id': professor.id,
+                'recipient_email': professor.email,
+                'recipient_name': professor.name,
+                'subject': record.subject,
+                'content': record.content,
+                'sender_config': sender_config,
+                'attachments': attachments,
+                'content_type': content_type
+            })
+
+    @staticmethod
+    def _sender_config(sender_email: Optional[str]) -> Optional[Dict]:
+        if not sender_email:
+            return None
+        profile = UserProfile.query.filter_by(email=sender_email, is_active=True).first()
+        if profile is None:
+            return None
+        return {
+            'user_id': profile.id,
+            'email': profile.email,
+            'name': profile.name,
+            'password': profile.email_password,
+            'smtp_server': profile.smtp_server,
+            'smtp_port': profile.smtp_port
+        }
@@ -0,0 +1,74 @@
+"""
+定时发送调度器
+按到期时间维护最小堆，调度线程在条件变量上等待到最早的到期时刻，
+新加入更早的条目时立即唤醒重新计算等待时间，不做轮询
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import logging
+from typing import Callable, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledDispatcher:
+    """最小堆定时调度器：插入、取出均为 O(log n)"""
+
+    def __init__(self, callback: Callable[[Hashable], None], name: str = 'send-scheduler'):
+        """
+        Args:
+            callback: 条目到期时在调度线程中调用，参数为 schedule() 时传入的 key
+            name: 调度线程名称
+        """
+        self._callback = callback
+        self._name = name
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, due_at: float, key: Hashable):
+        """
+        加入一个定时条目
+
+        Args:
+            due_at: 到期时间（time.time() 时间戳）
+            key: 到期时传给回调的标识
+        """
+        with self._condition:
+            entry = (due_at, next(self._sequence), key)
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=self._name, daemon=True)
+                self._thread.start()
+            # 新条目成为堆顶时唤醒调度线程，按新的最早到期时间重新等待
+            if self._heap[0] is entry:
+                self._condition.notify()
+
+    def next_due(self) -> Optional[float]:
+        with self._condition:
+            return self._heap[0][0] if self._heap else None
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._heap)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    delay = self._heap[0][0] - time.time()
+                    if delay <= 0:
+                        _, _, key = heapq.heappop(self._heap)
+                        break
+                    self._condition.wait(delay)
+            try:
+                self._callback(key)
+            except Exception as e:
+                logger.exception(f"定时任务执行出错: {key} - {e}")
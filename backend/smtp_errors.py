@@ -0,0 +1,95 @@
+"""
+SMTP发送错误分类与重试策略
+临时错误（4xx响应、连接断开、超时）可以稍后重试；
+永久错误（5xx响应、认证失败、收件人被拒）重试也不会成功，直接记为失败
+"""
+
+import random
+import smtplib
+import socket
+from typing import Optional
+
+
+class SMTPSendError(Exception):
+    """经过分类的邮件发送错误"""
+
+    def __init__(self, message: str, code: Optional[int] = None, temporary: bool = False):
+        self.code = code
+        self.message = message
+        self.temporary = temporary
+        super().__init__(str(self))
+
+    def __str__(self) -> str:
+        if self.code:
+            return f"SMTP {self.code}: {self.message}"
+        return self.message
+
+
+def _decode(text) -> str:
+    if isinstance(text, bytes):
+        return text.decode('utf-8', 'replace')
+    return str(text)
+
+
+def _code_is_temporary(code: Optional[int]) -> bool:
+    return code is not None and 400 <= code < 500
+
+
+def classify_smtp_error(error: Exception) -> SMTPSendError:
+    """
+    将发送过程中的异常转换为 SMTPSendError
+
+    Args:
+        error: smtplib 或网络层抛出的异常
+
+    Returns:
+        SMTPSendError: 包含SMTP响应码、响应文本及是否可重试
+    """
+    if isinstance(error, SMTPSendError):
+        return error
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # 单收件人发送：取第一个被拒收件人的响应
+        code, text = next(iter(error.recipients.values()), (None, '收件人被拒绝'))
+        return SMTPSendError(_decode(text), code, _code_is_temporary(code))
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 含认证错误：454等临时错误可重试，535等凭据错误不可重试
+        return SMTPSendError(_decode(error.smtp_error), error.smtp_code, _code_is_temporary(error.smtp_code))
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return SMTPSendError(f"服务器断开连接: {error}", temporary=True)
+    if isinstance(error, (socket.timeout, TimeoutError)):
+        return SMTPSendError(f"连接超时: {error}", temporary=True)
+    if isinstance(error, (ConnectionError, socket.gaierror)):
+        return SMTPSendError(f"网络连接失败: {error!r}", temporary=True)
+    if isinstance(error, smtplib.SMTPException):
+        return SMTPSendError(str(error) or error.__class__.__name__)
+    if isinstance(error, OSError):
+        return SMTPSendError(f"网络错误: {error!r}", temporary=True)
+    return SMTPSendError(f"{error.__class__.__name__}: {error}")
+
+
+class RetryPolicy:
+    """指数退避重试策略（带随机抖动，避免大量邮件在同一时刻重试）"""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 30.0,
+                 max_delay: float = 900.0, jitter: float = 0.5):
+        """
+        Args:
+            max_attempts: 最多尝试次数（包含首次发送）
+            base_delay: 首次重试前的基础等待（秒），之后每次翻倍
+            max_delay: 单次等待上限（秒）
+            jitter: 随机抖动比例，实际等待在 [delay*(1-jitter), delay] 之间
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = max(0.0, float(base_delay))
+        self.max_delay = max(self.base_delay, float(max_delay))
+        self.jitter = min(max(float(jitter), 0.0), 1.0)
+
+    def should_retry(self, error: SMTPSendError, attempt: int) -> bool:
+        """attempt 为已尝试次数"""
+        return error.temporary and attempt < self.max_attempts
+
+    def next_delay(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待秒数"""
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, attempt - 1)))
+        return delay * (1 - self.jitter * random.random())
+
@@ -0,0 +1,213 @@
+"""
+SMTP发送耗时统计
+每封邮件按阶段计时（连接、TLS握手、AUTH、MAIL/RCPT、DATA传输、QUIT，以及本地的邮件构建与限速等待），
+按 (SMTP服务器, 发件邮箱) 汇总为延迟直方图，用于判断批量发送慢在网络、服务商限速还是本地邮件构建
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# 阶段名称（按一次发送的先后顺序）
+PHASE_PREPARE = 'prepare'          # 构建邮件骨架与附件编码（预构建缓存未命中时）
+PHASE_RATE_WAIT = 'rate_wait'      # 等待发件人令牌桶
+PHASE_PACING_WAIT = 'pacing_wait'  # 等待任务设置的发送间隔
+PHASE_CONNECT = 'connect'          # DNS解析、TCP连接与服务器问候
+PHASE_TLS = 'tls'                  # TLS握手（SSL直连或STARTTLS）
+PHASE_AUTH = 'auth'                # EHLO与AUTH登录
+PHASE_ENVELOPE = 'envelope'        # MAIL FROM / RCPT TO / DATA 命令
+PHASE_RENDER = 'render'            # 逐块生成邮件内容（个性化正文、附件编码）
+PHASE_DATA = 'data'                # 邮件内容写入socket并等待服务器确认
+PHASE_QUIT = 'quit'                # 关闭连接
+PHASE_TOTAL = 'total'              # 单封邮件发送总耗时（不含等待）
+
+PHASES = (
+    PHASE_PREPARE, PHASE_RATE_WAIT, PHASE_PACING_WAIT, PHASE_CONNECT, PHASE_TLS, PHASE_AUTH,
+    PHASE_ENVELOPE, PHASE_RENDER, PHASE_DATA, PHASE_QUIT, PHASE_TOTAL
+)
+
+# 直方图桶上界（毫秒），最后一个桶收纳超过 30 秒的样本
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class SendTimings:
+    """单封邮件各阶段的耗时（秒），同一阶段多次计时会累加"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def add(self, phase: str, seconds: float):
+        if seconds > 0:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def timed_chunks(self, chunks: Iterable[bytes], phase: str = PHASE_RENDER) -> Iterator[bytes]:
+        """包装邮件内容迭代器，将生成每一块所花的时间计入 phase"""
+        iterator = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                self.add(phase, time.perf_counter() - start)
+                return
+            self.add(phase, time.perf_counter() - start)
+            yield chunk
+
+    def get(self, phase: str, default: float = 0.0) -> float:
+        return self.phases.get(phase, default)
+
+    def to_dict(self) -> Dict[str, float]:
+        """各阶段耗时（毫秒）"""
+        return {phase: round(seconds * 1000, 2) for phase, seconds in self.phases.items()}
+
+
+class LatencyHistogram:
+    """固定分桶的延迟直方图（非线程安全，由调用方加锁）"""
+
+    def __init__(self, buckets: Tuple[int, ...] = BUCKETS_MS):
+        self.buckets = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q: float) -> float:
+        """近似分位数（毫秒）：取样本所在桶的上界，最后一个桶取最大值"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return float(min(self.buckets[i], self.max)) if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self, include_buckets: bool = False) -> Dict:
+        data = {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 2) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.5), 2),
+            'p95_ms': round(self.percentile(0.95), 2),
+            'p99_ms': round(self.percentile(0.99), 2),
+            'max_ms': round(self.max, 2),
+            'total_ms': round(self.total, 2)
+        }
+        if include_buckets:
+            # 按上界升序排列，le_ms 为 None 的最后一桶收纳超出最大上界的样本
+            data['buckets'] = [
+                {'le_ms': bound, 'count': count}
+                for bound, count in zip(self.buckets + (None,), self.counts)
+            ]
+        return data
+
+
+class PhaseHistograms:
+    """按阶段分组的延迟直方图（线程安全）"""
+
+    def __init__(self):
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, timings: SendTimings):
+        with self._lock:
+            for phase, seconds in timings.phases.items():
+                self._observe_locked(phase, seconds)
+
+    def observe_phase(self, phase: str, seconds: float):
+        with self._lock:
+            self._observe_locked(phase, seconds)
+
+    def _observe_locked(self, phase: str, seconds: float):
+        histogram = self._histograms.get(phase)
+        if histogram is None:
+            histogram = self._histograms[phase] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def to_dict(self, include_buckets: bool = False) -> Dict[str, Dict]:
+        with self._lock:
+            order = {phase: i for i, phase in enumerate(PHASES)}
+            return {
+                phase: self._histograms[phase].to_dict(include_buckets)
+                for phase in sorted(self._histograms, key=lambda p: order.get(p, len(order)))
+            }
+
+
+class SMTPMetrics:
+    """按 (SMTP服务器, 发件邮箱) 汇总的发送耗时与结果计数（进程内）"""
+
+    def __init__(self):
+        self._phases: Dict[Tuple[str, str], PhaseHistograms] = {}
+        self._results: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def observe(self, host: str, sender: str, timings: SendTimings, success: Optional[bool] = None):
+        """
+        记录一封邮件的各阶段耗时
+
+        Args:
+            success: 发送结果，None 表示只记录耗时（如关闭连接）
+        """
+        key = ((host or '').lower(), (sender or '').lower())
+        with self._lock:
+            histograms = self._phases.get(key)
+            if histograms is None:
+                histograms = self._phases[key] = PhaseHistograms()
+                self._results[key] = {'sent': 0, 'failed': 0}
+            if success is not None:
+                self._results[key]['sent' if success else 'failed'] += 1
+        histograms.observe(timings)
+
+    def observe_phase(self, host: str, sender: str, phase: str, seconds: float):
+        timings = SendTimings()
+        timings.add(phase, seconds)
+        self.observe(host, sender, timings)
+
+    def snapshot(self, include_buckets: bool = False) -> Dict:
+        with self._lock:
+            items = [(key, histograms, dict(self._results.get(key, {})))
+                     for key, histograms in self._phases.items()]
+        return {
+            'since': self.started_at,
+            'channels': [
+                {
+                    'host': host,
+                    'sender': sender,
+                    **results,
+                    'phases': histograms.to_dict(include_buckets)
+                }
+                for (host, sender), histograms, results in sorted(items, key=lambda item: item[0])
+            ]
+        }
+
+    def reset(self):
+        with self._lock:
+            self._phases.clear()
+            self._results.clear()
+            self.started_at = time.time()
+
+
+# 进程级发送耗时统计，通过 /api/metrics 查询
+smtp_metrics = SMTPMetrics()
@@ -0,0 +1,488 @@
+"""
+SMTP连接池
+按 (smtp_server, port, 发件邮箱, 安全模式) 复用已认证的SMTP会话，
+避免批量发送时每封邮件都重新进行 TCP/TLS 握手与 AUTH 登录
+"""
+
+import hashlib
+import smtplib
+import socket
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from backend.config import Config
+from backend.smtp_metrics import (
+    PHASE_AUTH, PHASE_CONNECT, PHASE_DATA, PHASE_ENVELOPE, PHASE_QUIT, PHASE_RENDER, PHASE_TLS,
+    SendTimings, smtp_metrics
+)
+
+logger = logging.getLogger(__name__)
+
+# 连接池键：(smtp_server, port, sender_email, security)
+PoolKey = Tuple[str, int, str, str]
+
+# 说明连接本身已不可用（需要丢弃并重连）的异常
+CONNECTION_ERRORS = (
+    smtplib.SMTPServerDisconnected,
+    ConnectionError,
+    TimeoutError,
+    OSError,
+)
+
+
+def is_connection_error(error: Exception) -> bool:
+    """
+    连接本身已不可用的错误（连接断开、网络错误、服务器以421关闭连接）。
+    smtplib 的异常都是 OSError 的子类，收件人被拒、内容被拒等SMTP应答不属于此类，连接仍可RSET后复用
+    """
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code == 421
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return any(code == 421 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, CONNECTION_ERRORS)
+
+
+# DATA阶段合并写入socket的大小：减少小块写入的系统调用，结束符与最后一块一同发出
+DATA_WRITE_BUFFER = 64 * 1024
+
+
+def send_data_stream(smtp: smtplib.SMTP, from_addr: str, to_addrs, chunks: Iterable[bytes],
+                     pipelining: bool = True, timings: Optional[SendTimings] = None) -> Dict:
+    """
+    与 smtplib.SMTP.sendmail 语义一致的发送过程，但DATA阶段逐块写入socket，
+    不需要先把整封邮件序列化为一个字符串。
+    服务器在EHLO中声明 PIPELINING（RFC 2920）时，MAIL FROM / RCPT TO / DATA 一次性写出后再依次读取响应，
+    每封邮件的网络往返由 2+收件人数 次降为 2 次（信封一次、邮件内容一次）
+
+    Args:
+        chunks: 邮件内容字节块，要求每块从行首开始、以CRLF结尾且已完成点号转义
+        pipelining: 是否在服务器支持时使用命令流水线
+        timings: 记录 envelope / data 阶段耗时（生成内容块的时间由调用方通过 timed_chunks 单独计入）
+
+    Returns:
+        Dict: 被拒收件人字典
+    """
+    if isinstance(to_addrs, str):
+        to_addrs = [to_addrs]
+    timings = timings or SendTimings()
+    with timings.measure(PHASE_ENVELOPE):
+        smtp.ehlo_or_helo_if_needed()
+        if pipelining and smtp.has_extn('pipelining'):
+            refused = _pipeline_envelope(smtp, from_addr, to_addrs)
+        else:
+            refused = _send_envelope(smtp, from_addr, to_addrs)
+
+    start = time.perf_counter()
+    rendered = timings.get(PHASE_RENDER)
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= DATA_WRITE_BUFFER:
+            smtp.send(bytes(buffer))
+            buffer.clear()
+    buffer += b'.\r\n'
+    smtp.send(bytes(buffer))
+    code, resp = smtp.getreply()
+    # DATA阶段：从开始写入到收到确认，减去生成内容块的时间（render 阶段）
+    timings.add(PHASE_DATA, time.perf_counter() - start - (timings.get(PHASE_RENDER) - rendered))
+    if code != 250:
+        if code == 421:
+            smtp.close()
+        else:
+            smtp._rset()
+        raise smtplib.SMTPDataError(code, resp)
+    return refused
+
+
+def _send_envelope(smtp: smtplib.SMTP, from_addr: str, to_addrs: List[str]) -> Dict:
+    """逐条发送 MAIL FROM / RCPT TO / DATA 并等待各自的响应，成功时返回被拒收件人字典"""
+    code, resp = smtp.mail(from_addr)
+    if code != 250:
+        if code == 421:
+            smtp.close()
+        else:
+            smtp._rset()
+        raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+    refused = {}
+    for addr in to_addrs:
+        code, resp = smtp.rcpt(addr)
+        if code not in (250, 251):
+            refused[addr] = (code, resp)
+        if code == 421:
+            smtp.close()
+            raise smtplib.SMTPRecipientsRefused(refused)
+    if len(refused) == len(to_addrs):
+        smtp._rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    smtp.putcmd('data')
+    code, resp = smtp.getreply()
+    if code != 354:
+        smtp._rset()
+        raise smtplib.SMTPDataError(code, resp)
+    return refused
+
+
+def _pipeline_envelope(smtp: smtplib.SMTP, from_addr: str, to_addrs: List[str]) -> Dict:
+    """
+    流水线发送信封：MAIL FROM、全部 RCPT TO 与 DATA 合并为一次写入，再按顺序读取全部响应。
+    任一命令失败时按与 _send_envelope 相同的异常类型报告；
+    若服务器在信封失败后仍接受了DATA，则先发送空内容结束本次事务再重置会话
+    """
+    commands = ['mail FROM:%s' % smtplib.quoteaddr(from_addr)]
+    commands.extend('rcpt TO:%s' % smtplib.quoteaddr(addr) for addr in to_addrs)
+    commands.append('data')
+    smtp.send(''.join(f'{command}\r\n' for command in commands))
+
+    mail_code, mail_resp = smtp.getreply()
+    refused = {}
+    data_code, data_resp = None, None
+    # 服务器以421应答后会关闭连接，之后的响应不再读取
+    closing = mail_code == 421
+    if not closing:
+        for addr in to_addrs:
+            code, resp = smtp.getreply()
+            if code not in (250, 251):
+                refused[addr] = (code, resp)
+            if code == 421:
+                closing = True
+                break
+    if not closing:
+        data_code, data_resp = smtp.getreply()
+        closing = data_code == 421
+
+    if closing:
+        smtp.close()
+    elif mail_code == 250 and len(refused) < len(to_addrs) and data_code == 354:
+        return refused
+    else:
+        if data_code == 354:
+            # 信封已失败但DATA被接受：以空内容结束事务（服务器会拒绝或丢弃）
+            smtp.send(b'.\r\n')
+            smtp.getreply()
+        smtp._rset()
+
+    if mail_code != 250:
+        raise smtplib.SMTPSenderRefused(mail_code, mail_resp, from_addr)
+    if refused and (closing or len(refused) == len(to_addrs)):
+        raise smtplib.SMTPRecipientsRefused(refused)
+    raise smtplib.SMTPDataError(data_code, data_resp)
+
+
+def _credential_fingerprint(password: str) -> str:
+    """计算凭据指纹，避免在池中明文比较/保存授权码"""
+    return hashlib.sha256((password or '').encode('utf-8')).hexdigest()
+
+
+class _TimedSMTP_SSL(smtplib.SMTP_SSL):
+    """在连接过程中单独统计TLS握手耗时的 SMTP_SSL"""
+
+    timings: Optional[SendTimings] = None
+
+    def _get_socket(self, host, port, timeout):
+        sock = smtplib.SMTP._get_socket(self, host, port, timeout)
+        start = time.perf_counter()
+        try:
+            return self.context.wrap_socket(sock, server_hostname=host)
+        finally:
+            if self.timings is not None:
+                self.timings.add(PHASE_TLS, time.perf_counter() - start)
+
+
+class PooledConnection:
+    """池化的SMTP连接"""
+
+    def __init__(self, key: PoolKey, smtp: smtplib.SMTP, credential: str):
+        self.key = key
+        self.smtp = smtp
+        self.credential = credential
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+        self.reused = False
+
+    @property
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_used
+
+    def close(self):
+        """关闭连接（优先发送QUIT，失败则直接关闭socket）"""
+        start = time.perf_counter()
+        try:
+            self.smtp.quit()
+        except Exception:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+        smtp_metrics.observe_phase(self.key[0], self.key[2], PHASE_QUIT, time.perf_counter() - start)
+
+
+class SMTPConnectionPool:
+    """SMTP连接池（线程安全）"""
+
+    def __init__(self,
+                 idle_timeout: float = 60,
+                 max_messages_per_connection: int = 100,
+                 max_idle_per_key: int = 4,
+                 liveness_check_after: float = 5,
+                 timeout: float = 30,
+                 pipelining: bool = True):
+        """
+        Args:
+            idle_timeout: 空闲连接的最长保留时间（秒），超时后关闭
+            max_messages_per_connection: 单个连接最多发送的邮件数，达到后关闭并重建
+            max_idle_per_key: 每个键最多保留的空闲连接数
+            liveness_check_after: 空闲超过该秒数的连接在复用前先发送NOOP探活
+            timeout: 建立连接时的socket超时（秒）
+            pipelining: 服务器支持 PIPELINING 时是否流水线发送信封命令
+        """
+        self.idle_timeout = idle_timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self.max_idle_per_key = max_idle_per_key
+        self.liveness_check_after = liveness_check_after
+        self.timeout = timeout
+        self.pipelining = pipelining
+        self._idle: Dict[PoolKey, List[PooledConnection]] = {}
+        # 正在预热（建立连接并登录）的键
+        self._warming: Dict[PoolKey, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(smtp_server: str, smtp_port: int, sender_email: str, security: str) -> PoolKey:
+        """生成连接池键"""
+        return (smtp_server.lower(), int(smtp_port), sender_email, security)
+
+    def acquire(self, key: PoolKey, password: str, timings: Optional[SendTimings] = None) -> PooledConnection:
+        """获取一个已认证的连接（优先复用空闲连接）；新建连接时的各阶段耗时计入 timings"""
+        credential = _credential_fingerprint(password)
+        waited = False
+        while True:
+            with self._lock:
+                idle = self._idle.get(key) or []
+                conn = idle.pop() if idle else None
+                warming = self._warming.get(key)
+            if conn is None:
+                # 该键正在预热：等待预热完成后复用其连接，而不是再做一次握手
+                if warming is not None and not waited:
+                    waited = True
+                    warming.wait(self.timeout)
+                    continue
+                break
+            # 凭据已变更或空闲过久：丢弃
+            if conn.credential != credential or conn.idle_seconds > self.idle_timeout:
+                conn.close()
+                continue
+            # 空闲一段时间后先NOOP探活
+            if conn.idle_seconds > self.liveness_check_after and not self._is_alive(conn):
+                conn.close()
+                continue
+            conn.reused = True
+            return conn
+        return self._connect(key, password, credential, timings)
+
+    def connect(self, key: PoolKey, password: str) -> PooledConnection:
+        """不复用空闲连接，新建一个连接并重新登录（用于强制验证凭据）；用完后 release 归还或 discard 丢弃"""
+        return self._connect(key, password, _credential_fingerprint(password))
+
+    def prewarm(self, key: PoolKey, password: str) -> bool:
+        """
+        提前建立并认证一个连接放入空闲池，供随后的发送直接复用
+
+        Returns:
+            bool: 是否新建了连接（已有空闲连接或正在预热时返回False）
+        """
+        with self._lock:
+            if self._idle.get(key) or key in self._warming:
+                return False
+            warming = self._warming[key] = threading.Event()
+        try:
+            conn = self._connect(key, password, _credential_fingerprint(password))
+            self.release(conn)
+        finally:
+            with self._lock:
+                self._warming.pop(key, None)
+            warming.set()
+        return True
+
+    def release(self, conn: PooledConnection, dirty: bool = False):
+        """
+        归还连接
+
+        Args:
+            conn: 连接对象
+            dirty: 本次事务未正常完成（如RCPT被拒），需先RSET重置会话状态
+        """
+        conn.last_used = time.monotonic()
+        if dirty:
+            try:
+                code, _ = conn.smtp.rset()
+                if code != 250:
+                    conn.close()
+                    return
+            except Exception:
+                conn.close()
+                return
+        if conn.messages_sent >= self.max_messages_per_connection:
+            logger.debug(f"SMTP连接达到单连接发送上限，关闭: {conn.key[0]}:{conn.key[1]}")
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(conn.key, [])
+            expired = self._prune_locked(idle)
+            if len(idle) < self.max_idle_per_key:
+                idle.append(conn)
+                conn = None
+        for stale in expired:
+            stale.close()
+        if conn is not None:
+            conn.close()
+
+    def discard(self, conn: PooledConnection):
+        """丢弃失效的连接"""
+        conn.close()
+
+    @contextmanager
+    def connection(self, key: PoolKey, password: str):
+        """以上下文方式借用连接，异常时丢弃或RSET后归还"""
+        conn = self.acquire(key, password)
+        try:
+            yield conn
+        except Exception as e:
+            if is_connection_error(e):
+                self.discard(conn)
+            else:
+                self.release(conn, dirty=True)
+            raise
+        else:
+            self.release(conn)
+
+    def sendmail(self, key: PoolKey, password: str, from_addr: str, to_addrs, msg) -> Dict:
+        """
+        通过池化连接发送邮件；复用的连接若已被服务器断开则自动重连重试一次
+
+        Returns:
+            Dict: smtplib.sendmail 返回的被拒收件人字典
+        """
+        return self._run_with_connection(
+            key, password, lambda smtp: smtp.sendmail(from_addr, to_addrs, msg)
+        )
+
+    def send_stream(self, key: PoolKey, password: str, from_addr: str, to_addrs,
+                    chunks_factory: Callable[[], Iterable[bytes]],
+                    timings: Optional[SendTimings] = None) -> Dict:
+        """
+        通过池化连接以流的方式发送邮件内容（不在内存中拼接完整邮件）
+
+        Args:
+            chunks_factory: 返回邮件内容字节块迭代器的函数（重连重试时会再次调用）
+            timings: 记录连接、TLS、AUTH、envelope、render、data 各阶段耗时
+
+        Returns:
+            Dict: 被拒收件人字典
+        """
+        timings = timings or SendTimings()
+        return self._run_with_connection(
+            key, password,
+            lambda smtp: send_data_stream(
+                smtp, from_addr, to_addrs, timings.timed_chunks(chunks_factory()), self.pipelining, timings
+            ),
+            timings
+        )
+
+    def _run_with_connection(self, key: PoolKey, password: str, action: Callable[[smtplib.SMTP], Dict],
+                             timings: Optional[SendTimings] = None) -> Dict:
+        """借用连接执行一次邮件事务；复用连接失效时重连重试一次"""
+        for attempt in range(2):
+            conn = self.acquire(key, password, timings)
+            try:
+                refused = action(conn.smtp)
+            except Exception as e:
+                if not is_connection_error(e):
+                    # 收件人或内容被拒：连接正常，RSET后归还，不重发
+                    self.release(conn, dirty=True)
+                    raise
+                self.discard(conn)
+                # 仅当失败的是复用连接时才重试：新连接失败说明服务器本身不可用
+                if attempt == 0 and conn.reused:
+                    logger.info(f"复用的SMTP连接已失效，重新连接: {key[0]}:{key[1]} - {e!r}")
+                    continue
+                raise
+            conn.messages_sent += 1
+            self.release(conn)
+            return refused
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        """连接池状态"""
+        with self._lock:
+            return {
+                'keys': len(self._idle),
+                'idle_connections': sum(len(v) for v in self._idle.values())
+            }
+
+    def _connect(self, key: PoolKey, password: str, credential: str,
+                 timings: Optional[SendTimings] = None) -> PooledConnection:
+        """建立新连接并完成TLS与登录"""
+        smtp_server, smtp_port, sender_email, security = key
+        timings = timings or SendTimings()
+        if security == 'SSL':
+            smtp = _TimedSMTP_SSL(timeout=self.timeout)
+            smtp.timings = timings
+        else:
+            smtp = smtplib.SMTP(timeout=self.timeout)
+        try:
+            start = time.perf_counter()
+            handshake = timings.get(PHASE_TLS)
+            smtp.connect(smtp_server, smtp_port)
+            # SSL直连时TLS握手发生在connect内部，已单独计入 tls 阶段
+            timings.add(PHASE_CONNECT, time.perf_counter() - start - (timings.get(PHASE_TLS) - handshake))
+            # 流水线写出的命令与邮件末尾的小数据块不必等待上一段的ACK（关闭Nagle）
+            smtp.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if security == 'STARTTLS':
+                with timings.measure(PHASE_TLS):
+                    smtp.starttls()
+            with timings.measure(PHASE_AUTH):
+                smtp.login(sender_email, password)
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+            raise
+        logger.debug(f"新建SMTP连接: {smtp_server}:{smtp_port} ({security})")
+        return PooledConnection(key, smtp, credential)
+
+    def _is_alive(self, conn: PooledConnection) -> bool:
+        """NOOP探活"""
+        try:
+            code, _ = conn.smtp.noop()
+            return code == 250
+        except Exception:
+            return False
+
+    def _prune_locked(self, idle: List[PooledConnection]) -> List[PooledConnection]:
+        """移除超时的空闲连接（需持有锁），返回待关闭的连接"""
+        expired = [c for c in idle if c.idle_seconds > self.idle_timeout]
+        for conn in expired:
+            idle.remove(conn)
+        return expired
+
+
+# 进程级共享连接池，供所有 EmailService 实例与批量路由复用；
+# 每个发件人保留的空闲连接数不少于批量任务同时使用的连接数（Config.SENDER_CONNECTIONS）
+smtp_pool = SMTPConnectionPool(max_idle_per_key=max(4, Config.SENDER_CONNECTIONS))
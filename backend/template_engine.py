@@ -0,0 +1,170 @@
+"""
+占位符模板编译
+邮件主题与正文中的 {{name}} 等占位符在模板编译时一次性解析为片段列表（原文片段与字段引用交替），
+每个收件人只需填入字段值后一次 join，不再对整段HTML逐个占位符 str.replace（每次都复制整个字符串）。
+编译结果按模板内容哈希缓存，同一模板在批量发送、预览中只解析一次。
+批量场景可用 render_columns 按列（每个字段一个值列表）一次生成全部收件人的结果
+"""
+
+import hashlib
+import re
+import threading
+import logging
+from collections import OrderedDict
+from itertools import repeat
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\{([A-Za-z_][A-Za-z0-9_]*)\}\}')
+
+# 列式字段值：每个收件人一个值的序列，或所有收件人共用的单个字符串（如日期、发件人）
+Column = Union[str, Sequence[Optional[str]]]
+
+
+class CompiledTemplate:
+    """
+    编译后的模板：pieces 为原文片段与占位位置交替的列表，slots 记录每个占位位置对应的字段。
+    未知占位符（不在给定字段集合中）在编译时并入原文片段，渲染时原样保留
+    """
+
+    __slots__ = ('source_hash', 'fields', 'unknown', '_pieces', '_slots')
+
+    def __init__(self, source: str, fields: Optional[Iterable[str]] = None):
+        known = None if fields is None else set(fields)
+        pieces: List[str] = []
+        slots: List[Tuple[int, str]] = []
+        unknown: List[str] = []
+        literal: List[str] = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(source):
+            field = match.group(1)
+            literal.append(source[position:match.start()])
+            position = match.end()
+            if known is not None and field not in known:
+                # 未知占位符当作原文
+                literal.append(match.group(0))
+                if field not in unknown:
+                    unknown.append(field)
+                continue
+            pieces.append(''.join(literal))
+            literal = []
+            slots.append((len(pieces), field))
+            pieces.append(match.group(0))
+        literal.append(source[position:])
+        pieces.append(''.join(literal))
+
+        self.source_hash = _source_hash(source)
+        self.fields = tuple(dict.fromkeys(field for _, field in slots))
+        self.unknown = tuple(unknown)
+        self._pieces = pieces
+        self._slots = slots
+
+    @property
+    def is_static(self) -> bool:
+        """模板中没有需要替换的字段"""
+        return not self._slots
+
+    def render(self, values: Dict[str, str]) -> str:
+        """填入字段值（缺少的字段保留占位符原文）"""
+        if not self._slots:
+            return self._pieces[0]
+        pieces = self._pieces.copy()
+        for index, field in self._slots:
+            value = values.get(field)
+            if value is not None:
+                pieces[index] = value
+        return ''.join(pieces)
+
+    def render_columns(self, columns: Dict[str, Column], count: int) -> List[str]:
+        """
+        按列批量渲染 count 个收件人：相邻的原文片段与共用值先合并为常量，
+        再把常量与各字段列按位置 zip 后逐行 join，整个过程不再逐个收件人查字典
+
+        Args:
+            columns: 字段名 -> 值列表（长度为 count，None 表示缺少该值，保留占位符原文）或共用字符串；
+                不在其中的字段保留占位符原文
+            count: 收件人数
+
+        Raises:
+            ValueError: 字段值列表长度与 count 不一致
+        """
+        if not self._slots:
+            return [self._pieces[0]] * count
+        slot_fields = dict(self._slots)
+        # 常量片段为 str，逐行取值的片段为 list
+        segments: List[Union[str, Sequence[str]]] = []
+        for index, piece in enumerate(self._pieces):
+            field = slot_fields.get(index)
+            value = piece if field is None else columns.get(field, piece)
+            if value is None:
+                value = piece
+            if not isinstance(value, str):
+                if len(value) != count:
+                    raise ValueError(f'字段 {field} 的值数量 {len(value)} 与收件人数 {count} 不一致')
+                if None in value:
+                    value = [piece if item is None else item for item in value]
+            if isinstance(value, str) and segments and isinstance(segments[-1], str):
+                segments[-1] += value
+            elif value != '':
+                segments.append(value)
+        if not segments:
+            return [''] * count
+        if len(segments) == 1:
+            only = segments[0]
+            return [only] * count if isinstance(only, str) else list(only)
+        return list(map(''.join, zip(*[
+            repeat(segment, count) if isinstance(segment, str) else segment for segment in segments
+        ])))
+
+
+def _source_hash(source: str) -> str:
+    return hashlib.blake2b(source.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class TemplateCache:
+    """按 (模板内容哈希, 字段集合) 缓存编译结果（LRU，线程安全）"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[tuple, CompiledTemplate]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compile(self, source: str, fields: Optional[Iterable[str]] = None) -> CompiledTemplate:
+        """
+        编译模板（命中缓存时直接返回）
+
+        Args:
+            source: 模板内容
+            fields: 可用字段名（不含花括号），None 表示模板中的所有占位符都视为字段；
+                不在其中的占位符作为未知占位符记录在 unknown 中，并输出警告
+        """
+        source = source or ''
+        field_key = None if fields is None else frozenset(fields)
+        key = (_source_hash(source), field_key)
+        with self._lock:
+            template = self._entries.get(key)
+            if template is not None:
+                self._entries.move_to_end(key)
+                return template
+        template = CompiledTemplate(source, field_key)
+        if template.unknown:
+            logger.warning(f"模板中包含未知占位符: {', '.join('{{' + name + '}}' for name in template.unknown)}")
+        with self._lock:
+            self._entries[key] = template
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# 进程级模板编译缓存
+template_cache = TemplateCache()
+
+
+def compile_template(source: str, fields: Optional[Iterable[str]] = None) -> CompiledTemplate:
+    """编译模板（使用进程级缓存）"""
+    return template_cache.compile(source, fields)
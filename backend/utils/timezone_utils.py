@@ -43,4 +43,21 @@ def to_shanghai_timezone(dt):
         dt = pytz.UTC.localize(dt)
     
     # 转换为上海时区
-    return dt.astimezone(SHANGHAI_TZ)
\ No newline at end of file
+    return dt.astimezone(SHANGHAI_TZ)
+
+def parse_shanghai_datetime(value):
+    """
+    解析用户输入的时间（如 '2024-09-01 08:30' 或 ISO 格式），返回用于数据库存储的UTC时间（naive）
+
+    未带时区的时间按上海时区理解；带时区的时间按其自身时区换算
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        text = str(value).strip().replace('Z', '+00:00')
+        dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = SHANGHAI_TZ.localize(dt)
+    return dt.astimezone(pytz.UTC).replace(tzinfo=None)
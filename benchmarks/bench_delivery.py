@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+发送链路基准测试
+以本地SMTP替身服务器代替真实服务商，按 收件人数 × 附件大小 × 注入延迟 的组合驱动以下发送入口：
+  send_email      EmailService.send_email 逐封发送
+  send_batch      EmailService.send_batch_emails 串行批量发送
+  route_batch     Flask测试客户端调用 /api/send-batch-emails（后台批量任务）
+  route_document  Flask测试客户端调用 /api/send-document-email（DOCX模板 + 后台批量任务）
+每个用例在独立子进程中运行（峰值内存互不影响），输出吞吐（封/秒）、单封发送耗时 p50/p99 与峰值RSS，
+结果保存为 JSON，可用 --compare 与之前（如上一个提交）的结果对比
+
+用法：
+  uv run benchmarks/bench_delivery.py --recipients 20,200 --attachment-kb 0,512 --latency 0,0.02
+  uv run benchmarks/bench_delivery.py --modes route_batch --defer-rate 0.05 --reject-rate 0.02
+  uv run benchmarks/bench_delivery.py --modes route_batch --latency 0.02 --connections 1,2,4
+  uv run benchmarks/bench_delivery.py --compare benchmarks/results/<之前的结果>.json
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.smtp_sink import SMTPSink
+
+MODES = ('send_email', 'send_batch', 'route_batch', 'route_document')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+SENDER_EMAIL = 'bench@bench.local'
+# 收件人分布在多个域名上，避免基准测量的是收件域名节流
+RECIPIENT_DOMAINS = 10
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        # Windows 无 resource 模块
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def case_key(case: Dict) -> str:
+    key = (f"{case['mode']}|n={case['recipients']}|att={case['attachment_kb']}KB|"
+           f"lat={case['latency'] * 1000:g}ms")
+    # 单连接用例沿用原来的键，便于与旧结果文件对比
+    if case.get('connections', 1) != 1:
+        key += f"|conn={case['connections']}"
+    return key
+
+
+# ---------------------------------------------------------------- 子进程：运行单个用例
+
+def _record_send_latency() -> List[float]:
+    """收集每封成功邮件的发送耗时（秒，与 /api/metrics 的 total 阶段相同口径）"""
+    from backend.smtp_metrics import PHASE_TOTAL, smtp_metrics
+
+    samples: List[float] = []
+    observe = smtp_metrics.observe
+
+    def recording_observe(host, sender, timings, success=None):
+        if success:
+            samples.append(timings.get(PHASE_TOTAL))
+        observe(host, sender, timings, success)
+
+    smtp_metrics.observe = recording_observe
+    return samples
+
+
+def _sender_config(host: str, port: int) -> Dict:
+    return {
+        'email': SENDER_EMAIL,
+        'name': 'Bench',
+        'password': 'bench',
+        'smtp_server': host,
+        'smtp_port': port
+    }
+
+
+def _run_service(case: Dict, host: str, port: int, attachment: Optional[str]) -> Dict:
+    from backend.email_service import EmailService
+
+    service = EmailService()
+    sender_config = _sender_config(host, port)
+    attachments = [attachment] if attachment else None
+    email_list = [
+        {
+            'recipient_email': f'prof{i}@dept{i % RECIPIENT_DOMAINS}.bench.edu',
+            'recipient_name': f'Professor {i}',
+            'subject': f'Benchmark {i}',
+            'content': f'<p>Dear Professor {i},</p><p>' + 'x' * 2000 + '</p>',
+            'attachments': attachments,
+            'content_type': 'html'
+        }
+        for i in range(case['recipients'])
+    ]
+    start = time.perf_counter()
+    if case['mode'] == 'send_email':
+        sent = 0
+        for info in email_list:
+            sent += service.send_email(
+                info['recipient_email'], info['recipient_name'], info['subject'], info['content'],
+                sender_config, attachments=attachments
+            )
+        stats = {'sent': sent, 'failed': len(email_list) - sent}
+    else:
+        result = service.send_batch_emails(email_list, sender_config, interval_seconds=0)
+        stats = {'sent': result['success'], 'failed': result['failed']}
+    stats['elapsed'] = time.perf_counter() - start
+    return stats
+
+
+def _run_route(case: Dict, host: str, port: int, attachment: Optional[str], workdir: str) -> Dict:
+    from app import create_app
+    from backend.database import db, Professor
+    from backend.models.user_file import UserFile
+    from backend.models.user_profile import UserProfile
+
+    app = create_app(recover_outbox=False)
+    client = app.test_client()
+    with app.app_context():
+        user = UserProfile(name='Bench', email=SENDER_EMAIL, email_password='bench',
+                           smtp_server=host, smtp_port=port)
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all([
+            Professor(name=f'Professor {i}', email=f'prof{i}@dept{i % RECIPIENT_DOMAINS}.bench.edu',
+                      university='Bench University', department=f'Dept {i % RECIPIENT_DOMAINS}')
+            for i in range(case['recipients'])
+        ])
+        attachment_ids = []
+        if attachment:
+            attachment_file = UserFile(user_id=user.id, file_name=os.path.basename(attachment),
+                                       file_path=attachment, file_type='other', file_extension='.bin')
+            db.session.add(attachment_file)
+            db.session.flush()
+            attachment_ids.append(attachment_file.id)
+        document_id = None
+        if case['mode'] == 'route_document':
+            from docx import Document
+
+            document_path = os.path.join(workdir, 'template.docx')
+            document = Document()
+            document.add_paragraph('尊敬的{{name}}教授：')
+            for _ in range(10):
+                document.add_paragraph('您好，' + '我对{{department}}的研究方向非常感兴趣。' * 10)
+            document.save(document_path)
+            template = UserFile(user_id=user.id, file_name='template.docx', file_path=document_path,
+                                file_type='cover_letter', file_extension='.docx')
+            db.session.add(template)
+            db.session.flush()
+            document_id = template.id
+        db.session.commit()
+        user_id = user.id
+        professors = [{'id': professor.id} for professor in Professor.query.all()]
+
+    start = time.perf_counter()
+    if case['mode'] == 'route_batch':
+        response = client.post('/api/send-batch-emails', json={
+            'professors': professors, 'subject': 'Benchmark {{name}}', 'personalize': True,
+            'content': 'Dear {{name}},\n' + 'x' * 2000, 'sender_id': user_id,
+            'send_interval': 0, 'attachment_file_ids': attachment_ids
+        })
+    else:
+        response = client.post('/api/send-document-email', json={
+            'professors': professors, 'documents': [{'id': document_id}], 'subject': 'Benchmark {{name}}',
+            'sender_id': user_id, 'send_interval': 0, 'attachments': attachment_ids
+        })
+    if response.status_code != 202:
+        raise RuntimeError(f'提交失败: {response.status_code} {response.get_json()}')
+    job_id = response.get_json()['job_id']
+    while True:
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        if job['finished']:
+            break
+        time.sleep(0.01)
+    return {'sent': job['sent'], 'failed': job['failed'], 'elapsed': time.perf_counter() - start}
+
+
+def run_case(case: Dict, host: str, port: int) -> Dict:
+    """在当前（子）进程中运行一个用例"""
+    workdir = tempfile.mkdtemp(prefix='bench-delivery-')
+    # 在导入应用模块之前设置：临时数据库与缓存目录（不写入仓库中的 uploads），
+    # 关闭收件域名间隔，重试等待缩短到毫秒级
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        'CONVERSION_CACHE_DIR': os.path.join(workdir, 'conversion_cache'),
+        'CONVERTED_FOLDER': os.path.join(workdir, 'converted'),
+        'CONSOLE_OUTPUT': 'false',
+        'DOMAIN_MIN_INTERVAL': '0',
+        'SEND_RETRY_BASE_DELAY': '0.05',
+        'SEND_RETRY_MAX_DELAY': '0.2',
+        'CIRCUIT_RESET_TIMEOUT': '0.5',
+        'SENDER_CONNECTIONS': str(case.get('connections', 1)),
+    })
+    logging.disable(logging.WARNING)
+
+    from backend.email_service import EmailService
+    from backend.rate_limiter import DEFAULT_RATE_LIMIT
+
+    # 基准测量的是发送链路本身，不受服务商每小时/每日限额约束
+    unlimited = {**DEFAULT_RATE_LIMIT, 'per_hour': 10 ** 9, 'burst': 10 ** 6, 'daily_cap': 10 ** 9}
+    EmailService.get_rate_limits = lambda self, sender_config: dict(unlimited)
+
+    attachment = None
+    if case['attachment_kb']:
+        attachment = os.path.join(workdir, 'attachment.bin')
+        with open(attachment, 'wb') as f:
+            f.write(os.urandom(case['attachment_kb'] * 1024))
+
+    samples = _record_send_latency()
+    if case['mode'].startswith('route_'):
+        stats = _run_route(case, host, port, attachment, workdir)
+    else:
+        stats = _run_service(case, host, port, attachment)
+
+    elapsed = stats.pop('elapsed')
+    return {
+        **case,
+        **stats,
+        'seconds': round(elapsed, 3),
+        'msgs_per_sec': round(stats['sent'] / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(_percentile(samples, 0.5) * 1000, 2),
+        'p99_ms': round(_percentile(samples, 0.99) * 1000, 2),
+        'peak_rss_mb': _peak_rss_mb()
+    }
+
+
+# ---------------------------------------------------------------- 主进程：组合用例、汇总与对比
+
+def _parse_list(text: str, cast) -> List:
+    return [cast(item) for item in text.split(',') if item.strip()]
+
+
+def _spawn_case(case: Dict, host: str, port: int) -> Dict:
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case), '--smtp', f'{host}:{port}'],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        raise RuntimeError(f'用例 {case_key(case)} 运行失败:\n{completed.stderr[-2000:]}')
+    return json.loads(lines[-1])
+
+
+def _print_table(results: List[Dict], baseline: Optional[Dict[str, Dict]] = None):
+    header = f"{'case':<48} {'sent':>6} {'failed':>6} {'msgs/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>7}"
+    if baseline is not None:
+        header += f" {'vs base':>8}"
+    print(header)
+    for result in results:
+        line = (f"{case_key(result):<48} {result['sent']:>6} {result['failed']:>6} {result['msgs_per_sec']:>9.1f} "
+                f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['peak_rss_mb'] or 0:>7.1f}")
+        if baseline is not None:
+            previous = baseline.get(case_key(result))
+            if previous and previous['msgs_per_sec']:
+                line += f" {result['msgs_per_sec'] / previous['msgs_per_sec']:>7.2f}x"
+            else:
+                line += f" {'-':>8}"
+        print(line)
+
+
+def main(args):
+    cases = [
+        {'mode': mode, 'recipients': recipients, 'attachment_kb': attachment_kb, 'latency': latency,
+         'connections': connections}
+        for mode, recipients, attachment_kb, latency, connections in itertools.product(
+            _parse_list(args.modes, str), _parse_list(args.recipients, int),
+            _parse_list(args.attachment_kb, int), _parse_list(args.latency, float),
+            _parse_list(args.connections, int)
+        )
+        # 连接数只作用于后台批量任务（route_*）
+        if connections == 1 or mode.startswith('route_')
+    ]
+    unknown = {case['mode'] for case in cases} - set(MODES)
+    if unknown:
+        raise SystemExit(f"未知的模式: {', '.join(sorted(unknown))}（可选 {', '.join(MODES)}）")
+
+    sink = SMTPSink(defer_rate=args.defer_rate, reject_rate=args.reject_rate,
+                    throttle_every=args.throttle_every, seed=args.seed)
+    host, port = sink.start_in_thread()
+    results = []
+    try:
+        for case in cases:
+            sink.latency = case['latency']
+            sink.reset_stats()
+            result = _spawn_case(case, host, port)
+            result['server'] = sink.stats()
+            results.append(result)
+            print(f"  {case_key(case)}: {result['msgs_per_sec']:.1f} msgs/s", file=sys.stderr)
+    finally:
+        sink.stop_thread()
+
+    report = {
+        'revision': _git_revision(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'faults': {'defer_rate': args.defer_rate, 'reject_rate': args.reject_rate,
+                   'throttle_every': args.throttle_every, 'seed': args.seed},
+        'results': results
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(
+            RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['revision'] or 'unknown'}.json"
+        )
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        baseline = {case_key(result): result for result in previous['results']}
+        print(f"baseline: {args.compare} (revision {previous.get('revision')})")
+    _print_table(results, baseline)
+    print(f"结果已保存: {output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='发送链路吞吐、延迟与内存基准')
+    parser.add_argument('--modes', default=','.join(MODES), help=f"逗号分隔的发送入口（{', '.join(MODES)}）")
+    parser.add_argument('--recipients', default='20,200', help='逗号分隔的收件人数')
+    parser.add_argument('--attachment-kb', default='0,512', help='逗号分隔的附件大小（KB，0 表示无附件）')
+    parser.add_argument('--latency', default='0,0.02', help='逗号分隔的替身服务器响应延迟（秒）')
+    parser.add_argument('--connections', default='1',
+                        help='逗号分隔的单个发件人同时使用的SMTP连接数（SENDER_CONNECTIONS，仅 route_* 模式）')
+    parser.add_argument('--defer-rate', type=float, default=0.0, help='RCPT 返回 451 的概率')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='RCPT 返回 550 的概率')
+    parser.add_argument('--throttle-every', type=int, default=0, help='每 N 个 MAIL 命令返回一次 421 并断开连接')
+    parser.add_argument('--seed', type=int, default=1, help='故障注入的随机种子')
+    parser.add_argument('--output', help='结果文件路径（默认 benchmarks/results/<时间>_<提交>.json）')
+    parser.add_argument('--compare', help='与之前保存的结果文件对比吞吐')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('--smtp', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        smtp_host, smtp_port = args.smtp.rsplit(':', 1)
+        print(json.dumps(run_case(json.loads(args.run_case), smtp_host, int(smtp_port))))
+    else:
+        main(args)
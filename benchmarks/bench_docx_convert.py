@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DOCX→HTML 转换基准测试
+生成 10 到 5000 个段落的合成文档（带格式的文本段落，每 50 段插入一个小表格），
+测量 DocumentService._convert_document_to_html 的耗时与每段耗时；
+转换按文档顺序单次遍历时，每段耗时应基本不随文档长度变化
+
+用法：uv run benchmarks/bench_docx_convert.py [--sizes 10,100,500,1000,2000,5000] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document
+from docx.shared import Pt
+
+from backend.document_service import DocumentService
+
+
+def build_document(paragraphs: int, table_every: int = 50) -> str:
+    """生成合成文档并保存到临时文件，返回文件路径"""
+    doc = Document()
+    for i in range(paragraphs):
+        if i % 10 == 0:
+            doc.add_heading(f'Section {i // 10}', level=2)
+            continue
+        paragraph = doc.add_paragraph(f'Dear {{{{name}}}}, paragraph {i}: ')
+        run = paragraph.add_run('research interests in {{research_direction}} ')
+        run.bold = True
+        run.font.size = Pt(11)
+        paragraph.add_run('lorem ipsum dolor sit amet ' * 4)
+        if table_every and i % table_every == table_every - 1:
+            table = doc.add_table(rows=3, cols=3)
+            for row_index, row in enumerate(table.rows):
+                for col_index, cell in enumerate(row.cells):
+                    cell.text = f'r{row_index}c{col_index}'
+    fd, path = tempfile.mkstemp(suffix='.docx')
+    os.close(fd)
+    doc.save(path)
+    return path
+
+
+def run(sizes, repeat: int):
+    service = DocumentService()
+    print(f"{'paragraphs':>10} {'ms':>10} {'us/para':>10}")
+    for size in sizes:
+        path = build_document(size)
+        try:
+            # 只测量转换本身，不含 .docx 解压与XML解析
+            doc = Document(path)
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                service._convert_document_to_html(doc)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{size:>10} {best * 1000:>10.1f} {best / size * 1e6:>10.1f}")
+        finally:
+            os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DOCX→HTML 转换基准测试')
+    parser.add_argument('--sizes', default='10,100,500,1000,2000,5000', help='文档段落数（逗号分隔）')
+    parser.add_argument('--repeat', type=int, default=3, help='每个文档的转换次数（取最快一次）')
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(',')], args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SMTP PIPELINING 基准测试
+通过同一个池化会话顺序发送一批邮件，比较逐条等待响应与流水线发送信封命令的耗时。
+替身服务器按命令到达时刻注入固定延迟，用于模拟与邮件服务商之间的网络往返（默认 50ms）
+
+用法：uv run benchmarks/bench_pipelining.py [--messages 100] [--latency 0.05] [--recipients 1]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.email_service import EmailService
+from backend.smtp_pool import SMTPConnectionPool
+from benchmarks.smtp_sink import SMTPSink
+
+
+def run(messages: int, latency: float, recipients: int):
+    sink = SMTPSink(latency=latency)
+    host, port = sink.start_in_thread()
+    sender_config = {
+        'email': 'bench@example.com',
+        'name': 'Bench',
+        'password': 'bench',
+        'smtp_server': host,
+        'smtp_port': port
+    }
+    to_addrs = [f'professor{i}@example.edu' for i in range(recipients)]
+
+    print(f"messages={messages} latency={latency * 1000:.0f}ms recipients/message={recipients}")
+    print(f"{'mode':>12} {'seconds':>10} {'ms/msg':>10} {'RTT/msg':>10}")
+    try:
+        for mode, pipelining in (('sequential', False), ('pipelining', True)):
+            pool = SMTPConnectionPool(pipelining=pipelining, liveness_check_after=3600)
+            service = EmailService(pool)
+            prepared = service.prepare_message(sender_config)
+            key = service.get_pool_key(sender_config)
+            # 预先建立连接并完成登录，只测量邮件事务本身
+            pool.release(pool.acquire(key, sender_config['password']))
+            received = sink.messages
+            start = time.perf_counter()
+            for i in range(messages):
+                pool.send_stream(
+                    key, sender_config['password'], sender_config['email'], to_addrs,
+                    lambda: prepared.render(to_addrs[0], 'Professor', f'Benchmark {i}', '<p>' + 'x' * 2000 + '</p>')
+                )
+            elapsed = time.perf_counter() - start
+            pool.close_all()
+            assert sink.messages - received == messages, '存在未送达的邮件'
+            per_message = elapsed / messages
+            rtt = f"{per_message / latency:.1f}" if latency else '-'
+            print(f"{mode:>12} {elapsed:>10.3f} {per_message * 1000:>10.1f} {rtt:>10}")
+    finally:
+        sink.stop_thread()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SMTP PIPELINING 基准')
+    parser.add_argument('--messages', type=int, default=100, help='每轮发送的邮件数')
+    parser.add_argument('--latency', type=float, default=0.05, help='模拟的网络往返延迟（秒）')
+    parser.add_argument('--recipients', type=int, default=1, help='每封邮件的收件人数')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    run(args.messages, args.latency, args.recipients)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地SMTP替身服务器（基于asyncio）
+接受任意AUTH凭据，丢弃收到的邮件，仅做计数；用于在不访问真实邮件服务商的情况下测量发送吞吐。
+可注入网络延迟、4xx 限流（RCPT 451、MAIL 421 断开连接）与 5xx 拒收，用于检验重试与熔断路径
+"""
+
+import asyncio
+import random
+import threading
+from collections import Counter
+from typing import List, Optional, Tuple
+
+
+class SMTPSink:
+    """最小化的ESMTP接收端"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 keep_messages: bool = False, pipelining: bool = True,
+                 defer_rate: float = 0.0, reject_rate: float = 0.0, throttle_every: int = 0,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            host: 监听地址
+            port: 监听端口（0表示随机分配）
+            latency: 每条响应前注入的延迟（秒），用于模拟网络往返与服务器处理时间。
+                延迟按每条命令的到达时刻计算，同一次写入的流水线命令的响应在一个往返后一同返回
+            keep_messages: 是否保留收到的邮件原文（已去除点号转义），用于校验邮件内容
+            pipelining: 是否在EHLO中声明 PIPELINING 扩展
+            defer_rate: RCPT 返回 451（临时错误，模拟服务商限流）的概率
+            reject_rate: RCPT 返回 550（永久拒收）的概率
+            throttle_every: 每收到 N 个 MAIL 命令，对第 N 个返回 421 并断开连接，0 表示不注入
+            seed: 故障注入的随机种子，便于复现
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.connections = 0
+        self.auths = 0
+        self.messages = 0
+        self.bytes_received = 0
+        self.keep_messages = keep_messages
+        self.received: List[bytes] = []
+        self.pipelining = pipelining
+        self.defer_rate = defer_rate
+        self.reject_rate = reject_rate
+        self.throttle_every = throttle_every
+        self._random = random.Random(seed)
+        self.mail_commands = 0
+        self.deferred = 0
+        self.rejected = 0
+        self.throttled = 0
+        # 各命令（EHLO、NOOP、RSET、QUIT 等）的接收次数
+        self.commands: Counter = Counter()
+        # 当前打开的连接，disconnect_all 从服务器端关闭它们
+        self._writers = set()
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def reset_stats(self):
+        """清空计数与保留的邮件（基准测试的各用例之间调用）"""
+        self.connections = 0
+        self.auths = 0
+        self.messages = 0
+        self.bytes_received = 0
+        self.mail_commands = 0
+        self.deferred = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.commands = Counter()
+        self.received = []
+
+    def stats(self) -> dict:
+        return {
+            'connections': self.connections,
+            'auths': self.auths,
+            'messages': self.messages,
+            'bytes_received': self.bytes_received,
+            'deferred': self.deferred,
+            'rejected': self.rejected,
+            'throttled': self.throttled
+        }
+
+    def _rcpt_reply(self) -> str:
+        roll = self._random.random()
+        if roll < self.reject_rate:
+            self.rejected += 1
+            return '550 5.1.1 Mailbox unavailable\r\n'
+        if roll < self.reject_rate + self.defer_rate:
+            self.deferred += 1
+            return '451 4.7.1 Too many messages, try again later\r\n'
+        return '250 OK\r\n'
+
+    async def _reply(self, writer: asyncio.StreamWriter, text: str):
+        if self.latency:
+            # 不阻塞后续命令的读取：已缓冲的流水线命令各自在到达后 latency 秒响应，顺序不变
+            asyncio.get_running_loop().call_later(self.latency, writer.write, text.encode('ascii'))
+            return
+        writer.write(text.encode('ascii'))
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self._writers.add(writer)
+        # 当前事务中被接受的收件人数
+        accepted = 0
+        try:
+            await self._reply(writer, '220 sink ESMTP ready\r\n')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('utf-8', 'replace').strip()
+                verb = command.split(' ', 1)[0].upper()
+                self.commands[verb] += 1
+                if verb in ('EHLO', 'HELO'):
+                    await self._reply(
+                        writer,
+                        '250-sink\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n'
+                        + ('250-PIPELINING\r\n' if self.pipelining else '')
+                        + '250 SIZE 33554432\r\n'
+                    )
+                elif verb == 'AUTH':
+                    self.auths += 1
+                    await self._reply(writer, '235 2.7.0 Authentication successful\r\n')
+                elif verb == 'MAIL':
+                    accepted = 0
+                    self.mail_commands += 1
+                    if self.throttle_every and self.mail_commands % self.throttle_every == 0:
+                        # 服务商按连接限流：拒绝并关闭连接
+                        self.throttled += 1
+                        await self._reply(writer, '421 4.7.0 Too many messages on this connection\r\n')
+                        break
+                    await self._reply(writer, '250 OK\r\n')
+                elif verb == 'RCPT':
+                    reply = self._rcpt_reply()
+                    if reply.startswith('250'):
+                        accepted += 1
+                    await self._reply(writer, reply)
+                elif verb in ('RSET', 'NOOP'):
+                    if verb == 'RSET':
+                        accepted = 0
+                    await self._reply(writer, '250 OK\r\n')
+                elif verb == 'DATA':
+                    if not accepted:
+                        await self._reply(writer, '554 5.5.1 No valid recipients\r\n')
+                        continue
+                    accepted = 0
+                    await self._reply(writer, '354 End data with <CR><LF>.<CR><LF>\r\n')
+                    lines = []
+                    while True:
+                        data_line = await reader.readline()
+                        if not data_line or data_line in (b'.\r\n', b'.\n'):
+                            break
+                        self.bytes_received += len(data_line)
+                        if self.keep_messages:
+                            lines.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                    self.messages += 1
+                    if self.keep_messages:
+                        self.received.append(b''.join(lines))
+                    await self._reply(writer, '250 OK queued\r\n')
+                elif verb == 'QUIT':
+                    await self._reply(writer, '221 Bye\r\n')
+                    break
+                else:
+                    await self._reply(writer, '502 Command not implemented\r\n')
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if self.latency:
+                # 等待已排期的响应写出后再关闭连接
+                await asyncio.sleep(self.latency)
+            self._writers.discard(writer)
+            writer.close()
+
+    async def start(self) -> Tuple[str, int]:
+        """在当前事件循环中启动，返回 (host, port)"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.host, self.port
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def start_in_thread(self) -> Tuple[str, int]:
+        """在后台线程中启动，便于同步代码（smtplib）调用"""
+        started = threading.Event()
+
+        def _run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.host, self.port
+
+    def disconnect_all(self):
+        """从服务器端关闭当前所有连接（不发送任何响应），模拟服务商回收空闲连接；需先 start_in_thread"""
+        async def _close():
+            writers = list(self._writers)
+            for writer in writers:
+                writer.close()
+            for writer in writers:
+                try:
+                    await writer.wait_closed()
+                except ConnectionError:
+                    pass
+
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result()
+
+    def stop_thread(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
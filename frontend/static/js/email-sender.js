@@ -150,7 +150,8 @@ class EmailSender {
             attachment_file_ids: selectedAttachmentIds,
             send_interval: parseInt(document.getElementById('send-interval')?.value) || 5,
             personalize: document.getElementById('personalize-emails')?.checked || false,
-            sender_id: document.getElementById('doc-sender-user')?.value || null
+            sender_id: document.getElementById('doc-sender-user')?.value || null,
+            scheduled_at: document.getElementById('doc-scheduled-at')?.value || null
         };
     }
 
@@ -167,7 +168,8 @@ class EmailSender {
             content: '', // HTML模板中没有doc-content元素
             send_interval: 5, // HTML模板中没有doc-send-interval元素，使用默认值
             attachments: selectedAttachments,
-            sender_id: document.getElementById('doc-sender-user')?.value || null
+            sender_id: document.getElementById('doc-sender-user')?.value || null,
+            scheduled_at: document.getElementById('doc-scheduled-at')?.value || null
         };
     }
 
@@ -381,24 +383,44 @@ class EmailSender {
         return response;
     }
 
-    // 发送批量邮件
+    // 发送批量邮件（后台任务，轮询直至完成）
     async sendBatchEmails(formData) {
         const response = await Utils.apiRequest('/api/send-batch-emails', {
             method: 'POST',
             body: JSON.stringify(formData)
         });
         
-        return response;
+        return this.waitForJob(response, 'batch');
     }
 
-    // 发送文档邮件
+    // 发送文档邮件（后台任务，轮询直至完成）
     async sendDocumentEmails(formData) {
         const response = await Utils.apiRequest('/api/send-document-email', {
             method: 'POST',
             body: JSON.stringify(formData)
         });
         
-        return response;
+        return this.waitForJob(response, 'document');
+    }
+
+    // 轮询批量任务进度，结束后返回最终统计（定时任务提交后直接返回，不在页面上等待）
+    async waitForJob(job, type, intervalMs = 2000) {
+        let current = job;
+        while (current && current.job_id && !current.finished && current.status !== 'scheduled') {
+            this.updateJobProgress(type, current);
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+            current = await Utils.apiRequest(`/api/jobs/${current.job_id}`);
+        }
+        return current;
+    }
+
+    // 在发送按钮上显示任务进度
+    updateJobProgress(type, job) {
+        const sendBtn = this.getSendButton(type);
+        if (!sendBtn) return;
+        const done = (job.sent || 0) + (job.failed || 0);
+        const eta = job.eta_seconds ? `，约剩 ${Math.ceil(job.eta_seconds)} 秒` : '';
+        sendBtn.innerHTML = `<span class="spinner-border spinner-border-sm me-1" role="status" aria-hidden="true"></span>发送中 ${done}/${job.total}${eta}`;
     }
 
     // 显示发送中状态
@@ -502,6 +524,10 @@ class EmailSender {
 
     // 处理批量发送结果
     handleBatchSendResult(result) {
+        if (result && result.status === 'scheduled') {
+            Utils.showAlert(`已设置定时发送：${result.scheduled_at}（北京时间），共 ${result.total} 封`, 'success');
+            return;
+        }
         let message = `批量发送完成！\n成功: ${result.success_count} 封\n失败: ${result.failed_count} 封`;
         
         if (result.failed_emails && result.failed_emails.length > 0) {
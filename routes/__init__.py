@@ -9,6 +9,8 @@ from .user_routes import user_bp
 from .file_routes import file_bp
 from .import_routes import import_bp
 from .settings_routes import settings_bp
+from .job_routes import job_bp
+from .metrics_routes import metrics_bp
 
 # 导出所有蓝图
 __all__ = [
@@ -19,5 +21,7 @@ __all__ = [
     'user_bp',
     'file_bp',
     'import_bp',
-    'settings_bp'
+    'settings_bp',
+    'job_bp',
+    'metrics_bp'
 ]
\ No newline at end of file
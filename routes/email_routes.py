@@ -1,14 +1,23 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, send_from_directory
 from backend.database import db, Professor, EmailRecord
 from backend.email_service import EmailService
+from backend.batch_jobs import BatchJob, batch_job_manager, distribute_by_weight
+from backend.batch_render import load_departments, load_professors, render_batch
+from backend.campaign_export import EXPORT_FORMATS, CampaignExporter
+from backend.config import Config
+from backend.outbox import outbox
+from backend.rate_limiter import rate_limiter
+from backend.resend_service import RESENDABLE_STATUSES, ResendService
+from backend.smtp_errors import SMTPSendError
+from backend.template_engine import compile_template
 from backend.document_service import DocumentService
 from backend.models.user_profile import UserProfile
 from backend.models.user_file import UserFile
-from backend.utils.timezone_utils import get_shanghai_utcnow
+from backend.utils.timezone_utils import get_shanghai_utcnow, parse_shanghai_datetime
 from datetime import datetime
 import logging
+import math
 import os
-import time
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +27,85 @@ email_bp = Blueprint('email', __name__, url_prefix='/api')
 # 初始化服务
 email_service = EmailService()
 document_service = DocumentService()
+campaign_exporter = CampaignExporter(email_service)
+resend_service = ResendService()
+
+# 批量发送（纯文本、文档邮件）支持的占位符字段
+BATCH_TEMPLATE_FIELDS = ('name', 'date', 'university', 'department', 'research_direction')
+# 文档邮件预览支持的占位符字段
+PREVIEW_TEMPLATE_FIELDS = (
+    'name', 'professor_name', 'university', 'department', 'research_area', 'research_direction',
+    'date', 'sender_name', 'sender_email', 'school', 'college'
+)
+
+
+def _unknown_placeholders(*templates):
+    """汇总模板中的未知占位符（保持出现顺序）"""
+    return list(dict.fromkeys(name for template in templates for name in template.unknown))
+
+
+def _batch_columns(professors, current_date):
+    """批量发送占位符字段的列式取值（每个字段一个列表，日期为共用值）"""
+    return {
+        'name': [professor.name or '' for professor in professors],
+        'date': current_date,
+        'university': [professor.university or '' for professor in professors],
+        'department': [professor.department or '' for professor in professors],
+        'research_direction': [professor.research_area or '' for professor in professors]
+    }
+
+
+def _render_messages(professors, templates, current_date, build, chunk_size=None):
+    """
+    按列渲染主题与正文并逐封生成邮件字典
+
+    Args:
+        professors: 教授行列表
+        templates: (主题模板, 正文模板)；为None时不做个性化替换，build 收到 None
+        current_date: 日期占位符的取值
+        build: (序号, 教授, 主题, 正文) -> 邮件字典
+        chunk_size: 每次渲染的教授数，None 表示一次渲染全部；导出时分块渲染，内存中只保留一块的结果
+    """
+    chunk_size = chunk_size or len(professors) or 1
+    for start in range(0, len(professors), chunk_size):
+        chunk = professors[start:start + chunk_size]
+        if templates is None:
+            subjects = contents = [None] * len(chunk)
+        else:
+            subjects, contents = render_batch(list(templates), _batch_columns(chunk, current_date), len(chunk))
+        for offset, (professor, subject, content) in enumerate(zip(chunk, subjects, contents)):
+            yield build(start + offset, professor, subject, content)
+
+
+def _sender_weights(sender_weights, sender_profiles):
+    """
+    解析 sender_weights（按发件人ID的字典，或与 sender_ids 等长的列表；缺省时平均分配）
+
+    Returns:
+        (权重列表, None) 或 (None, 错误信息)；权重须为非负有限数字
+    """
+    if sender_weights is None:
+        return [1] * len(sender_profiles), None
+    if isinstance(sender_weights, dict):
+        weights = [sender_weights.get(str(p.id), sender_weights.get(p.id, 1)) for p in sender_profiles]
+    elif isinstance(sender_weights, list) and len(sender_weights) == len(sender_profiles):
+        weights = sender_weights
+    else:
+        return None, 'sender_weights 必须是按发件人ID的字典，或与 sender_ids 等长的列表'
+    for weight in weights:
+        if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not math.isfinite(weight) or weight < 0:
+            return None, f'发件人权重必须是非负数字: {weight!r}'
+    return weights, None
+
+
+def _missing_professor(professor_data):
+    return {
+        'professor_id': professor_data.get('id'),
+        'professor_name': professor_data.get('name', f"ID:{professor_data.get('id')}"),
+        'email': professor_data.get('email', 'unknown'),
+        'error': '教授信息不存在'
+    }
+
 
 # 统一的时间序列化函数
 def _serialize_datetime(dt):
@@ -36,6 +124,32 @@ def _serialize_datetime(dt):
         return dt.isoformat()
 
 
+def _resolve_attachments(file_ids, sender_name):
+    """根据文件ID列表一次性查询附件（批量发送时在循环外调用，避免每位教授重复查询）"""
+    attachments = []
+    if not isinstance(file_ids, list) or not file_ids:
+        return attachments
+    for file_id in file_ids:
+        try:
+            # 仅处理整数ID
+            file_id_int = int(file_id)
+        except Exception:
+            continue
+        user_file = UserFile.query.filter_by(id=file_id_int, is_active=True).first()
+        if user_file and os.path.exists(user_file.file_path):
+            # 生成显示名称
+            display_name = user_file.file_name
+            if user_file.file_type == 'resume':
+                # 简历类型自动重命名
+                ext_part = os.path.splitext(user_file.file_name)[1]
+                display_name = f"简历-{sender_name}{ext_part}"
+            attachments.append({
+                'file_path': user_file.file_path,
+                'display_name': display_name
+            })
+    return attachments
+
+
 @email_bp.route('/send-email', methods=['POST'])
 def send_email():
     """发送单封邮件（支持指定 sender_id，缺省回退默认用户；兼容 content/email_content 字段；支持 recipient_email 回退定位教授）"""
@@ -97,23 +211,7 @@ def send_email():
         }
         
         # 处理附件
-        attachment_file_ids = data.get('attachment_file_ids', [])
-        attachments = []
-        if attachment_file_ids:
-            for file_id in attachment_file_ids:
-                user_file = UserFile.query.filter_by(id=file_id, is_active=True).first()
-                if user_file and os.path.exists(user_file.file_path):
-                    # 生成显示名称
-                    display_name = user_file.file_name
-                    if user_file.file_type == 'resume':
-                        # 简历类型自动重命名
-                        ext_part = os.path.splitext(user_file.file_name)[1]
-                        display_name = f"简历-{sender_user.name}{ext_part}"
-                    
-                    attachments.append({
-                        'file_path': user_file.file_path,
-                        'display_name': display_name
-                    })
+        attachments = _resolve_attachments(data.get('attachment_file_ids', []), sender_user.name)
         
         # 邮件格式
         content_type = 'html'
@@ -123,15 +221,20 @@ def send_email():
         elif content_source == 'docx':
             content_type = 'html'
         
-        success = email_service.send_email(
-            recipient_email=professor.email,
-            recipient_name=professor.name,
-            subject=subject,
-            content=email_content,
-            sender_config=sender_config,
-            attachments=attachments,
-            content_type=content_type
-        )
+        error = None
+        try:
+            prepared = email_service.prepare_message(sender_config, attachments, content_type=content_type)
+            email_service.deliver_prepared(
+                prepared,
+                sender_config,
+                recipient_email=professor.email,
+                recipient_name=professor.name,
+                subject=subject,
+                content=email_content
+            )
+        except SMTPSendError as e:
+            error = e
+        success = error is None
         
         # 记录发送结果
         email_record = EmailRecord(
@@ -139,6 +242,7 @@ def send_email():
             subject=subject,
             content=email_content,
             status='sent' if success else 'failed',
+            error_message=None if success else str(error),
             sender_name=sender_user.name,
             sender_email=sender_user.email,
             sent_at=get_shanghai_utcnow() if success else None
@@ -149,7 +253,12 @@ def send_email():
         if success:
             return jsonify({'message': '邮件发送成功', 'success': True})
         else:
-            return jsonify({'error': '邮件发送失败', 'success': False}), 500
+            return jsonify({
+                'error': f'邮件发送失败: {error}',
+                'smtp_code': error.code,
+                'temporary': error.temporary,
+                'success': False
+            }), 500
 
     except Exception as e:
         logger.error(f"发送邮件失败: {e}")
@@ -195,90 +304,67 @@ def generate_document_email():
                     template_filename = user_file.file_name
                     break  # 只使用第一个文档作为模板
         
-        # 获取教授信息
+        # 获取教授信息（按列批量查询，不逐个读取ORM对象）
+        items = []
+        for item in selected_professors:
+            try:
+                items.append(int(item))
+            except (ValueError, TypeError):
+                # 批量模式：可能传递学院名称或教授ID，不是数字的作为学院名称查询；单个模式只按教授ID查询
+                if batch_mode:
+                    items.append(str(item))
+        by_id = load_professors(item for item in items if isinstance(item, int))
+        by_department = load_departments(item for item in items if isinstance(item, str))
         professors = []
-        if batch_mode:
-            # 批量模式：可能传递学院名称或教授ID
-            for item in selected_professors:
-                # 尝试作为教授ID查询
-                try:
-                    prof_id = int(item)
-                    professor = db.session.get(Professor, prof_id)
-                    if professor:
-                        professors.append({
-                            'name': professor.name,
-                            'university': professor.university,
-                            'department': professor.department,
-                            'research_area': professor.research_area
-                        })
-                except (ValueError, TypeError):
-                    # 如果不是数字，则作为学院名称查询
-                    dept_professors = Professor.query.filter_by(department=item).all()
-                    for professor in dept_professors:
-                        professors.append({
-                            'name': professor.name,
-                            'university': professor.university,
-                            'department': professor.department,
-                            'research_area': professor.research_area
-                        })
-        else:
-            # 单个模式：根据教授ID查询
-            for prof_id in selected_professors:
-                professor = db.session.get(Professor, prof_id)
-                if professor:
-                    professors.append({
-                        'name': professor.name,
-                        'university': professor.university,
-                        'department': professor.department,
-                        'research_area': professor.research_area
-                    })
+        for item in items:
+            if isinstance(item, int):
+                if item in by_id:
+                    professors.append(by_id[item])
+            else:
+                professors.extend(by_department[item])
         
         # 检查是否有模板内容
         if not template_content:
             return jsonify({'success': False, 'message': '无法读取套磁信文档内容'}), 400
         
-        # 生成邮件预览（为每个教授生成）
-        email_previews = []
-        
         # 获取当前日期
         current_date = datetime.now().strftime('%Y年%m月%d日')
         
-        for professor in professors:
-            # 准备替换字典
-            replacements = {
-                '{{name}}': professor['name'],
-                '{{professor_name}}': professor['name'],
-                '{{university}}': professor['university'] or '',
-                '{{department}}': professor['department'] or '',
-                '{{research_area}}': professor['research_area'] or '',
-                '{{research_direction}}': professor['research_area'] or '',
-                '{{date}}': current_date,
-                '{{sender_name}}': sender.name,
-                '{{sender_email}}': sender.email,
-                '{{school}}': school,
-                '{{college}}': college
-            }
-            
-            # 执行模板替换
-            email_content = template_content
-            for placeholder, replacement in replacements.items():
-                email_content = email_content.replace(placeholder, replacement)
-            
-            # 生成邮件主题（也支持关键词替换）
-            if custom_subject:
-                subject = custom_subject
-                # 对自定义主题也进行关键词替换
-                for placeholder, replacement in replacements.items():
-                    subject = subject.replace(placeholder, replacement)
-            else:
-                subject = f"{sender.name}"
-            
-            email_previews.append({
-                'professor_name': professor['name'],
-                'professor_university': professor['university'],
+        # 模板与主题只解析一次，所有教授按列一次渲染
+        content_template = compile_template(template_content, PREVIEW_TEMPLATE_FIELDS)
+        subject_template = compile_template(custom_subject, PREVIEW_TEMPLATE_FIELDS)
+        
+        names = [professor.name for professor in professors]
+        research_areas = [professor.research_area or '' for professor in professors]
+        columns = {
+            'name': names,
+            'professor_name': names,
+            'university': [professor.university or '' for professor in professors],
+            'department': [professor.department or '' for professor in professors],
+            'research_area': research_areas,
+            'research_direction': research_areas,
+            'date': current_date,
+            'sender_name': sender.name,
+            'sender_email': sender.email,
+            'school': school,
+            'college': college
+        }
+        if custom_subject:
+            contents, subjects = render_batch([content_template, subject_template], columns, len(professors))
+        else:
+            contents, = render_batch([content_template], columns, len(professors))
+            subjects = [f"{sender.name}"] * len(professors)
+        
+        # 生成邮件预览（为每个教授生成）
+        email_previews = [
+            {
+                'professor_name': professor.name,
+                'professor_university': professor.university,
                 'subject': subject,
                 'content': email_content
-            })
+            }
+            for professor, subject, email_content in zip(professors, subjects, contents)
+        ]
         
         return jsonify({
             'success': True,
@@ -289,6 +375,7 @@ def generate_document_email():
                 'email': sender.email
             },
             'total_professors': len(professors),
+            'unknown_placeholders': _unknown_placeholders(content_template, subject_template),
             'message': '邮件预览生成成功'
         })
         
@@ -297,9 +384,30 @@ def generate_document_email():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
+def _export_campaign(messages, failed_emails, export_format, name_prefix):
+    """仅渲染模式：把逐封生成的邮件写入导出文件而不发送；响应只包含文件名与下载地址，不暴露服务器路径"""
+    result = campaign_exporter.export(messages, export_format, name_prefix)
+    result['failed_emails'] = failed_emails + result['failed_emails']
+    result['failed'] = len(result['failed_emails'])
+    # Maildir 是目录，不提供下载
+    if export_format != 'maildir':
+        result['download_url'] = f"/api/exports/{result['filename']}"
+    return jsonify({
+        'success': True,
+        'message': f"已导出 {result['exported']} 封邮件（未发送）",
+        **result
+    })
+
+
+@email_bp.route('/exports/<path:filename>', methods=['GET'])
+def download_export(filename):
+    """下载离线导出的 mbox 文件或 .eml 压缩包"""
+    return send_from_directory(campaign_exporter.export_dir, filename, as_attachment=True)
+
+
 @email_bp.route('/send-batch-emails', methods=['POST'])
 def send_batch_emails():
-    """批量发送纯文本邮件（支持指定 sender_id，缺省回退默认用户）"""
+    """批量发送纯文本邮件（支持指定 sender_id，缺省回退默认用户）：提交后台任务并立即返回任务ID"""
     try:
         data = request.get_json()
         professors = data.get('professors', [])
@@ -308,7 +416,11 @@ def send_batch_emails():
         send_interval = int(data.get('send_interval', 5) or 0)
         personalize = bool(data.get('personalize', False))
         sender_id = data.get('sender_id')
+        # 仅渲染模式：export 为 mbox / maildir / eml 时导出邮件文件，不连接SMTP服务器
+        export_format = data.get('export')
 
+        if export_format and export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'不支持的导出格式: {export_format}'}), 400
         if not professors:
             return jsonify({'error': '请选择至少一个教授'}), 400
         if not subject:
@@ -316,6 +428,11 @@ def send_batch_emails():
         if not content:
             return jsonify({'error': '请输入邮件内容'}), 400
 
+        try:
+            scheduled_at = parse_shanghai_datetime(data.get('scheduled_at'))
+        except ValueError:
+            return jsonify({'error': '定时发送时间格式无效'}), 400
+
         # 确定发送用户
         if sender_id:
             sender_user = UserProfile.query.filter_by(id=sender_id, is_active=True).first()
@@ -329,137 +446,77 @@ def send_batch_emails():
 
         current_date = datetime.now().strftime('%Y年%m月%d日')
 
-        success_count = 0
-        failed_count = 0
-        failed_emails = []
+        # 处理附件（支持 attachment_file_ids 或 attachments 为ID列表），整个批次只查询一次
+        attachment_ids = data.get('attachment_file_ids') or data.get('attachments') or []
+        attachments = _resolve_attachments(attachment_ids, sender_user.name)
 
-        for idx, professor_data in enumerate(professors):
+        sender_config = {
+            'user_id': sender_user.id,
+            'email': sender_user.email,
+            'name': sender_user.name,
+            'password': sender_user.email_password,
+            'smtp_server': sender_user.smtp_server,
+            'smtp_port': sender_user.smtp_port
+        }
+
+        # 主题与正文模板只解析一次
+        subject_template = compile_template(subject, BATCH_TEMPLATE_FIELDS)
+        content_template = compile_template(content, BATCH_TEMPLATE_FIELDS)
+
+        # 教授信息按列一次查出
+        rows = load_professors(professor_data.get('id') for professor_data in professors)
+        failed_emails = []
+        found = []
+        for professor_data in professors:
             try:
-                professor_id = professor_data.get('id')
-                professor = db.session.get(Professor, professor_id) if professor_id else None
-                if not professor:
-                    failed_count += 1
-                    failed_emails.append({
-                        'professor_id': professor_id,
-                        'professor_name': professor_data.get('name', f'ID:{professor_id}'),
-                        'email': professor_data.get('email', 'unknown'),
-                        'error': '教授信息不存在'
-                    })
-                    continue
-
-                # 个性化替换
-                replacements = {
-                    '{{name}}': professor.name or '',
-                    '{{date}}': current_date,
-                    '{{university}}': professor.university or '',
-                    '{{department}}': professor.department or '',
-                    '{{research_direction}}': professor.research_area or ''
-                }
-                personalized_subject = subject
-                personalized_content = content
-                if personalize:
-                    for placeholder, value in replacements.items():
-                        personalized_subject = personalized_subject.replace(placeholder, value)
-                        personalized_content = personalized_content.replace(placeholder, value)
-
-                # 处理附件（支持 attachment_file_ids 或 attachments 为ID列表）
-                attachment_ids = data.get('attachment_file_ids') or data.get('attachments') or []
-                attachments = []
-                if isinstance(attachment_ids, list) and attachment_ids:
-                    for file_id in attachment_ids:
-                        try:
-                            # 仅处理整数ID
-                            file_id_int = int(file_id)
-                        except Exception:
-                            continue
-                        user_file = UserFile.query.filter_by(id=file_id_int, is_active=True).first()
-                        if user_file and os.path.exists(user_file.file_path):
-                            display_name = user_file.file_name
-                            if user_file.file_type == 'resume':
-                                ext_part = os.path.splitext(user_file.file_name)[1]
-                                display_name = f"简历-{sender_user.name}{ext_part}"
-                            attachments.append({
-                                'file_path': user_file.file_path,
-                                'display_name': display_name
-                            })
-
-                # 发送邮件
-                sender_config = {
-                    'email': sender_user.email,
-                    'name': sender_user.name,
-                    'password': sender_user.email_password,
-                    'smtp_server': sender_user.smtp_server,
-                    'smtp_port': sender_user.smtp_port
-                }
-
-                success = email_service.send_email(
-                    recipient_email=professor.email,
-                    recipient_name=professor.name,
-                    subject=personalized_subject,
-                    content=personalized_content,
-                    sender_config=sender_config,
-                    attachments=attachments,
-                    content_type='plain'
-                )
-
-                # 记录发送结果
-                email_record = EmailRecord(
-                    professor_id=professor.id,
-                    subject=personalized_subject,
-                    content=personalized_content,
-                    status='sent' if success else 'failed',
-                    sender_name=sender_user.name,
-                    sender_email=sender_user.email,
-                    sent_at=get_shanghai_utcnow() if success else None
-                )
-                db.session.add(email_record)
-
-                if success:
-                    success_count += 1
-                    logger.info(f'批量纯文本邮件发送成功: {professor.name} <{professor.email}>')
-                else:
-                    failed_count += 1
-                    failed_emails.append({
-                        'professor_id': professor.id,
-                        'professor_name': professor.name,
-                        'email': professor.email,
-                        'error': '邮件发送失败'
-                    })
-
-                # 发送间隔
-                if idx < len(professors) - 1 and send_interval > 0:
-                    time.sleep(send_interval)
-
-            except Exception as e:
-                failed_count += 1
-                failed_emails.append({
-                    'professor_id': professor_data.get('id', 'unknown'),
-                    'professor_name': professor_data.get('name', 'unknown'),
-                    'email': professor_data.get('email', 'unknown'),
-                    'error': str(e)
-                })
-                logger.error(f'批量发送纯文本邮件出错: {str(e)}')
-        
-        # 提交
-        db.session.commit()
+                row = rows.get(int(professor_data.get('id')))
+            except (TypeError, ValueError):
+                row = None
+            if row is None:
+                failed_emails.append(_missing_professor(professor_data))
+            else:
+                found.append(row)
+
+        def build(index, professor, personalized_subject, personalized_content):
+            return {
+                'professor_id': professor.id,
+                'recipient_email': professor.email,
+                'recipient_name': professor.name,
+                'subject': subject if personalized_subject is None else personalized_subject,
+                'content': content if personalized_content is None else personalized_content,
+                'sender_config': sender_config,
+                'attachments': attachments,
+                'content_type': 'plain'
+            }
+
+        # 个性化替换：所有教授按列渲染（导出时分块渲染并逐封写入文件）
+        templates = (subject_template, content_template) if personalize else None
+        if export_format:
+            messages = _render_messages(found, templates, current_date, build, Config.EXPORT_CHUNK_SIZE)
+            return _export_campaign(messages, failed_emails, export_format, 'batch')
+        messages = list(_render_messages(found, templates, current_date, build))
+
+        job = batch_job_manager.submit(
+            current_app._get_current_object(),
+            BatchJob('batch', messages, send_interval=send_interval, failed_emails=failed_emails,
+                     scheduled_at=scheduled_at)
+        )
 
         return jsonify({
             'success': True,
-            'message': f'邮件发送完成！成功: {success_count}，失败: {failed_count}',
-            'success_count': success_count,
-            'failed_count': failed_count,
-            'failed_emails': failed_emails
-        })
+            'message': f'批量发送任务已提交，共 {job.total} 封',
+            'unknown_placeholders': _unknown_placeholders(subject_template, content_template) if personalize else [],
+            **job.to_dict()
+        }), 202
         
     except Exception as e:
-        db.session.rollback()
         logger.error(f'批量发送纯文本邮件失败: {str(e)}')
         return jsonify({'error': f'发送失败: {str(e)}'}), 500
 
 
 @email_bp.route('/send-document-email', methods=['POST'])
 def send_document_email():
-    """批量发送文档邮件"""
+    """批量发送文档邮件：提交后台任务并立即返回任务ID"""
     try:
         data = request.get_json()
         
@@ -470,7 +527,17 @@ def send_document_email():
         send_interval = data.get('send_interval', 5)
         attachment_ids = data.get('attachments', [])
         sender_id = data.get('sender_id')
-        
+        # 多发件人分摊：sender_ids 为发件人ID列表，distribution 为 'weight'（按 sender_weights）或 'quota'（按当日剩余额度）
+        sender_ids = data.get('sender_ids') or []
+        sender_weights = data.get('sender_weights')
+        distribution = data.get('distribution', 'weight')
+        # 仅渲染模式：export 为 mbox / maildir / eml 时导出邮件文件，不连接SMTP服务器
+        export_format = data.get('export')
+        
+        if export_format and export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'不支持的导出格式: {export_format}'}), 400
+        if distribution not in ('weight', 'quota'):
+            return jsonify({'error': f'不支持的分配方式: {distribution}'}), 400
         if not professors:
             return jsonify({'error': '请选择至少一个教授'}), 400
         
@@ -480,16 +547,62 @@ def send_document_email():
         if not subject:
             return jsonify({'error': '请输入邮件主题'}), 400
         
-        # 确定发送用户：优先使用前端选择的sender_id，缺省则回退到默认用户
-        if sender_id:
+        # 定时发送时间（未带时区按上海时间理解）
+        try:
+            scheduled_at = parse_shanghai_datetime(data.get('scheduled_at'))
+        except ValueError:
+            return jsonify({'error': '定时发送时间格式无效'}), 400
+        
+        # 确定发送用户：优先使用前端选择的sender_ids/sender_id，缺省则回退到默认用户
+        if sender_ids:
+            sender_profiles = []
+            for sid in sender_ids:
+                profile = UserProfile.query.filter_by(id=sid, is_active=True).first()
+                if not profile:
+                    return jsonify({'error': f'选择的发送用户不存在或未激活: {sid}'}), 400
+                sender_profiles.append(profile)
+        elif sender_id:
             sender_profile = UserProfile.query.filter_by(id=sender_id, is_active=True).first()
             if not sender_profile:
                 return jsonify({'error': '选择的发送用户不存在或未激活'}), 400
+            sender_profiles = [sender_profile]
         else:
             # 如果没有指定发送用户，选择第一个可用用户
             sender_profile = UserProfile.query.filter_by(is_active=True).first()
             if not sender_profile:
                 return jsonify({'error': '请先创建用户'}), 400
+            sender_profiles = [sender_profile]
+        
+        sender_configs = [
+            {
+                'user_id': profile.id,
+                'email': profile.email,
+                'name': profile.name,
+                'password': profile.email_password,
+                'smtp_server': profile.smtp_server,
+                'smtp_port': profile.smtp_port
+            }
+            for profile in sender_profiles
+        ]
+        
+        # 计算各发件人的分配权重
+        if distribution == 'quota':
+            weights = []
+            for config in sender_configs:
+                limits = email_service.get_rate_limits(config)
+                remaining = rate_limiter.remaining_today(email_service.get_rate_limit_key(config), limits)
+                if remaining is None:
+                    # 没有每日上限就没有“剩余额度”，不用其他单位的数值（如每小时速率）代替
+                    return jsonify({'error': f"发件人未设置每日上限，无法按剩余额度分配: {config['email']}"}), 400
+                weights.append(remaining)
+        else:
+            weights, weights_error = _sender_weights(sender_weights, sender_profiles)
+            if weights_error:
+                return jsonify({'error': weights_error}), 400
+        sender_assignment = distribute_by_weight(len(professors), weights)
+        
+        # 附件在循环外按发件人查询一次
+        sender_attachments = [_resolve_attachments(attachment_ids, profile.name) for profile in sender_profiles]
         
         # 获取文档内容（HTML格式）
         document_id = documents[0]['id']  # 使用第一个文档
@@ -500,133 +613,165 @@ def send_document_email():
         # 获取当前日期
         current_date = datetime.now().strftime('%Y年%m月%d日')
         
-        success_count = 0
-        failed_count = 0
-        failed_emails = []
+        # 主题与正文模板只解析一次
+        subject_template = compile_template(subject, BATCH_TEMPLATE_FIELDS)
+        content_template = compile_template(html_content, BATCH_TEMPLATE_FIELDS)
         
-        for professor_data in professors:
+        # 教授信息按列一次查出，记录每位教授在请求中的位置（对应发件人分配结果）
+        rows = load_professors(professor_data.get('id') for professor_data in professors)
+        failed_emails = []
+        found = []
+        positions = []
+        for idx, professor_data in enumerate(professors):
             try:
-                professor_id = professor_data['id']
-                professor = db.session.get(Professor, professor_id)
-                if not professor:
-                    failed_count += 1
-                    failed_emails.append({
-                        'professor_id': professor_id,
-                        'professor_name': professor_data.get('name', f'ID:{professor_id}'),
-                        'email': professor_data.get('email', 'unknown'),
-                        'error': '教授信息不存在'
-                    })
-                    continue
-                
-                # 准备替换字典
-                replacements = {
-                    '{{name}}': professor.name,
-                    '{{date}}': current_date,
-                    '{{university}}': professor.university or '',
-                    '{{department}}': professor.department or '',
-                    '{{research_direction}}': professor.research_area or ''
-                }
-                
-                # 替换邮件主题中的关键词
-                personalized_subject = subject
-                for placeholder, value in replacements.items():
-                    personalized_subject = personalized_subject.replace(placeholder, value)
-                
-                # 替换邮件内容中的关键词
-                personalized_content = html_content
-                for placeholder, value in replacements.items():
-                    personalized_content = personalized_content.replace(placeholder, value)
-                
-                # 已在函数开始处确定sender_profile，无需在循环内再次获取
-                sender_user = sender_profile
-                
-                # 处理附件
-                attachments = []
-                if attachment_ids:
-                    for file_id in attachment_ids:
-                        user_file = UserFile.query.filter_by(id=file_id, is_active=True).first()
-                        if user_file and os.path.exists(user_file.file_path):
-                            # 生成显示名称
-                            display_name = user_file.file_name
-                            if user_file.file_type == 'resume':
-                                # 简历类型自动重命名
-                                ext_part = os.path.splitext(user_file.file_name)[1]
-                                display_name = f"简历-{sender_user.name}{ext_part}"
-                            
-                            attachments.append({
-                                'file_path': user_file.file_path,
-                                'display_name': display_name
-                            })
-                
-                # 发送邮件（使用所选发送用户的配置）
-                sender_config = {
-                    'email': sender_user.email,
-                    'name': sender_user.name,
-                    'password': sender_user.email_password,
-                    'smtp_server': sender_user.smtp_server,
-                    'smtp_port': sender_user.smtp_port
-                }
-                
-                success = email_service.send_email(
-                    recipient_email=professor.email,
-                    recipient_name=professor.name,
-                    subject=personalized_subject,
-                    content=personalized_content,
-                    sender_config=sender_config,
-                    content_type='html',
-                    attachments=attachments
-                )
-                
-                # 记录发送结果
-                email_record = EmailRecord(
-                    professor_id=professor_id,
-                    subject=personalized_subject,
-                    content=personalized_content,
-                    status='sent' if success else 'failed',
-                    sender_name=sender_user.name,
-                    sender_email=sender_user.email,
-                    sent_at=get_shanghai_utcnow() if success else None
-                )
-                db.session.add(email_record)
-                
-                if success:
-                    success_count += 1
-                    logger.info(f'文档邮件发送成功: {professor.name} <{professor.email}>')
-                else:
-                    failed_count += 1
-                    failed_emails.append({
-                        'professor_id': professor_id,
-                        'professor_name': professor.name,
-                        'email': professor.email,
-                        'error': '邮件发送失败'
-                    })
-                
-                # 如果不是最后一个教授，等待指定间隔
-                if professor_data != professors[-1] and send_interval > 0:
-                    time.sleep(send_interval)
-                    
-            except Exception as e:
-                failed_count += 1
-                failed_emails.append({
-                    'professor_id': professor_data.get('id', 'unknown'),
-                    'professor_name': professor_data.get('name', 'unknown'),
-                    'email': professor_data.get('email', 'unknown'),
-                    'error': str(e)
-                })
-                logger.error(f'发送文档邮件时出错: {str(e)}')
-        
-        # 提交数据库事务
-        db.session.commit()
+                row = rows.get(int(professor_data.get('id')))
+            except (TypeError, ValueError):
+                row = None
+            if row is None:
+                failed_emails.append(_missing_professor(professor_data))
+            else:
+                found.append(row)
+                positions.append(idx)
+        
+        def build(index, professor, personalized_subject, personalized_content):
+            # 按分配结果使用对应发送用户的配置，附件按发件人缓存（简历显示名称与发件人相关）
+            sender_index = sender_assignment[positions[index]]
+            return {
+                'professor_id': professor.id,
+                'recipient_email': professor.email,
+                'recipient_name': professor.name,
+                'subject': personalized_subject,
+                'content': personalized_content,
+                'sender_config': sender_configs[sender_index],
+                'attachments': sender_attachments[sender_index],
+                'content_type': 'html'
+            }
+        
+        # 替换邮件主题与内容中的关键词：所有教授按列渲染（导出时分块渲染并逐封写入文件）
+        templates = (subject_template, content_template)
+        if export_format:
+            messages = _render_messages(found, templates, current_date, build, Config.EXPORT_CHUNK_SIZE)
+            return _export_campaign(messages, failed_emails, export_format, 'document')
+        messages = list(_render_messages(found, templates, current_date, build))
+        
+        job = batch_job_manager.submit(
+            current_app._get_current_object(),
+            BatchJob('document', messages, send_interval=float(send_interval or 0), failed_emails=failed_emails,
+                     scheduled_at=scheduled_at)
+        )
         
         return jsonify({
             'success': True,
-            'message': f'邮件发送完成！成功: {success_count}，失败: {failed_count}',
-            'success_count': success_count,
-            'failed_count': failed_count,
-            'failed_emails': failed_emails
-        })
+            'message': f'文档邮件发送任务已提交，共 {job.total} 封',
+            'unknown_placeholders': _unknown_placeholders(subject_template, content_template),
+            **job.to_dict()
+        }), 202
         
     except Exception as e:
-        db.session.rollback()
         logger.error(f'批量发送文档邮件失败: {str(e)}')
-        return jsonify({'error': f'发送失败: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'发送失败: {str(e)}'}), 500
+
+
+@email_bp.route('/resend-email/<int:record_id>', methods=['POST'])
+def resend_email(record_id):
+    """重新发送单条记录（同步发送，结果更新原记录）"""
+    try:
+        record = db.session.get(EmailRecord, record_id)
+        if not record:
+            return jsonify({'success': False, 'message': '发送记录不存在', 'error': '发送记录不存在'}), 404
+        if record.status not in RESENDABLE_STATUSES or \
+                resend_service.build_query(record.status, record_ids=[record_id]).first() is None:
+            return jsonify({'success': False, 'message': '该记录正在发送中', 'error': '该记录正在发送中'}), 409
+
+        message, build_error = resend_service.build_message(record)
+        if build_error:
+            return jsonify({'success': False, 'message': build_error, 'error': build_error}), 400
+
+        error = None
+        try:
+            prepared = email_service.prepare_message(
+                message['sender_config'], message['attachments'], content_type=message['content_type']
+            )
+            email_service.deliver_prepared(
+                prepared,
+                message['sender_config'],
+                recipient_email=message['recipient_email'],
+                recipient_name=message['recipient_name'],
+                subject=message['subject'],
+                content=message['content']
+            )
+        except SMTPSendError as e:
+            error = e
+        success = error is None
+        outbox.record_delivery(message, success, None if success else str(error))
+
+        # 返回更新后的原记录状态
+        db.session.refresh(record)
+        record_info = {
+            'record_id': record.id,
+            'status': record.status,
+            'sent_at': _serialize_datetime(record.sent_at)
+        }
+        if success:
+            return jsonify({'success': True, 'message': '邮件重新发送成功', **record_info})
+        return jsonify({
+            'success': False,
+            'message': str(error),
+            'error': f'邮件发送失败: {error}',
+            'smtp_code': error.code,
+            'temporary': error.temporary,
+            **record_info
+        }), 500
+
+    except Exception as e:
+        logger.error(f"重新发送邮件失败: {e}")
+        return jsonify({'success': False, 'message': str(e), 'error': str(e)}), 500
+
+
+@email_bp.route('/resend-emails', methods=['POST'])
+def resend_emails():
+    """按筛选条件批量重发记录：提交后台任务并立即返回任务ID，发送结果更新原记录"""
+    try:
+        data = request.get_json() or {}
+        status = data.get('status', 'failed')
+        sender_email = data.get('sender_email')
+        sender_id = data.get('sender_id')
+        record_ids = data.get('record_ids') or []
+        send_interval = float(data.get('send_interval', 5) or 0)
+
+        if sender_id and not sender_email:
+            sender_user = db.session.get(UserProfile, sender_id)
+            if not sender_user:
+                return jsonify({'error': '选择的发送用户不存在'}), 400
+            sender_email = sender_user.email
+
+        try:
+            query = resend_service.build_query(
+                status, sender_email=sender_email,
+                date_from=data.get('date_from'), date_to=data.get('date_to'),
+                record_ids=record_ids
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'筛选条件无效: {e}'}), 400
+
+        messages, failed_emails = resend_service.build_messages(query)
+        if not messages:
+            return jsonify({
+                'error': '没有可重发的发送记录',
+                'failed_emails': failed_emails
+            }), 400 if failed_emails else 404
+
+        job = batch_job_manager.submit(
+            current_app._get_current_object(),
+            BatchJob('resend', messages, send_interval=send_interval, failed_emails=failed_emails)
+        )
+
+        return jsonify({
+            'success': True,
+            'message': f'重发任务已提交，共 {job.total} 封',
+            **job.to_dict()
+        }), 202
+
+    except Exception as e:
+        logger.error(f"批量重发邮件失败: {str(e)}")
+        return jsonify({'error': f'重发失败: {str(e)}'}), 500
@@ -1,9 +1,15 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_file, send_from_directory
+from backend.config import Config
 from backend.document_service import DocumentService
 from backend.user_service import UserService
 from backend.models.user_file import UserFile
+from urllib.parse import quote
 import logging
 import os
+import re
+import shutil
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +20,21 @@ file_bp = Blueprint('file', __name__, url_prefix='/api')
 document_service = DocumentService()
 user_service = UserService()
 
+_CONVERTED_TOKEN = re.compile(r'[0-9a-f]{32}')
+
+
+def _prune_converted_documents():
+    """删除超过保留时间的已转换文档"""
+    if not os.path.isdir(Config.CONVERTED_FOLDER):
+        return
+    expire_before = time.time() - Config.CONVERTED_DOCUMENT_TTL
+    for entry in os.scandir(Config.CONVERTED_FOLDER):
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < expire_before:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass
+
 
 @file_bp.route('/users/<int:user_id>/files/<int:file_id>/content', methods=['GET'])
 def get_file_content(user_id, file_id):
@@ -94,8 +115,10 @@ def convert_user_document(user_id, doc_type):
         if not doc_path.lower().endswith('.docx'):
             return jsonify({'error': '只支持转换.docx格式文档'}), 400
         
-        # 转换文档
+        # 转换文档（附件只返回元数据，原文件通过下载接口获取）
         result = document_service.docx_to_html(doc_path)
+        for attachment in result['attachments']:
+            attachment['download_url'] = f'/api/users/{user_id}/documents/{doc_type}/download'
         
         return jsonify({
             'success': True,
@@ -121,25 +144,36 @@ def convert_document():
         if file.filename == '':
             return jsonify({'error': '未选择文件'}), 400
         
-        # 保存上传的文件
-        upload_dir = os.path.join(os.getcwd(), 'uploads')
-        os.makedirs(upload_dir, exist_ok=True)
+        _prune_converted_documents()
+        
+        # 保存上传的文件：每次转换使用独立目录，保留一段时间供下载附件（原文件）
+        token = uuid.uuid4().hex
+        document_dir = os.path.join(Config.CONVERTED_FOLDER, token)
+        os.makedirs(document_dir, exist_ok=True)
         
-        file_path = os.path.join(upload_dir, file.filename)
+        filename = os.path.basename(file.filename.replace('\\', '/'))
+        if filename in ('', '.', '..'):
+            filename = 'document.docx'
+        file_path = os.path.join(document_dir, filename)
         file.save(file_path)
         
+        keep = False
         try:
             # 验证文档
             validation = document_service.validate_document(file_path)
             if not validation['valid']:
                 return jsonify({'error': validation['message']}), 400
             
-            # 转换文档
+            # 转换文档（附件只返回元数据与下载地址，不内联base64内容）
             result = document_service.docx_to_html(file_path)
+            for attachment in result['attachments']:
+                attachment['download_url'] = f"/api/converted-documents/{token}/{quote(attachment['filename'])}"
             
             # 获取预览
             preview = document_service.get_document_preview(file_path)
             
+            keep = True
+            
             return jsonify({
                 'success': True,
                 'html_content': result['html_content'],
@@ -153,9 +187,35 @@ def convert_document():
             })
             
         finally:
-            # 清理临时文件
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            # 转换失败时立即清理，成功时保留到 Config.CONVERTED_DOCUMENT_TTL 之后
+            if not keep:
+                shutil.rmtree(document_dir, ignore_errors=True)
                 
     except Exception as e:
-        return jsonify({'error': f'文档转换失败: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'文档转换失败: {str(e)}'}), 500
+
+@file_bp.route('/converted-documents/<token>/<path:filename>', methods=['GET'])
+def download_converted_document(token, filename):
+    """下载 /api/convert-document 转换过的原始文档（保留时间见 Config.CONVERTED_DOCUMENT_TTL）"""
+    if not _CONVERTED_TOKEN.fullmatch(token):
+        return jsonify({'error': '文件不存在或已过期'}), 404
+    document_dir = os.path.join(Config.CONVERTED_FOLDER, token)
+    if not os.path.isdir(document_dir):
+        return jsonify({'error': '文件不存在或已过期'}), 404
+    return send_from_directory(document_dir, filename, as_attachment=True)
+
+
+@file_bp.route('/users/<int:user_id>/documents/<doc_type>/download', methods=['GET'])
+def download_user_document(user_id, doc_type):
+    """下载用户已上传的套磁信或简历"""
+    if doc_type not in ['cover_letter', 'resume']:
+        return jsonify({'error': '无效的文档类型'}), 400
+    
+    user = user_service.get_user(user_id)
+    if not user:
+        return jsonify({'error': '用户不存在'}), 404
+    
+    doc_path = user.cover_letter_path if doc_type == 'cover_letter' else user.resume_path
+    if not doc_path or not os.path.exists(doc_path):
+        return jsonify({'error': f'{doc_type}文档不存在'}), 404
+    return send_file(doc_path, as_attachment=True, download_name=os.path.basename(doc_path))
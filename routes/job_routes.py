@@ -0,0 +1,33 @@
+from flask import Blueprint, jsonify
+from backend.batch_jobs import batch_job_manager
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 创建批量任务管理蓝图
+job_bp = Blueprint('job', __name__, url_prefix='/api/jobs')
+
+
+@job_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询批量发送任务进度（已发送/失败/剩余/预计剩余时间）"""
+    status = batch_job_manager.get_status(job_id)
+    if not status:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    return jsonify({'success': True, **status})
+
+
+@job_bp.route('/<job_id>/<action>', methods=['POST'])
+def control_job(job_id, action):
+    """控制批量发送任务：cancel / pause / resume"""
+    if action not in ('cancel', 'pause', 'resume'):
+        return jsonify({'error': f'不支持的操作: {action}'}), 400
+    handled = batch_job_manager.control(job_id, action)
+    if handled is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+
+    status = batch_job_manager.get_status(job_id)
+    if not handled:
+        return jsonify({'success': False, 'error': f"当前状态({status['status']})不允许该操作", **status}), 409
+    logger.info(f"批量任务 {job_id} 执行操作: {action}")
+    return jsonify({'success': True, **status})
@@ -0,0 +1,40 @@
+from flask import Blueprint, jsonify, request
+from backend.circuit_breaker import circuit_breaker
+from backend.domain_throttle import domain_throttle
+from backend.smtp_metrics import smtp_metrics
+from backend.smtp_pool import smtp_pool
+from backend.utils.timezone_utils import format_shanghai_time
+from datetime import datetime, timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 创建发送指标蓝图
+metrics_bp = Blueprint('metrics', __name__, url_prefix='/api/metrics')
+
+
+@metrics_bp.route('', methods=['GET'])
+def get_metrics():
+    """
+    查询本进程的发送指标：按 (SMTP服务器, 发件邮箱) 汇总的各阶段耗时直方图、
+    连接池与熔断状态，以及所有进程在各收件域名的在途邮件数。?buckets=1 时返回直方图各桶计数
+    """
+    include_buckets = request.args.get('buckets', '').lower() in ('1', 'true', 'yes')
+    snapshot = smtp_metrics.snapshot(include_buckets)
+    since = datetime.fromtimestamp(snapshot.pop('since'), timezone.utc).replace(tzinfo=None)
+    return jsonify({
+        'success': True,
+        'since': format_shanghai_time(since),
+        'smtp': snapshot['channels'],
+        'pool': smtp_pool.stats(),
+        'circuits': circuit_breaker.stats(),
+        'domains_in_flight': domain_throttle.stats()
+    })
+
+
+@metrics_bp.route('/reset', methods=['POST'])
+def reset_metrics():
+    """清空耗时统计"""
+    smtp_metrics.reset()
+    logger.info("发送耗时统计已清空")
+    return jsonify({'success': True})
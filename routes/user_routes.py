@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from backend.user_service import UserService
+from backend.email_service import EmailService
 from backend.models.user_file import UserFile
 import logging
 import os
@@ -11,6 +12,7 @@ user_bp = Blueprint('user', __name__, url_prefix='/api')
 
 # 初始化服务
 user_service = UserService()
+email_service = EmailService()
 
 
 @user_bp.route('/users', methods=['GET', 'POST'])
@@ -155,6 +157,34 @@ def get_user_documents(user_id):
         return jsonify({'error': str(e)}), 500
 
 
+@user_bp.route('/users/<int:user_id>/validate-email', methods=['POST'])
+def validate_user_email(user_id):
+    """验证用户的发件配置（近期验证成功的直接返回，?force=1 忽略缓存重新验证）"""
+    try:
+        user = user_service.get_user(user_id)
+        if not user:
+            return jsonify({'error': '用户不存在'}), 404
+
+        sender_config = {
+            'email': user.email,
+            'name': user.name,
+            'password': user.email_password,
+            'smtp_server': user.smtp_server,
+            'smtp_port': user.smtp_port
+        }
+        force = request.args.get('force', '').lower() in ['1', 'true']
+        valid = email_service.validate_email_config(sender_config, use_cache=not force)
+        return jsonify({
+            'success': True,
+            'valid': valid,
+            'message': '发件配置验证成功' if valid else '发件配置验证失败，请检查SMTP服务器与授权码'
+        })
+
+    except Exception as e:
+        logger.error(f"验证发件配置失败: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
 @user_bp.route('/users/<int:user_id>/files', methods=['GET'])
 def get_user_files(user_id):
     """获取用户文件列表"""
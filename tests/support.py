@@ -0,0 +1,170 @@
+"""测试用的Flask应用与数据库（临时SQLite文件，可在多个进程之间共享）、接口测试基类，以及批量发送通道使用的替身"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from backend.database import Professor, db
+from backend.models.user_profile import UserProfile
+
+
+def make_app(database_path: str) -> Flask:
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    db.init_app(app)
+    return app
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """每个用例一个临时数据库文件，并在应用上下文中运行"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='auto-email-test-')
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.database_path = os.path.join(directory, 'test.db')
+        self.app = make_app(self.database_path)
+        context = self.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        db.create_all()
+        self.addCleanup(db.session.remove)
+
+
+class EmailRouteTestCase(DatabaseTestCase):
+    """注册邮件接口蓝图的测试应用，离线导出写入临时目录；提供创建发件人与教授的辅助方法"""
+
+    def setUp(self):
+        super().setUp()
+        # 路由模块在导入时创建服务单例，只在接口测试中导入
+        from routes import email_routes
+        self.routes = email_routes
+        self.app.register_blueprint(email_routes.email_bp)
+        self.client = self.app.test_client()
+        self.export_dir = tempfile.mkdtemp(prefix='auto-email-export-')
+        self.addCleanup(shutil.rmtree, self.export_dir, True)
+        patcher = mock.patch.object(email_routes.campaign_exporter, 'export_dir', self.export_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_sender(self, name: str, email: str) -> int:
+        sender = UserProfile(name=name, email=email, email_password='secret')
+        db.session.add(sender)
+        db.session.commit()
+        return sender.id
+
+    def add_professors(self, count: int) -> list:
+        professors = [
+            Professor(name=f'Prof {index}', email=f'p{index}@a.edu', university=f'U{index}') for index in range(count)
+        ]
+        db.session.add_all(professors)
+        db.session.commit()
+        return [professor.id for professor in professors]
+
+
+class JobRouteTestCase(EmailRouteTestCase):
+    """
+    同时注册任务接口蓝图，批量任务管理器单例改用投递替身；
+    SENDER_WAITS 为每个发件人每封邮件预订配额后的等待时间
+    """
+
+    SENDER_WAITS: dict = {}
+
+    def setUp(self):
+        super().setUp()
+        from backend.batch_jobs import batch_job_manager
+        from backend.domain_throttle import DomainThrottle
+        from backend.render_pool import RenderPool
+        from routes.job_routes import job_bp
+        self.app.register_blueprint(job_bp)
+        throttle = DomainThrottle(max_concurrency=5, min_interval=0)
+        self.service = FakeEmailService(throttle)
+        for name, value in (('email_service', self.service),
+                            ('rate_limiter', FakeRateLimiter(throttle, self.SENDER_WAITS)),
+                            ('domain_throttle', throttle), ('render_pool', RenderPool(0)),
+                            ('prewarm', False), ('external_workers', False)):
+            patcher = mock.patch.object(batch_job_manager, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def job_status(self, job_id: str) -> dict:
+        return self.client.get(f'/api/jobs/{job_id}').get_json()
+
+    def wait_for_job(self, job_id: str, condition, timeout: float = 5) -> dict:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            status = self.job_status(job_id)
+            if condition(status):
+                return status
+            time.sleep(0.02)
+        self.fail(f'job {job_id} stuck at {status}')
+
+
+def make_message(index: int, domain: str, sender: str = 'sender@example.com') -> dict:
+    return {
+        'professor_id': index,
+        'recipient_email': f'professor{index}@{domain}',
+        'recipient_name': f'Professor {index}',
+        'subject': 'Subject',
+        'content': 'Content',
+        'sender_config': {'email': sender, 'password': 'secret'},
+    }
+
+
+class FakeEmailService:
+    """只记录投递时各域名占用名额的替身"""
+
+    def __init__(self, throttle):
+        self.throttle = throttle
+        self.delivered = []
+
+    def check_circuit(self, sender_config):
+        return None
+
+    def get_rate_limit_key(self, sender_config):
+        return sender_config['email']
+
+    def get_rate_limits(self, sender_config):
+        return {}
+
+    def prepared_message_key(self, attachments, content_type):
+        return (content_type,)
+
+    def prepare_message(self, sender_config, attachments, content_type='html'):
+        return object()
+
+    def deliver_prepared(self, prepared, sender_config, recipient_email, **kwargs):
+        self.delivered.append((sender_config['email'], recipient_email, self.throttle.stats()))
+
+
+class FakeRateLimiter:
+    """
+    每次预订返回按发件人配置的等待时间，并记录预订时各域名占用的名额；
+    waits 中的值为异常时直接抛出（如 DailyQuotaExceeded），只抛出一次
+    """
+
+    def __init__(self, throttle, waits: dict):
+        self.throttle = throttle
+        self.waits = dict(waits)
+        self.held_on_reserve = []
+
+    def reserve(self, key, limits):
+        self.held_on_reserve.append(self.throttle.stats())
+        wait = self.waits.get(key, 0.0)
+        if isinstance(wait, Exception):
+            del self.waits[key]
+            raise wait
+        return wait
+
+
+class FakeOutbox:
+
+    def record_delivery(self, message, success, error, worker_id=None):
+        return None
+
+    def schedule_retry(self, *args, **kwargs):
+        pass
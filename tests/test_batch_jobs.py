@@ -0,0 +1,180 @@
+import threading
+import time
+import unittest
+
+from backend.batch_jobs import JOB_CANCELLED, JOB_PAUSED, JOB_QUEUED, JOB_RUNNING, BatchJob, BatchJobManager
+from backend.domain_throttle import DomainThrottle
+from backend.rate_limiter import DailyQuotaExceeded
+from backend.render_pool import RenderPool
+from backend.smtp_errors import RetryPolicy, SMTPSendError
+from tests.support import DatabaseTestCase, FakeEmailService, FakeOutbox, FakeRateLimiter, make_message
+
+
+class BatchJobStateTest(unittest.TestCase):
+
+    def test_pause_resume_and_cancel_transitions(self):
+        job = BatchJob('batch', [make_message(0, 'a.edu')])
+        self.assertEqual(job.status, JOB_QUEUED)
+        self.assertTrue(job.pause())
+        self.assertFalse(job.pause())
+        self.assertTrue(job.resume())
+        # 尚未开始的任务恢复后仍在排队
+        self.assertEqual(job.status, JOB_QUEUED)
+        self.assertFalse(job.resume())
+        self.assertTrue(job.cancel())
+        self.assertEqual(job.status, JOB_CANCELLED)
+        self.assertFalse(job.cancel())
+        self.assertFalse(job.pause())
+
+    def test_progress_counts_pre_failed_entries(self):
+        missing = {'professor_id': 9, 'email': 'unknown', 'error': '教授信息不存在'}
+        job = BatchJob('batch', [make_message(i, 'a.edu') for i in range(3)], failed_emails=[missing])
+        job._start()
+        job.record_result(True, sender_email='sender@example.com')
+        job.record_result(False, {'email': 'professor1@a.edu'}, sender_email='sender@example.com')
+        status = job.to_dict()
+        self.assertEqual((status['total'], status['sent'], status['failed'], status['remaining']), (4, 1, 2, 1))
+        self.assertEqual(status['status'], JOB_RUNNING)
+        self.assertEqual(status['senders'], {'sender@example.com': {'sent': 1, 'failed': 1}})
+        self.assertEqual([entry['email'] for entry in status['failed_emails']], ['unknown', 'professor1@a.edu'])
+        self.assertIsNotNone(status['eta_seconds'])
+        self.assertFalse(status['finished'])
+
+
+class BatchJobSleepTest(unittest.TestCase):
+
+    def start_sleeping(self, job: BatchJob, seconds: float = 10) -> threading.Thread:
+        sleeper = threading.Thread(target=job.sleep, args=(seconds,))
+        sleeper.start()
+        time.sleep(0.05)
+        self.assertTrue(sleeper.is_alive())
+        return sleeper
+
+    def test_pause_interrupts_sleep(self):
+        job = BatchJob('batch', [make_message(1, 'a.edu')])
+        job._start()
+        sleeper = self.start_sleeping(job)
+        self.assertTrue(job.pause())
+        sleeper.join(1)
+        self.assertFalse(sleeper.is_alive())
+        self.assertEqual(job.status, JOB_PAUSED)
+
+    def test_resume_restores_normal_sleep(self):
+        job = BatchJob('batch', [make_message(1, 'a.edu')])
+        job._start()
+        job.pause()
+        self.assertTrue(job.resume())
+        self.assertEqual(job.status, JOB_RUNNING)
+        start = time.monotonic()
+        job.sleep(0.1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_cancel_interrupts_sleep_even_after_resume(self):
+        job = BatchJob('batch', [make_message(1, 'a.edu')])
+        job._start()
+        job.pause()
+        job.cancel()
+        job.resume()
+        start = time.monotonic()
+        job.sleep(10)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class LaneQuotaTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.throttle = DomainThrottle(max_concurrency=2, min_interval=0)
+        self.service = FakeEmailService(self.throttle)
+
+    def make_manager(self, limiter) -> BatchJobManager:
+        return BatchJobManager(
+            email_service=self.service, rate_limiter=limiter, outbox=FakeOutbox(),
+            domain_throttle=self.throttle, render_pool=RenderPool(0), prewarm=False
+        )
+
+    def test_quota_exceeded_pauses_lane_without_failing_messages(self):
+        limiter = FakeRateLimiter(self.throttle, {'sender@example.com': DailyQuotaExceeded('sender@example.com', 0.2)})
+        messages = [make_message(i, 'a.edu') for i in range(3)]
+        job = BatchJob('batch', messages)
+        start = time.monotonic()
+        self.make_manager(limiter)._run_lane(self.app, job, messages)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual((job.success_count, job.failed_count), (3, 0))
+        self.assertEqual(job.quota_waits, {})
+
+
+
+class SlowEmailService(FakeEmailService):
+    """每封邮件耗时 latency 秒，记录同时在途的最大邮件数；failures 中的收件人首次发送返回临时错误"""
+
+    def __init__(self, throttle, latency: float, failures=()):
+        super().__init__(throttle)
+        self.latency = latency
+        self.failures = set(failures)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def deliver_prepared(self, prepared, sender_config, recipient_email, **kwargs):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            with self.lock:
+                if recipient_email in self.failures:
+                    self.failures.discard(recipient_email)
+                    raise SMTPSendError('try again later', 451, temporary=True)
+            super().deliver_prepared(prepared, sender_config, recipient_email, **kwargs)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class LaneConnectionsTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.throttle = DomainThrottle(max_concurrency=2, min_interval=0)
+
+    def run_lane(self, service, connections: int, messages):
+        manager = BatchJobManager(
+            email_service=service, rate_limiter=FakeRateLimiter(self.throttle, {}), outbox=FakeOutbox(),
+            domain_throttle=self.throttle, render_pool=RenderPool(0), prewarm=False,
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=0.05, max_delay=0.05, jitter=0),
+            sender_connections=connections
+        )
+        job = BatchJob('batch', messages)
+        start = time.monotonic()
+        manager._run_lane(self.app, job, messages)
+        return job, time.monotonic() - start
+
+    def test_one_sender_uses_several_connections(self):
+        service = SlowEmailService(self.throttle, latency=0.1)
+        messages = [make_message(i, f'd{i}.edu') for i in range(6)]
+        job, elapsed = self.run_lane(service, 3, messages)
+        self.assertEqual((job.success_count, job.failed_count), (6, 0))
+        self.assertEqual(service.max_in_flight, 3)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(sorted(recipient for _, recipient, _ in service.delivered),
+                         sorted(m['recipient_email'] for m in messages))
+
+    def test_domain_limit_still_applies(self):
+        service = SlowEmailService(self.throttle, latency=0.05)
+        messages = [make_message(i, 'a.edu') for i in range(4)]
+        job, _ = self.run_lane(service, 4, messages)
+        self.assertEqual(job.success_count, 4)
+        self.assertEqual(service.max_in_flight, 2)
+
+    def test_retry_of_in_flight_message_is_not_dropped(self):
+        # 最后一封邮件失败时其他连接已无邮件可取，仍需等它重试完成
+        service = SlowEmailService(self.throttle, latency=0.05, failures={'professor2@d2.edu'})
+        messages = [make_message(i, f'd{i}.edu') for i in range(3)]
+        job, _ = self.run_lane(service, 3, messages)
+        self.assertEqual((job.success_count, job.failed_count, job.retrying), (3, 0, 0))
+        self.assertEqual(len(service.delivered), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
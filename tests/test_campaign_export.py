@@ -0,0 +1,96 @@
+import mailbox
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from email import message_from_bytes
+from unittest import mock
+
+from backend.campaign_export import CampaignExporter
+from backend.config import Config
+from backend.email_service import EmailService
+from tests.support import DatabaseTestCase, EmailRouteTestCase, make_message
+
+
+class CampaignExporterTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.export_dir = tempfile.mkdtemp(prefix='auto-email-export-')
+        self.addCleanup(shutil.rmtree, self.export_dir, True)
+
+    def test_messages_are_consumed_one_by_one(self):
+        consumed = []
+
+        def messages():
+            for index in range(3):
+                consumed.append(index)
+                yield make_message(index, 'a.edu')
+
+        result = CampaignExporter(EmailService(), self.export_dir).export(messages(), 'mbox', 'test')
+        self.assertEqual((result['exported'], result['failed']), (3, 0))
+        self.assertEqual(consumed, [0, 1, 2])
+        # 响应中只有导出目录中的文件名，不包含服务器路径
+        self.assertNotIn('path', result)
+        self.assertEqual(os.path.basename(result['filename']), result['filename'])
+        box = mailbox.mbox(os.path.join(self.export_dir, result['filename']))
+        self.addCleanup(box.close)
+        self.assertEqual([message['To'].split('<')[-1] for message in box],
+                         [f'professor{index}@a.edu>' for index in range(3)])
+
+
+class ExportRouteTest(EmailRouteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sender_id = self.add_sender('Sender', 'sender@example.com')
+        self.add_professors(5)
+        patcher = mock.patch.object(Config, 'EXPORT_CHUNK_SIZE', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_export_renders_in_chunks_and_returns_download_url(self):
+        professors = [{'id': index} for index in range(1, 6)] + [{'id': 999}]
+        with mock.patch.object(self.routes, 'render_batch', wraps=self.routes.render_batch) as render:
+            response = self.client.post('/api/send-batch-emails', json={
+                'professors': professors, 'subject': 'Hi {{name}}', 'content': 'Dear {{name}} of {{university}}',
+                'personalize': True, 'sender_id': self.sender_id, 'export': 'mbox'
+            })
+        self.assertEqual(response.status_code, 200)
+        result = response.get_json()
+        self.assertEqual((result['exported'], result['failed']), (5, 1))
+        # 5 位教授按每块 2 人渲染
+        self.assertEqual([call.args[2] for call in render.call_args_list], [2, 2, 1])
+        self.assertNotIn('path', result)
+        self.assertNotIn(self.export_dir, response.get_data(as_text=True))
+        self.assertEqual(result['download_url'], f"/api/exports/{result['filename']}")
+
+        box = mailbox.mbox(os.path.join(self.export_dir, result['filename']))
+        self.addCleanup(box.close)
+        bodies = [
+            part.get_payload(decode=True).decode('utf-8')
+            for message in box for part in message.walk() if part.get_content_type() == 'text/plain'
+        ]
+        self.assertEqual(bodies, [f'Dear Prof {index} of U{index}' for index in range(5)])
+
+    def test_export_without_personalize_keeps_text(self):
+        response = self.client.post('/api/send-batch-emails', json={
+            'professors': [{'id': 1}, {'id': 2}, {'id': 3}], 'subject': 'Hi {{name}}', 'content': 'Body {{name}}',
+            'sender_id': self.sender_id, 'export': 'eml'
+        })
+        result = response.get_json()
+        self.assertEqual(result['exported'], 3)
+        download = self.client.get(result['download_url'])
+        self.assertEqual(download.status_code, 200)
+        download.close()
+        with zipfile.ZipFile(os.path.join(self.export_dir, result['filename'])) as archive:
+            names = archive.namelist()
+            self.assertEqual(len(names), 3)
+            message = message_from_bytes(archive.read(names[0]))
+        body = [part for part in message.walk() if part.get_content_type() == 'text/plain'][0]
+        self.assertEqual(body.get_payload(decode=True), b'Body {{name}}')
+
+
+if __name__ == '__main__':
+    unittest.main()
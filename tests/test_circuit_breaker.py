@@ -0,0 +1,114 @@
+import smtplib
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from backend import circuit_breaker as circuit_breaker_module
+from backend.circuit_breaker import (
+    CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN,
+    CircuitBreaker, CircuitOpenError, is_channel_failure
+)
+
+KEY = ('smtp.example.com', 'sender@example.com')
+
+
+def auth_error():
+    return smtplib.SMTPAuthenticationError(535, b'authentication failed')
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch.object(circuit_breaker_module, 'time', SimpleNamespace(monotonic=lambda: self.now))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    def open_circuit(self):
+        for _ in range(2):
+            self.breaker.acquire(KEY, 'secret')
+            self.breaker.record_result(KEY, ConnectionRefusedError('refused'), 'secret')
+
+    def test_channel_failure_classification(self):
+        self.assertTrue(is_channel_failure(auth_error()))
+        self.assertTrue(is_channel_failure(smtplib.SMTPServerDisconnected()))
+        self.assertTrue(is_channel_failure(TimeoutError()))
+        self.assertFalse(is_channel_failure(smtplib.SMTPRecipientsRefused({})))
+        self.assertFalse(is_channel_failure(smtplib.SMTPDataError(552, b'too big')))
+        self.assertFalse(is_channel_failure(ValueError()))
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_result(KEY, ConnectionRefusedError('refused'))
+        self.assertEqual(self.breaker.state(KEY), CIRCUIT_CLOSED)
+        self.assertIsNone(self.breaker.check(KEY))
+        self.breaker.record_result(KEY, ConnectionRefusedError('refused'))
+        self.assertEqual(self.breaker.state(KEY), CIRCUIT_OPEN)
+
+        error = self.breaker.check(KEY)
+        self.assertIsInstance(error, CircuitOpenError)
+        self.assertAlmostEqual(error.retry_after, 60)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.acquire(KEY)
+
+    def test_success_resets_failure_count(self):
+        self.breaker.record_result(KEY, ConnectionRefusedError('refused'))
+        self.breaker.record_result(KEY)
+        self.breaker.record_result(KEY, ConnectionRefusedError('refused'))
+        self.assertEqual(self.breaker.state(KEY), CIRCUIT_CLOSED)
+
+    def test_non_channel_errors_do_not_count(self):
+        for _ in range(5):
+            self.breaker.record_result(KEY, smtplib.SMTPRecipientsRefused({}))
+        self.assertEqual(self.breaker.state(KEY), CIRCUIT_CLOSED)
+
+    def test_half_open_probe_success_closes(self):
+        self.open_circuit()
+        self.now += 61
+        self.assertIsNone(self.breaker.check(KEY))
+        self.breaker.acquire(KEY)
+        self.assertEqual(self.breaker.state(KEY), CIRCUIT_HALF_OPEN)
+        # 探测进行中，其余邮件仍被拦截
+        self.assertIsInstance(self.breaker.check(KEY), CircuitOpenError)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.acquire(KEY)
+        self.breaker.record_result(KEY)
+        self.assertEqual(self.breaker.state(KEY), CIRCUIT_CLOSED)
+        self.breaker.acquire(KEY)
+
+    def test_half_open_probe_failure_reopens(self):
+        self.open_circuit()
+        self.now += 61
+        self.breaker.acquire(KEY)
+        self.breaker.record_result(KEY, auth_error())
+        self.assertEqual(self.breaker.state(KEY), CIRCUIT_OPEN)
+        error = self.breaker.check(KEY)
+        self.assertAlmostEqual(error.retry_after, 60)
+        self.assertEqual(error.code, 535)
+        self.assertFalse(error.temporary)
+
+    def test_stalled_probe_can_be_replaced(self):
+        self.open_circuit()
+        self.now += 61
+        self.breaker.acquire(KEY)
+        self.now += 61
+        self.breaker.acquire(KEY)
+        self.assertEqual(self.breaker.state(KEY), CIRCUIT_HALF_OPEN)
+
+    def test_changed_credentials_reset_circuit(self):
+        self.open_circuit()
+        self.assertIsInstance(self.breaker.check(KEY, 'secret'), CircuitOpenError)
+        self.assertIsNone(self.breaker.check(KEY, 'new-secret'))
+        self.assertEqual(self.breaker.state(KEY), CIRCUIT_CLOSED)
+
+    def test_stats_and_reset(self):
+        self.open_circuit()
+        stats = self.breaker.stats()[str(KEY)]
+        self.assertEqual(stats['state'], CIRCUIT_OPEN)
+        self.assertEqual(stats['failures'], 2)
+        self.breaker.reset(KEY)
+        self.assertEqual(self.breaker.stats(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from backend.conversion_cache import ConversionCache
+
+
+class ConversionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._temp.cleanup)
+        self.directory = self._temp.name
+        self.path = os.path.join(self.directory, 'letter.docx')
+        self.write(b'version one')
+        self.calls = 0
+
+    def write(self, data: bytes, mtime_ns: int = 1_700_000_000_000_000_000):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def convert(self):
+        self.calls += 1
+        with open(self.path, 'rb') as f:
+            return f.read().decode('utf-8').upper()
+
+    def test_memory_hit(self):
+        cache = ConversionCache()
+        self.assertEqual(cache.get(self.path, 'html', self.convert), 'VERSION ONE')
+        self.assertEqual(cache.get(self.path, 'html', self.convert), 'VERSION ONE')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.stats()['memory_hits'], 1)
+
+    def test_format_and_version_are_separate_entries(self):
+        cache = ConversionCache()
+        cache.get(self.path, 'html', self.convert)
+        cache.get(self.path, 'text', self.convert)
+        cache.get(self.path, 'html', self.convert, version=2)
+        self.assertEqual(self.calls, 3)
+
+    def test_size_change_invalidates(self):
+        cache = ConversionCache()
+        cache.get(self.path, 'html', self.convert)
+        # 修改时间不变，只有大小变化
+        self.write(b'version one, edited')
+        self.assertEqual(cache.get(self.path, 'html', self.convert), 'VERSION ONE, EDITED')
+        self.assertEqual(self.calls, 2)
+
+    def test_mtime_change_invalidates(self):
+        cache = ConversionCache()
+        cache.get(self.path, 'html', self.convert)
+        # 大小不变，只有修改时间变化
+        self.write(b'version two', mtime_ns=1_700_000_001_000_000_000)
+        self.assertEqual(cache.get(self.path, 'html', self.convert), 'VERSION TWO')
+        self.assertEqual(self.calls, 2)
+
+    def test_disk_tier_survives_restart_and_invalidates(self):
+        cache_dir = os.path.join(self.directory, 'cache')
+        ConversionCache(cache_dir=cache_dir).get(self.path, 'html', self.convert)
+        restarted = ConversionCache(cache_dir=cache_dir)
+        self.assertEqual(restarted.get(self.path, 'html', self.convert), 'VERSION ONE')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(restarted.stats()['disk_hits'], 1)
+
+        self.write(b'version two', mtime_ns=1_700_000_001_000_000_000)
+        self.assertEqual(ConversionCache(cache_dir=cache_dir).get(self.path, 'html', self.convert), 'VERSION TWO')
+        self.assertEqual(self.calls, 2)
+
+    def test_memory_budget_evicts_least_recently_used(self):
+        other = os.path.join(self.directory, 'other.docx')
+        with open(other, 'wb') as f:
+            f.write(b'x')
+        cache = ConversionCache(max_bytes=len('VERSION ONE') + 1)
+        cache.get(self.path, 'html', self.convert)
+        cache.get(other, 'html', lambda: 'AB')
+        self.assertEqual(cache.stats()['entries'], 1)
+        cache.get(self.path, 'html', self.convert)
+        self.assertEqual(self.calls, 2)
+
+    def test_oversized_result_is_not_kept_in_memory(self):
+        cache = ConversionCache(max_bytes=4)
+        cache.get(self.path, 'html', self.convert)
+        cache.get(self.path, 'html', self.convert)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_clear(self):
+        cache_dir = os.path.join(self.directory, 'cache')
+        cache = ConversionCache(cache_dir=cache_dir)
+        cache.get(self.path, 'html', self.convert)
+        cache.clear(disk=True)
+        self.assertEqual(os.listdir(cache_dir), [])
+        cache.get(self.path, 'html', self.convert)
+        self.assertEqual(self.calls, 2)
+
+    def test_concurrent_requests_convert_once(self):
+        cache = ConversionCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_convert():
+            started.set()
+            release.wait(5)
+            return self.convert()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get(self.path, 'html', slow_convert)))
+                   for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ['VERSION ONE'] * 4)
+        self.assertEqual(self.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
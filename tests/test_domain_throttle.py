@@ -0,0 +1,181 @@
+import math
+import multiprocessing
+import threading
+import time
+import unittest
+
+from backend.batch_jobs import BatchJob, BatchJobManager
+from backend.domain_throttle import DomainQueue, DomainThrottle, interleave_by_domain, recipient_domain
+from backend.render_pool import RenderPool
+from tests.support import DatabaseTestCase, FakeEmailService, FakeOutbox, FakeRateLimiter, make_app, make_message
+
+
+def acquire_in_process(database_path: str, attempts: int) -> int:
+    """在独立进程中尝试占用 attempts 个名额（不释放），返回成功次数"""
+    with make_app(database_path).app_context():
+        throttle = DomainThrottle(max_concurrency=3, min_interval=0)
+        return sum(1 for _ in range(attempts) if throttle.try_acquire('a.edu') == 0)
+
+
+class InterleaveTest(unittest.TestCase):
+
+    def test_recipient_domain(self):
+        self.assertEqual(recipient_domain('A@Mails.Tsinghua.EDU.cn '), 'mails.tsinghua.edu.cn')
+        self.assertEqual(recipient_domain(''), '')
+
+    def test_round_robin_keeps_order_within_domain(self):
+        messages = [make_message(i, domain) for i, domain in enumerate(['a.edu', 'a.edu', 'a.edu', 'b.edu', 'c.edu'])]
+        ordered = interleave_by_domain(messages)
+        self.assertEqual([m['professor_id'] for m in ordered], [0, 3, 4, 1, 2])
+
+
+class DomainThrottleTest(DatabaseTestCase):
+
+    def test_overrides_match_subdomains(self):
+        throttle = DomainThrottle(2, 1.0, {'Tsinghua.edu.cn': {'concurrency': 1, 'min_interval': 5}})
+        self.assertEqual(throttle.limits_for('mails.tsinghua.edu.cn'), (1, 5.0))
+        self.assertEqual(throttle.limits_for('tsinghua.edu.cn'), (1, 5.0))
+        self.assertEqual(throttle.limits_for('pku.edu.cn'), (2, 1.0))
+
+    def test_concurrency_limit(self):
+        throttle = DomainThrottle(max_concurrency=2, min_interval=0)
+        self.assertEqual(throttle.try_acquire('a.edu'), 0)
+        self.assertEqual(throttle.try_acquire('a.edu'), 0)
+        self.assertEqual(throttle.try_acquire('a.edu'), math.inf)
+        self.assertEqual(throttle.try_acquire('b.edu'), 0)
+        self.assertEqual(throttle.stats(), {'a.edu': 2, 'b.edu': 1})
+        throttle.release('a.edu')
+        self.assertEqual(throttle.try_acquire('a.edu'), 0)
+
+    def test_min_interval(self):
+        throttle = DomainThrottle(max_concurrency=5, min_interval=60)
+        self.assertEqual(throttle.try_acquire('a.edu'), 0)
+        throttle.release('a.edu')
+        wait = throttle.try_acquire('a.edu')
+        self.assertGreater(wait, 59)
+        self.assertLessEqual(wait, 60)
+        self.assertEqual(throttle.stats(), {})
+
+    def test_slot_waits_for_release(self):
+        throttle = DomainThrottle(max_concurrency=1, min_interval=0)
+        self.assertEqual(throttle.try_acquire('a.edu'), 0)
+
+        def release_later():
+            time.sleep(0.1)
+            with self.app.app_context():
+                throttle.release('a.edu')
+
+        threading.Thread(target=release_later).start()
+        start = time.monotonic()
+        with throttle.slot('a.edu'):
+            self.assertGreaterEqual(time.monotonic() - start, 0.05)
+            self.assertEqual(throttle.stats(), {'a.edu': 1})
+        self.assertEqual(throttle.stats(), {})
+
+    def test_slot_can_be_cancelled(self):
+        throttle = DomainThrottle(max_concurrency=1, min_interval=0)
+        throttle.try_acquire('a.edu')
+        with self.assertRaises(InterruptedError):
+            with throttle.slot('a.edu', max_wait=0.01, cancelled=lambda: True):
+                pass
+
+    def test_instances_share_slots_and_interval(self):
+        first = DomainThrottle(max_concurrency=1, min_interval=0)
+        second = DomainThrottle(max_concurrency=1, min_interval=0)
+        self.assertEqual(first.try_acquire('a.edu'), 0)
+        self.assertEqual(second.try_acquire('a.edu'), math.inf)
+        first.release('a.edu')
+        self.assertEqual(second.try_acquire('a.edu'), 0)
+
+        paced = DomainThrottle(max_concurrency=5, min_interval=60)
+        self.assertEqual(paced.try_acquire('b.edu'), 0)
+        self.assertGreater(DomainThrottle(max_concurrency=5, min_interval=60).try_acquire('b.edu'), 59)
+
+    def test_expired_slots_are_reclaimed(self):
+        crashed = DomainThrottle(max_concurrency=1, min_interval=0, slot_lease=0.05)
+        self.assertEqual(crashed.try_acquire('a.edu'), 0)
+        other = DomainThrottle(max_concurrency=1, min_interval=0)
+        self.assertEqual(other.try_acquire('a.edu'), math.inf)
+        time.sleep(0.1)
+        self.assertEqual(other.try_acquire('a.edu'), 0)
+        self.assertEqual(other.stats(), {'a.edu': 1})
+
+    def test_concurrency_is_shared_across_processes(self):
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(3) as pool:
+            acquired = pool.starmap(acquire_in_process, [(self.database_path, 3)] * 3)
+        self.assertEqual(sum(acquired), 3)
+        self.assertEqual(DomainThrottle().stats(), {'a.edu': 3})
+
+
+class DomainQueueTest(DatabaseTestCase):
+
+    def test_pop_ready_skips_throttled_domains(self):
+        throttle = DomainThrottle(max_concurrency=1, min_interval=0)
+        queue = DomainQueue([make_message(i, domain) for i, domain in enumerate(['a.edu', 'a.edu', 'b.edu'])])
+        self.assertEqual(len(queue), 3)
+        first, _ = queue.pop_ready(throttle)
+        second, _ = queue.pop_ready(throttle)
+        self.assertEqual((first['professor_id'], second['professor_id']), (0, 2))
+        # a.edu 与 b.edu 的名额都被占用
+        message, wait = queue.pop_ready(throttle)
+        self.assertIsNone(message)
+        self.assertEqual(wait, math.inf)
+        throttle.release('a.edu')
+        message, _ = queue.pop_ready(throttle)
+        self.assertEqual(message['professor_id'], 1)
+        self.assertFalse(queue)
+
+    def test_upcoming_matches_pop_order(self):
+        domains = ['a.edu', 'a.edu', 'a.edu', 'b.edu', 'c.edu', 'c.edu']
+        queue = DomainQueue([make_message(i, domain) for i, domain in enumerate(domains)])
+        self.assertEqual([m['professor_id'] for m in queue.upcoming(4)], [0, 3, 4, 1])
+        self.assertEqual(len(queue), 6)
+        upcoming = queue.upcoming(10)
+        self.assertEqual([queue.pop() for _ in range(6)], upcoming)
+
+    def test_pop_rotates_domains(self):
+        queue = DomainQueue([make_message(i, domain) for i, domain in enumerate(['a.edu', 'a.edu', 'b.edu'])])
+        self.assertEqual([queue.pop()['professor_id'] for _ in range(3)], [0, 2, 1])
+
+
+class LaneDomainSlotTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.throttle = DomainThrottle(max_concurrency=1, min_interval=0)
+        self.service = FakeEmailService(self.throttle)
+        self.limiter = FakeRateLimiter(self.throttle, {'slow@example.com': 0.3})
+        self.manager = BatchJobManager(
+            email_service=self.service, rate_limiter=self.limiter, outbox=FakeOutbox(),
+            domain_throttle=self.throttle, render_pool=RenderPool(0), prewarm=False
+        )
+
+    def test_domain_slot_is_taken_after_rate_wait(self):
+        messages = [make_message(i, 'a.edu', 'slow@example.com') for i in range(2)]
+        job = BatchJob('batch', messages)
+        self.manager._run_lane(self.app, job, messages)
+        self.assertEqual(job.success_count, 2)
+        # 预订配额（及其等待）期间不占用域名名额，只在投递期间占用
+        self.assertEqual(self.limiter.held_on_reserve, [{}, {}])
+        self.assertEqual([held for _, _, held in self.service.delivered], [{'a.edu': 1}, {'a.edu': 1}])
+        self.assertEqual(self.throttle.stats(), {})
+
+    def test_rate_limited_lane_does_not_block_domain_for_others(self):
+        slow = [make_message(i, 'a.edu', 'slow@example.com') for i in range(2)]
+        fast = [make_message(i, 'a.edu', 'fast@example.com') for i in range(10, 15)]
+        slow_job, fast_job = BatchJob('batch', slow), BatchJob('batch', fast)
+        slow_lane = threading.Thread(target=self.manager._run_lane, args=(self.app, slow_job, slow))
+        slow_lane.start()
+        time.sleep(0.05)
+        start = time.monotonic()
+        self.manager._run_lane(self.app, fast_job, fast)
+        fast_elapsed = time.monotonic() - start
+        slow_lane.join(5)
+        self.assertEqual((slow_job.success_count, fast_job.success_count), (2, 5))
+        # 慢通道在限速等待中，快通道不必等它释放 a.edu 的唯一名额
+        self.assertLess(fast_elapsed, 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
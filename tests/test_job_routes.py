@@ -0,0 +1,73 @@
+import time
+import unittest
+
+from backend.batch_jobs import JOB_CANCELLED, JOB_COMPLETED, JOB_PAUSED
+from tests.support import JobRouteTestCase
+
+
+class JobRoutesTest(JobRouteTestCase):
+    """提交批量任务后立即返回任务ID，通过 /api/jobs 查询与控制进度"""
+
+    # 每封邮件预订配额后等待 0.1 秒，便于在发送过程中暂停与取消
+    SENDER_WAITS = {'sender@example.com': 0.1}
+
+    def setUp(self):
+        super().setUp()
+        self.sender_id = self.add_sender('Sender', 'sender@example.com')
+        self.professor_ids = self.add_professors(5)
+
+    def submit(self, professor_ids=None) -> dict:
+        response = self.client.post('/api/send-batch-emails', json={
+            'professors': [{'id': professor_id} for professor_id in professor_ids or self.professor_ids],
+            'subject': 'Hi', 'content': 'Body', 'sender_id': self.sender_id, 'send_interval': 0
+        })
+        self.assertEqual(response.status_code, 202)
+        return response.get_json()
+
+    def test_submit_returns_job_id_before_sending(self):
+        submitted = self.submit(self.professor_ids + [999])
+        self.assertTrue(submitted['job_id'])
+        self.assertEqual(submitted['total'], 6)
+        self.assertLess(submitted['sent'], 5)
+        status = self.wait_for_job(submitted['job_id'], lambda s: s['finished'])
+        self.assertEqual((status['status'], status['sent'], status['failed'], status['remaining']),
+                         (JOB_COMPLETED, 5, 1, 0))
+        self.assertEqual(len(self.service.delivered), 5)
+
+    def test_pause_and_resume(self):
+        job_id = self.submit()['job_id']
+        self.wait_for_job(job_id, lambda s: s['sent'] >= 1)
+        paused = self.client.post(f'/api/jobs/{job_id}/pause')
+        self.assertEqual(paused.status_code, 200)
+        self.assertEqual(paused.get_json()['status'], JOB_PAUSED)
+        # 暂停后不再发送新邮件（最多完成已在发送中的一封）
+        time.sleep(0.1)
+        sent = self.job_status(job_id)['sent']
+        time.sleep(0.3)
+        self.assertEqual(self.job_status(job_id)['sent'], sent)
+        self.assertLess(sent, 5)
+        self.assertEqual(self.client.post(f'/api/jobs/{job_id}/pause').status_code, 409)
+
+        self.assertEqual(self.client.post(f'/api/jobs/{job_id}/resume').status_code, 200)
+        status = self.wait_for_job(job_id, lambda s: s['finished'])
+        self.assertEqual((status['status'], status['sent']), (JOB_COMPLETED, 5))
+
+    def test_cancel(self):
+        job_id = self.submit()['job_id']
+        self.wait_for_job(job_id, lambda s: s['sent'] >= 1)
+        self.assertEqual(self.client.post(f'/api/jobs/{job_id}/cancel').status_code, 200)
+        status = self.wait_for_job(job_id, lambda s: s['finished'])
+        self.assertEqual(status['status'], JOB_CANCELLED)
+        self.assertLess(status['sent'], 5)
+        self.assertEqual(self.client.post(f'/api/jobs/{job_id}/resume').status_code, 409)
+
+    def test_unknown_job_and_action(self):
+        self.assertEqual(self.client.get('/api/jobs/missing').status_code, 404)
+        self.assertEqual(self.client.post('/api/jobs/missing/cancel').status_code, 404)
+        job_id = self.submit()['job_id']
+        self.assertEqual(self.client.post(f'/api/jobs/{job_id}/restart').status_code, 400)
+        self.wait_for_job(job_id, lambda s: s['finished'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+from datetime import timedelta
+
+from sqlalchemy import update
+
+from backend.database import db, EmailRecord
+from backend.models.outbox_message import OutboxMessage
+from backend.outbox import OUTBOX_FAILED, OUTBOX_PENDING, OUTBOX_SENT, Outbox
+from backend.utils.timezone_utils import get_shanghai_utcnow
+from tests.support import DatabaseTestCase
+
+
+def make_message(index: int) -> dict:
+    return {
+        'professor_id': index,
+        'recipient_email': f'professor{index}@example.com',
+        'recipient_name': f'Professor {index}',
+        'subject': f'Subject {index}',
+        'content': f'<p>Content {index}</p>',
+        'sender_config': {'email': 'sender@example.com', 'name': 'Sender', 'password': 'secret'},
+    }
+
+
+class OutboxTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.outbox = Outbox(lease_seconds=300)
+
+    def enqueue(self, count: int, **kwargs):
+        messages = [make_message(index) for index in range(1, count + 1)]
+        self.outbox.enqueue('job1', 'batch', messages, **kwargs)
+        return messages
+
+    def expire_leases(self):
+        db.session.execute(
+            update(OutboxMessage).values(lease_until=get_shanghai_utcnow() - timedelta(seconds=1))
+        )
+        db.session.commit()
+
+    def test_enqueue_does_not_store_password(self):
+        messages = self.enqueue(1)
+        row = db.session.get(OutboxMessage, messages[0]['outbox_id'])
+        self.assertNotIn('secret', row.sender_config)
+
+    def test_claim_respects_limit_and_is_exclusive(self):
+        self.enqueue(5)
+        first = self.outbox.claim('worker-a', limit=3)
+        self.assertEqual([row.professor_id for row in first], [1, 2, 3])
+        second = self.outbox.claim('worker-b', limit=10)
+        self.assertEqual([row.professor_id for row in second], [4, 5])
+        self.assertEqual(self.outbox.claim('worker-c'), [])
+
+    def test_claim_filters_by_job(self):
+        self.enqueue(2)
+        self.assertEqual(self.outbox.claim('worker-a', job_id='other-job'), [])
+        self.assertEqual(len(self.outbox.claim('worker-a', job_id='job1')), 2)
+
+    def test_scheduled_messages_wait_until_due(self):
+        self.enqueue(2, scheduled_at=get_shanghai_utcnow() + timedelta(hours=1))
+        self.assertEqual(self.outbox.claim('worker-a'), [])
+        self.assertEqual(len(self.outbox.scheduled_jobs()), 1)
+
+    def test_expired_lease_is_reclaimed(self):
+        self.enqueue(2)
+        self.outbox.claim('worker-a')
+        self.assertEqual(self.outbox.claim('worker-b'), [])
+        self.expire_leases()
+        reclaimed = self.outbox.claim('worker-b')
+        self.assertEqual(len(reclaimed), 2)
+        self.assertTrue(all(row.claimed_by == 'worker-b' for row in reclaimed))
+
+    def test_extended_lease_is_not_reclaimed(self):
+        self.enqueue(1)
+        self.outbox.claim('worker-a')
+        self.expire_leases()
+        self.assertEqual(self.outbox.extend_leases('worker-a'), 1)
+        self.assertEqual(self.outbox.claim('worker-b'), [])
+
+    def test_expired_lease_waits_for_retry_time_unless_taking_over(self):
+        messages = self.enqueue(1)
+        self.outbox.claim('worker-a')
+        self.outbox.schedule_retry(messages[0]['outbox_id'], 1, 600, '451 try later')
+        self.expire_leases()
+        self.assertEqual(self.outbox.claim('worker-b'), [])
+        self.assertEqual(len(self.outbox.claim('worker-b', due_only=False)), 1)
+
+    def test_released_retry_is_claimable_when_due(self):
+        messages = self.enqueue(1)
+        self.outbox.claim('worker-a')
+        self.outbox.schedule_retry(messages[0]['outbox_id'], 1, 0, '451 try later', release=True)
+        claimed = self.outbox.claim('worker-b')
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(claimed[0].attempts, 1)
+
+    def test_record_delivery_success(self):
+        messages = self.enqueue(1)
+        self.outbox.claim('worker-a')
+        record = self.outbox.record_delivery(messages[0], True, None, worker_id='worker-a')
+        self.assertEqual(record.status, 'sent')
+        self.assertIsNotNone(record.sent_at)
+        row = db.session.get(OutboxMessage, messages[0]['outbox_id'])
+        db.session.refresh(row)
+        self.assertEqual(row.status, OUTBOX_SENT)
+        self.assertEqual(row.attempts, 1)
+        self.assertEqual(row.email_record_id, record.id)
+        self.assertIsNone(row.claimed_by)
+        self.assertIsNone(row.lease_until)
+        self.assertEqual(self.outbox.claim('worker-b'), [])
+
+    def test_record_delivery_failure(self):
+        messages = self.enqueue(1)
+        self.outbox.claim('worker-a')
+        record = self.outbox.record_delivery(messages[0], False, '550 rejected', worker_id='worker-a')
+        self.assertEqual(record.status, 'failed')
+        self.assertIsNone(record.sent_at)
+        row = db.session.get(OutboxMessage, messages[0]['outbox_id'])
+        db.session.refresh(row)
+        self.assertEqual(row.status, OUTBOX_FAILED)
+        self.assertEqual(row.last_error, '550 rejected')
+
+    def test_record_delivery_after_takeover_keeps_new_owner(self):
+        messages = self.enqueue(1)
+        self.outbox.claim('worker-a')
+        self.expire_leases()
+        self.outbox.claim('worker-b')
+        record = self.outbox.record_delivery(messages[0], True, None, worker_id='worker-a')
+        self.assertIsNotNone(record)
+        row = db.session.get(OutboxMessage, messages[0]['outbox_id'])
+        db.session.refresh(row)
+        self.assertEqual(row.status, OUTBOX_PENDING)
+        self.assertEqual(row.claimed_by, 'worker-b')
+
+    def test_record_delivery_updates_resent_record(self):
+        original = EmailRecord(professor_id=1, subject='Subject 1', content='old', status='failed',
+                               error_message='timeout')
+        db.session.add(original)
+        db.session.commit()
+        message = make_message(1)
+        message['email_record_id'] = original.id
+        self.outbox.enqueue('job1', 'batch', [message])
+        record = self.outbox.record_delivery(message, True, None)
+        self.assertEqual(record.id, original.id)
+        self.assertEqual(record.status, 'sent')
+        self.assertIsNone(record.error_message)
+        self.assertEqual(EmailRecord.query.count(), 1)
+
+    def test_cancel_job(self):
+        self.enqueue(3)
+        self.assertEqual(self.outbox.cancel_job('job1'), 3)
+        self.assertEqual(self.outbox.claim('worker-a'), [])
+        summary = self.outbox.job_summary('job1')
+        self.assertEqual(summary['cancelled'], 3)
+        self.assertEqual(summary['pending'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import re
+import unittest
+from email import message_from_bytes
+from email.header import decode_header, make_header
+from email.mime.text import MIMEText
+
+from backend.prepared_message import PreparedMessage, serialize_part
+
+BARE_LF = re.compile(rb'(?<!\r)\n')
+
+
+class SerializePartTest(unittest.TestCase):
+
+    def test_lines_end_with_crlf(self):
+        data = serialize_part(MIMEText('first line\nsecond line\n', 'plain'))
+        self.assertIsNone(BARE_LF.search(data))
+        self.assertIn(b'\r\n\r\nfirst line\r\nsecond line\r\n', data)
+        self.assertTrue(data.endswith(b'\r\n'))
+
+    def test_missing_final_newline_is_added(self):
+        data = serialize_part(MIMEText('no newline', 'plain'))
+        self.assertTrue(data.endswith(b'no newline\r\n'))
+
+    def test_leading_dots_are_stuffed(self):
+        data = serialize_part(MIMEText('.hidden\n..two\nmiddle . dot\n.', 'plain'))
+        body = data.split(b'\r\n\r\n', 1)[1]
+        self.assertEqual(body, b'..hidden\r\n...two\r\nmiddle . dot\r\n..\r\n')
+        # 单独一个点的行会被服务器当作DATA结束，必须转义
+        self.assertNotIn(b'\r\n.\r\n', data)
+
+    def test_from_lines_are_not_mangled(self):
+        data = serialize_part(MIMEText('From here\n', 'plain'))
+        self.assertIn(b'\r\nFrom here\r\n', data)
+        self.assertNotIn(b'>From', data)
+
+    def test_encoded_body_has_crlf(self):
+        data = serialize_part(MIMEText('中文正文\n' * 40, 'html', 'utf-8'))
+        self.assertIsNone(BARE_LF.search(data))
+        self.assertIn(b'Content-Transfer-Encoding: base64\r\n', data)
+
+
+class PreparedMessageHeaderTest(unittest.TestCase):
+
+    def render(self, sender_name: str, recipient_name: str, subject: str = '主题') -> bytes:
+        prepared = PreparedMessage('sender@example.com', sender_name, [], 'html')
+        return b''.join(prepared.render('professor@example.com', recipient_name, subject, '<p>正文</p>'))
+
+    def test_long_display_names_fold_with_crlf(self):
+        data = self.render('发件人' * 10, '收件人姓名' * 6, '很长的邮件主题' * 10)
+        head = data.split(b'\r\n\r\n', 1)[0]
+        # 显示名称超过一行时折行，续行也必须以CRLF结尾
+        self.assertIn(b'?=\r\n =?utf-8?', head.split(b'\r\nTo: ', 1)[0])
+        self.assertIsNone(BARE_LF.search(data))
+
+        message = message_from_bytes(data)
+        self.assertEqual(str(make_header(decode_header(message['From']))), f"{'发件人' * 10} <sender@example.com>")
+        self.assertEqual(str(make_header(decode_header(message['To']))), f"{'收件人姓名' * 6} <professor@example.com>")
+        self.assertEqual(str(make_header(decode_header(message['Subject']))), '很长的邮件主题' * 10)
+
+    def test_short_display_names(self):
+        data = self.render('Sender', '张三')
+        self.assertIn(b'From: =?utf-8?q?Sender?= <sender@example.com>\r\n', data)
+        self.assertIsNone(BARE_LF.search(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
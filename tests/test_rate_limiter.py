@@ -0,0 +1,166 @@
+import multiprocessing
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from backend import rate_limiter as rate_limiter_module
+from backend.database import db
+from backend.models.rate_limit_bucket import RateLimitBucket
+from backend.rate_limiter import DailyQuotaExceeded, RateLimiter, SendPacer
+from tests.support import DatabaseTestCase, make_app
+
+LIMITS = {'per_hour': 3600, 'burst': 2, 'daily_cap': 5}
+
+
+def reserve_in_process(database_path: str, attempts: int) -> int:
+    """在独立进程中预订 attempts 次，返回成功次数"""
+    with make_app(database_path).app_context():
+        limiter = RateLimiter()
+        reserved = 0
+        for _ in range(attempts):
+            try:
+                limiter.reserve('shared|smtp', {'per_hour': 3600 * 1000, 'burst': 1000, 'daily_cap': 50})
+                reserved += 1
+            except DailyQuotaExceeded:
+                pass
+        return reserved
+
+
+def pace_in_process(database_path: str, count: int, earliest: float) -> list:
+    with make_app(database_path).app_context():
+        pacer = SendPacer()
+        return [pacer.reserve('job:shared|sender', 10, earliest) for _ in range(count)]
+
+
+class FakeClockTestCase(DatabaseTestCase):
+    """用可控的时钟与日期替换限速器模块中的 time.time() 与 _today()"""
+
+    def setUp(self):
+        super().setUp()
+        self.now = 1_000_000.0
+        self.day = '2026-01-01'
+        patches = [
+            mock.patch.object(rate_limiter_module, 'time', SimpleNamespace(time=lambda: self.now, sleep=time.sleep)),
+            mock.patch.object(rate_limiter_module, '_today', lambda: self.day),
+            mock.patch.object(rate_limiter_module, '_seconds_until_tomorrow', lambda: 3600.0),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class RateLimiterTest(FakeClockTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.limiter = RateLimiter()
+
+    def tokens(self, key: str = 'a|smtp') -> float:
+        return db.session.get(RateLimitBucket, key, populate_existing=True).tokens
+
+    def test_burst_is_available_immediately(self):
+        self.assertEqual([self.limiter.reserve('a|smtp', LIMITS) for _ in range(2)], [0.0, 0.0])
+
+    def test_overdraft_queues_callers_in_order(self):
+        # 每秒一个令牌
+        limits = {'per_hour': 3600, 'burst': 1, 'daily_cap': None}
+        self.assertEqual(self.limiter.reserve('a|smtp', limits), 0.0)
+        self.assertAlmostEqual(self.limiter.reserve('a|smtp', limits), 1.0)
+        self.assertAlmostEqual(self.limiter.reserve('a|smtp', limits), 2.0)
+        self.assertAlmostEqual(self.tokens(), -2.0)
+
+    def test_refill_is_capped_at_burst(self):
+        limits = {'per_hour': 3600, 'burst': 2, 'daily_cap': None}
+        self.limiter.reserve('a|smtp', limits)
+        self.limiter.reserve('a|smtp', limits)
+        self.now += 1.5
+        self.assertEqual(self.limiter.reserve('a|smtp', limits), 0.0)
+        self.assertAlmostEqual(self.tokens(), 0.5)
+        self.now += 3600
+        self.limiter.reserve('a|smtp', limits)
+        self.assertAlmostEqual(self.tokens(), 1.0)
+
+    def test_daily_cap(self):
+        for _ in range(5):
+            self.limiter.reserve('a|smtp', {**LIMITS, 'burst': 10})
+        self.assertEqual(self.limiter.remaining_today('a|smtp', LIMITS), 0)
+        with self.assertRaises(DailyQuotaExceeded) as raised:
+            self.limiter.reserve('a|smtp', LIMITS)
+        self.assertEqual(raised.exception.key, 'a|smtp')
+        self.assertEqual(raised.exception.reset_in, 3600.0)
+        # 额度用尽时的预订不扣令牌
+        self.assertAlmostEqual(self.tokens(), 5.0)
+
+    def test_daily_count_resets_next_day(self):
+        for _ in range(5):
+            self.limiter.reserve('a|smtp', {**LIMITS, 'burst': 10})
+        self.day = '2026-01-02'
+        self.assertEqual(self.limiter.remaining_today('a|smtp', LIMITS), 5)
+        self.limiter.reserve('a|smtp', LIMITS)
+        self.assertEqual(self.limiter.remaining_today('a|smtp', LIMITS), 4)
+
+    def test_zero_daily_cap_rejects(self):
+        with self.assertRaises(DailyQuotaExceeded):
+            self.limiter.reserve('a|smtp', {**LIMITS, 'daily_cap': 0})
+
+    def test_no_daily_cap(self):
+        self.assertIsNone(self.limiter.remaining_today('a|smtp', {**LIMITS, 'daily_cap': None}))
+
+    def test_keys_are_independent(self):
+        for _ in range(5):
+            self.limiter.reserve('a|smtp', {**LIMITS, 'burst': 10})
+        self.assertEqual(self.limiter.reserve('b|smtp', LIMITS), 0.0)
+        self.assertEqual(self.limiter.remaining_today('b|smtp', LIMITS), 4)
+
+    def test_instances_share_state(self):
+        other = RateLimiter()
+        self.limiter.reserve('a|smtp', LIMITS)
+        other.reserve('a|smtp', LIMITS)
+        self.assertEqual(self.limiter.remaining_today('a|smtp', LIMITS), 3)
+        self.assertGreater(other.reserve('a|smtp', LIMITS), 0)
+
+
+class SendPacerTest(FakeClockTestCase):
+
+    def test_zero_interval_is_not_recorded(self):
+        pacer = SendPacer()
+        self.assertEqual(pacer.reserve('job:1|a', 0, self.now + 3), self.now + 3)
+
+    def test_starts_are_spaced_by_interval(self):
+        pacer = SendPacer()
+        self.assertEqual(pacer.reserve('job:1|a', 10, self.now), self.now)
+        self.assertEqual(pacer.reserve('job:1|a', 10, self.now), self.now + 10)
+        # 调用方本身就要更晚才能开始时，以调用方的时间为准
+        self.assertEqual(pacer.reserve('job:1|a', 10, self.now + 60), self.now + 60)
+        self.assertEqual(pacer.reserve('job:2|a', 10, self.now), self.now)
+
+    def test_prune_removes_stale_keys(self):
+        pacer = SendPacer()
+        pacer.reserve('job:1|a', 10, self.now)
+        self.now += 2 * 86400
+        pacer.prune()
+        self.assertEqual(pacer.reserve('job:1|a', 10, self.now), self.now)
+
+
+class CrossProcessTest(DatabaseTestCase):
+    """多个进程共享同一个数据库时，配额与发送节奏不会被重复使用"""
+
+    def run_in_processes(self, function, args_list):
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(len(args_list)) as pool:
+            return pool.starmap(function, args_list)
+
+    def test_daily_cap_is_shared(self):
+        reserved = self.run_in_processes(reserve_in_process, [(self.database_path, 40)] * 3)
+        self.assertEqual(sum(reserved), 50)
+        self.assertEqual(RateLimiter().remaining_today('shared|smtp', {'daily_cap': 50}), 0)
+
+    def test_pacing_is_shared(self):
+        earliest = time.time()
+        starts = self.run_in_processes(pace_in_process, [(self.database_path, 5, earliest)] * 2)
+        self.assertEqual(sorted(starts[0] + starts[1]), [earliest + 10 * i for i in range(10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
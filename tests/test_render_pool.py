@@ -0,0 +1,117 @@
+import unittest
+from concurrent.futures import wait
+
+from backend.domain_throttle import DomainQueue, DomainThrottle
+from backend.prepared_message import MessageSkeleton, PreparedMessage
+from backend.render_pool import RenderPool
+from tests.support import DatabaseTestCase, make_message
+
+
+class CountingSkeleton(MessageSkeleton):
+    """记录在当前进程中渲染的次数（渲染进程中的调用不计入）"""
+
+    def __init__(self, skeleton: MessageSkeleton):
+        super().__init__(skeleton.common_headers, skeleton.delimiter, skeleton.content_type)
+        self.local_renders = 0
+
+    def render_head(self, *item) -> bytes:
+        self.local_renders += 1
+        return super().render_head(*item)
+
+
+class RenderAheadTest(DatabaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = RenderPool(processes=1, min_batch=1, window=4, chunk_size=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def setUp(self):
+        super().setUp()
+        self.skeleton = CountingSkeleton(PreparedMessage('sender@example.com', 'Sender', [], 'html').skeleton)
+
+    def render_ahead(self, messages):
+        queue = DomainQueue(messages)
+        renderer = self.pool.render_ahead(queue, lambda message: self.skeleton)
+        self.addCleanup(renderer.close)
+        return queue, renderer
+
+    def expected(self, message) -> bytes:
+        # 绕过计数，直接用同一骨架在本进程中渲染作为对照
+        return MessageSkeleton.render_head(
+            self.skeleton, message['recipient_email'], message['recipient_name'], message['subject'], message['content']
+        )
+
+    def submitted(self, renderer, messages):
+        """已提交渲染的收件人（排序后）"""
+        return sorted(m['recipient_email'] for m in messages if m.get('_render_token') in renderer._submitted)
+
+    def emails(self, messages):
+        return sorted(m['recipient_email'] for m in messages)
+
+    def finish(self, renderer):
+        wait([future for future, _ in renderer._submitted.values()], timeout=30)
+
+    def test_disabled_or_small_lane_has_no_renderer(self):
+        messages = [make_message(i, 'a.edu') for i in range(3)]
+        self.assertIsNone(RenderPool(0).render_ahead(DomainQueue(messages), lambda message: self.skeleton))
+        self.assertIsNone(RenderPool(1, min_batch=4).render_ahead(DomainQueue(messages), lambda message: self.skeleton))
+
+    def test_window_follows_queue_order(self):
+        messages = [make_message(i, domain) for i, domain in enumerate(['a.edu'] * 4 + ['b.edu'] * 4)]
+        queue, renderer = self.render_ahead(messages)
+        self.assertEqual(self.submitted(renderer, messages), self.emails(queue.upcoming(4)))
+
+        # a.edu 名额被占用时 pop_ready 连续取出 b.edu 的邮件，预渲染随队列的实际顺序补充
+        throttle = DomainThrottle(max_concurrency=1, min_interval=0)
+        throttle.try_acquire('a.edu')
+        for _ in range(3):
+            message, _ = queue.pop_ready(throttle)
+            throttle.release('b.edu')
+            self.finish(renderer)
+            self.assertEqual(renderer.head(message), self.expected(message))
+        self.assertEqual(self.submitted(renderer, messages), self.emails(queue.upcoming(4)))
+        self.assertEqual(self.skeleton.local_renders, 0)
+
+    def test_results_match_local_rendering(self):
+        messages = [make_message(i, f'd{i % 3}.edu') for i in range(10)]
+        queue, renderer = self.render_ahead(messages)
+        while queue:
+            message = queue.pop()
+            self.finish(renderer)
+            self.assertEqual(renderer.head(message), self.expected(message))
+        self.assertEqual(self.skeleton.local_renders, 0)
+
+    def test_retried_and_discarded_messages_render_locally(self):
+        messages = [make_message(i, 'a.edu') for i in range(6)]
+        queue, renderer = self.render_ahead(messages)
+        first = queue.pop()
+        self.finish(renderer)
+        renderer.head(first)
+        # 重试时预渲染结果已取用，在发送线程中渲染
+        self.assertEqual(renderer.head(first), self.expected(first))
+        self.assertEqual(self.skeleton.local_renders, 1)
+
+        second = queue.pop()
+        renderer.discard(second)
+        self.assertEqual(len(renderer._submitted), 4)
+        self.assertNotIn(second['recipient_email'], self.submitted(renderer, messages))
+
+    def test_tokens_do_not_leak_between_renderers(self):
+        messages = [make_message(i, 'a.edu') for i in range(4)]
+        queue, renderer = self.render_ahead(messages)
+        renderer.close()
+        # 同一批邮件交给新的预渲染器（如任务恢复），按新队列的顺序取得各自的结果
+        queue, renderer = self.render_ahead(list(reversed(messages)))
+        while queue:
+            message = queue.pop()
+            self.finish(renderer)
+            self.assertEqual(renderer.head(message), self.expected(message))
+        self.assertEqual(self.skeleton.local_renders, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
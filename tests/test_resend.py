@@ -0,0 +1,121 @@
+import unittest
+from unittest import mock
+
+from backend.batch_jobs import JOB_COMPLETED
+from backend.database import EmailRecord, db
+from backend.smtp_errors import SMTPSendError
+from tests.support import FakeEmailService, JobRouteTestCase
+
+
+class ResendRouteTest(JobRouteTestCase):
+    """重发结果更新原记录，不产生新的发送记录"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_sender('Sender', 'sender@example.com')
+        self.professor_ids = self.add_professors(4)
+        self.single_service = FakeEmailService(self.service.throttle)
+        patcher = mock.patch.object(self.routes, 'email_service', self.single_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_record(self, professor_id: int, status: str = 'failed', sender_email: str = 'sender@example.com') -> int:
+        record = EmailRecord(professor_id=professor_id, subject='Hi', content='<p>Body</p>', status=status,
+                             error_message='SMTP 550: rejected' if status == 'failed' else None,
+                             sender_email=sender_email)
+        db.session.add(record)
+        db.session.commit()
+        return record.id
+
+    def record(self, record_id: int) -> EmailRecord:
+        return db.session.get(EmailRecord, record_id, populate_existing=True)
+
+    def test_single_resend_updates_record(self):
+        record_id = self.add_record(self.professor_ids[0])
+        response = self.client.post(f'/api/resend-email/{record_id}')
+        self.assertEqual(response.status_code, 200)
+        result = response.get_json()
+        self.assertEqual((result['record_id'], result['status']), (record_id, 'sent'))
+        self.assertTrue(result['sent_at'])
+        self.assertEqual([recipient for _, recipient, _ in self.single_service.delivered], ['p0@a.edu'])
+        record = self.record(record_id)
+        self.assertEqual((record.status, record.error_message), ('sent', None))
+        self.assertEqual(EmailRecord.query.count(), 1)
+
+    def test_single_resend_failure_keeps_record_failed(self):
+        record_id = self.add_record(self.professor_ids[0])
+        error = SMTPSendError('mailbox unavailable', code=550)
+        with mock.patch.object(self.single_service, 'deliver_prepared', side_effect=error):
+            response = self.client.post(f'/api/resend-email/{record_id}')
+        self.assertEqual(response.status_code, 500)
+        result = response.get_json()
+        self.assertEqual((result['record_id'], result['status'], result['smtp_code']), (record_id, 'failed', 550))
+        self.assertFalse(result['temporary'])
+        self.assertEqual(self.record(record_id).error_message, 'SMTP 550: mailbox unavailable')
+        self.assertEqual(EmailRecord.query.count(), 1)
+
+    def test_single_resend_rejects_missing_pending_and_orphaned_records(self):
+        self.assertEqual(self.client.post('/api/resend-email/999').status_code, 404)
+        pending_id = self.add_record(self.professor_ids[0], status='pending')
+        self.assertEqual(self.client.post(f'/api/resend-email/{pending_id}').status_code, 409)
+        orphaned_id = self.add_record(self.professor_ids[1], sender_email='gone@example.com')
+        response = self.client.post(f'/api/resend-email/{orphaned_id}')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('gone@example.com', response.get_json()['error'])
+        self.assertEqual(self.single_service.delivered, [])
+
+    def test_bulk_resend_updates_failed_records_in_place(self):
+        failed_ids = [self.add_record(professor_id) for professor_id in self.professor_ids[:3]]
+        sent_id = self.add_record(self.professor_ids[3], status='sent')
+        orphaned_id = self.add_record(self.professor_ids[3], sender_email='gone@example.com')
+
+        response = self.client.post('/api/resend-emails', json={'send_interval': 0})
+        self.assertEqual(response.status_code, 202)
+        submitted = response.get_json()
+        self.assertEqual(submitted['total'], 4)
+        self.assertEqual([entry['record_id'] for entry in submitted['failed_emails']], [orphaned_id])
+
+        status = self.wait_for_job(submitted['job_id'], lambda s: s['finished'])
+        self.assertEqual((status['status'], status['sent'], status['failed']), (JOB_COMPLETED, 3, 1))
+        self.assertEqual(sorted(recipient for _, recipient, _ in self.service.delivered),
+                         ['p0@a.edu', 'p1@a.edu', 'p2@a.edu'])
+        self.assertEqual([self.record(record_id).status for record_id in failed_ids], ['sent'] * 3)
+        self.assertEqual(self.record(orphaned_id).status, 'failed')
+        self.assertEqual(self.record(sent_id).status, 'sent')
+        self.assertEqual(EmailRecord.query.count(), 5)
+
+    def test_bulk_resend_filters(self):
+        first, second = (self.add_record(professor_id) for professor_id in self.professor_ids[:2])
+        self.add_record(self.professor_ids[2], sender_email='other@example.com')
+
+        response = self.client.post('/api/resend-emails', json={'record_ids': [second], 'send_interval': 0})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json()['total'], 1)
+        self.wait_for_job(response.get_json()['job_id'], lambda s: s['finished'])
+        self.assertEqual((self.record(first).status, self.record(second).status), ('failed', 'sent'))
+
+        response = self.client.post('/api/resend-emails', json={'sender_email': 'sender@example.com',
+                                                                 'date_to': '2000-01-01'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_resend_skips_records_already_queued(self):
+        self.add_record(self.professor_ids[0])
+        with mock.patch.object(self.routes.batch_job_manager, 'rate_limiter') as limiter:
+            # 第一批仍在发件箱中等待时再次提交：没有可重发的记录
+            limiter.reserve.return_value = 0.3
+            job_id = self.client.post('/api/resend-emails', json={'send_interval': 0}).get_json()['job_id']
+            self.assertEqual(self.client.post('/api/resend-emails', json={}).status_code, 404)
+            self.wait_for_job(job_id, lambda s: s['finished'])
+        self.assertEqual(len(self.service.delivered), 1)
+
+    def test_bulk_resend_rejects_invalid_filters(self):
+        for data in ({'status': 'pending'}, {'date_from': '2024/01/01'}, {'record_ids': ['abc']}):
+            with self.subTest(data=data):
+                response = self.client.post('/api/resend-emails', json=data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.get_json())
+        self.assertEqual(self.client.post('/api/resend-emails', json={'sender_id': 999}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
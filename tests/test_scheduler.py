@@ -0,0 +1,137 @@
+import threading
+import time
+import unittest
+from datetime import timedelta
+
+from backend.batch_jobs import JOB_CANCELLED, JOB_COMPLETED, JOB_SCHEDULED, BatchJob, BatchJobManager
+from backend.database import db
+from backend.domain_throttle import DomainThrottle
+from backend.models.outbox_message import OutboxMessage
+from backend.outbox import OUTBOX_CANCELLED, OUTBOX_SENT, Outbox
+from backend.render_pool import RenderPool
+from backend.scheduler import ScheduledDispatcher
+from backend.utils.timezone_utils import get_shanghai_utcnow
+from tests.support import DatabaseTestCase, FakeEmailService, FakeRateLimiter, make_message
+
+
+class ScheduledDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fired = []
+        self.done = threading.Event()
+        self.expected = 0
+
+    def callback(self, key):
+        self.fired.append((key, time.time()))
+        if len(self.fired) >= self.expected:
+            self.done.set()
+
+    def test_entries_fire_in_due_order(self):
+        dispatcher = ScheduledDispatcher(self.callback)
+        now = time.time()
+        self.expected = 3
+        for key, delay in (('c', 0.15), ('a', 0.05), ('b', 0.1)):
+            dispatcher.schedule(now + delay, key)
+        self.assertEqual(len(dispatcher), 3)
+        self.assertAlmostEqual(dispatcher.next_due(), now + 0.05)
+        self.assertTrue(self.done.wait(5))
+        self.assertEqual([key for key, _ in self.fired], ['a', 'b', 'c'])
+        for (key, fired_at), delay in zip(self.fired, (0.05, 0.1, 0.15)):
+            self.assertGreaterEqual(fired_at, now + delay)
+        self.assertIsNone(dispatcher.next_due())
+
+    def test_earlier_entry_wakes_dispatcher(self):
+        dispatcher = ScheduledDispatcher(self.callback)
+        self.expected = 1
+        dispatcher.schedule(time.time() + 3600, 'later')
+        time.sleep(0.05)
+        start = time.time()
+        dispatcher.schedule(start + 0.05, 'sooner')
+        self.assertTrue(self.done.wait(5))
+        self.assertEqual(self.fired[0][0], 'sooner')
+        self.assertLess(self.fired[0][1] - start, 1)
+        self.assertEqual(len(dispatcher), 1)
+
+    def test_callback_error_does_not_stop_dispatcher(self):
+        def callback(key):
+            if key == 'bad':
+                raise RuntimeError('boom')
+            self.callback(key)
+
+        dispatcher = ScheduledDispatcher(callback)
+        self.expected = 1
+        now = time.time()
+        with self.assertLogs('backend.scheduler', 'ERROR'):
+            dispatcher.schedule(now, 'bad')
+            dispatcher.schedule(now + 0.05, 'good')
+            self.assertTrue(self.done.wait(5))
+        self.assertEqual([key for key, _ in self.fired], ['good'])
+
+
+class ScheduledJobTest(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.throttle = DomainThrottle(max_concurrency=2, min_interval=0)
+        self.service = FakeEmailService(self.throttle)
+
+    def make_manager(self) -> BatchJobManager:
+        return BatchJobManager(
+            email_service=self.service, rate_limiter=FakeRateLimiter(self.throttle, {}), outbox=Outbox(),
+            domain_throttle=self.throttle, render_pool=RenderPool(0), prewarm=False, external_workers=False
+        )
+
+    def wait_for(self, manager: BatchJobManager, job_id: str, status: str, timeout: float = 5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = manager.get(job_id)
+            if job is not None and job.status == status:
+                return job
+            time.sleep(0.02)
+        self.fail(f'job {job_id} did not reach {status}')
+
+    def outbox_statuses(self, job_id: str) -> list:
+        return sorted(row.status for row in OutboxMessage.query.filter_by(job_id=job_id).populate_existing())
+
+    def submit_scheduled(self, manager: BatchJobManager, delay: float, count: int = 3) -> BatchJob:
+        messages = [make_message(i, f'd{i}.edu') for i in range(count)]
+        job = BatchJob('batch', messages, scheduled_at=get_shanghai_utcnow() + timedelta(seconds=delay))
+        return manager.submit(self.app, job)
+
+    def test_job_waits_until_due(self):
+        manager = self.make_manager()
+        job = self.submit_scheduled(manager, 0.3)
+        self.assertEqual(job.status, JOB_SCHEDULED)
+        time.sleep(0.1)
+        self.assertEqual(self.service.delivered, [])
+        # 到期前发件箱中的邮件未被认领
+        self.assertEqual(Outbox().claim('other-worker', job_id=job.id), [])
+        self.wait_for(manager, job.id, JOB_COMPLETED)
+        self.assertEqual(len(self.service.delivered), 3)
+        self.assertEqual(self.outbox_statuses(job.id), [OUTBOX_SENT] * 3)
+
+    def test_cancelled_job_is_never_sent(self):
+        manager = self.make_manager()
+        job = self.submit_scheduled(manager, 0.2)
+        self.assertTrue(manager.control(job.id, 'cancel'))
+        self.assertEqual(job.status, JOB_CANCELLED)
+        self.assertEqual(self.outbox_statuses(job.id), [OUTBOX_CANCELLED] * 3)
+        time.sleep(0.4)
+        self.assertEqual(self.service.delivered, [])
+
+    def test_recovered_after_restart(self):
+        job = self.submit_scheduled(self.make_manager(), 3600)
+        # 新进程从发件箱重建调度；把计划时间提前后恢复
+        OutboxMessage.query.filter_by(job_id=job.id).update(
+            {'next_attempt_at': get_shanghai_utcnow() + timedelta(seconds=0.2)}
+        )
+        db.session.commit()
+        manager = self.make_manager()
+        manager.recover(self.app)
+        self.assertEqual(manager.get(job.id).status, JOB_SCHEDULED)
+        self.wait_for(manager, job.id, JOB_COMPLETED)
+        self.assertEqual(len(self.service.delivered), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import mailbox
+import os
+import unittest
+from unittest import mock
+
+from backend.batch_jobs import distribute_by_weight
+from tests.support import EmailRouteTestCase
+
+
+class DistributeByWeightTest(unittest.TestCase):
+
+    def test_weights_are_interleaved(self):
+        self.assertEqual(distribute_by_weight(6, [2, 1]), [0, 1, 0, 0, 1, 0])
+
+    def test_non_positive_weights_are_skipped(self):
+        self.assertEqual(distribute_by_weight(3, [0, 1.5, -1]), [1, 1, 1])
+        self.assertEqual(distribute_by_weight(4, [0, 0]), [0, 1, 0, 1])
+
+
+class SenderWeightsRouteTest(EmailRouteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.senders = [self.add_sender('First', 'first@example.com'), self.add_sender('Second', 'second@example.com')]
+        self.professor_ids = self.add_professors(6)
+        patcher = mock.patch.object(
+            self.routes.document_service, 'get_file_content', return_value=('<p>Dear {{name}}</p>', None)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, **fields):
+        return self.client.post('/api/send-document-email', json={
+            'professors': [{'id': professor_id} for professor_id in self.professor_ids],
+            'documents': [{'id': 1}], 'subject': 'Hi', 'sender_ids': self.senders, 'export': 'mbox', **fields
+        })
+
+    def senders_of(self, response):
+        box = mailbox.mbox(os.path.join(self.export_dir, response.get_json()['filename']))
+        self.addCleanup(box.close)
+        return [message['From'].split('<')[-1].rstrip('>') for message in box]
+
+    def test_weights_by_sender_id(self):
+        response = self.post(sender_weights={str(self.senders[0]): 2, str(self.senders[1]): 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.senders_of(response).count('first@example.com'), 4)
+
+    def test_invalid_weights_are_rejected(self):
+        for weights in ({str(self.senders[0]): 'abc'}, [1, None], [1, -2], [1, True], [1], 'heavy'):
+            with self.subTest(weights=weights):
+                response = self.post(sender_weights=weights)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.get_json())
+        self.assertEqual(os.listdir(self.export_dir), [])
+
+    def test_unknown_distribution_is_rejected(self):
+        self.assertEqual(self.post(distribution='random').status_code, 400)
+
+    def test_quota_uses_remaining_daily_cap(self):
+        limits = {'first@example.com': {'per_hour': 60, 'burst': 5, 'daily_cap': 10},
+                  'second@example.com': {'per_hour': 60, 'burst': 5, 'daily_cap': 20}}
+        with mock.patch.object(self.routes.email_service, 'get_rate_limits', lambda config: limits[config['email']]):
+            response = self.post(distribution='quota')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.senders_of(response).count('second@example.com'), 4)
+
+    def test_quota_without_daily_cap_is_rejected(self):
+        limits = {'per_hour': 600, 'burst': 5, 'daily_cap': None}
+        with mock.patch.object(self.routes.email_service, 'get_rate_limits', lambda config: limits):
+            response = self.post(distribution='quota')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('first@example.com', response.get_json()['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import smtplib
+import time
+import unittest
+from types import SimpleNamespace
+
+from backend.smtp_pool import SMTPConnectionPool, is_connection_error, send_data_stream
+from benchmarks.smtp_sink import SMTPSink
+
+MESSAGE = b'Subject: test\r\n\r\nbody\r\n'
+
+
+class SMTPPoolTest(unittest.TestCase):
+    """连接池与本地SMTP替身服务器之间的真实会话"""
+
+    def setUp(self):
+        self.sink = SMTPSink()
+        host, port = self.sink.start_in_thread()
+        self.addCleanup(self.sink.stop_thread)
+        self.key = SMTPConnectionPool.make_key(host, port, 'sender@example.com', 'PLAIN')
+
+    def make_pool(self, **options) -> SMTPConnectionPool:
+        pool = SMTPConnectionPool(timeout=5, **options)
+        self.addCleanup(pool.close_all)
+        return pool
+
+    def send(self, pool: SMTPConnectionPool, password: str = 'secret'):
+        return pool.send_stream(self.key, password, 'sender@example.com', ['to@example.com'], lambda: [MESSAGE])
+
+    def test_session_is_reused(self):
+        pool = self.make_pool()
+        for _ in range(3):
+            self.send(pool)
+        self.assertEqual((self.sink.connections, self.sink.auths, self.sink.messages), (1, 1, 3))
+        self.assertEqual(pool.stats(), {'keys': 1, 'idle_connections': 1})
+
+    def test_noop_only_after_idle_threshold(self):
+        pool = self.make_pool(liveness_check_after=60)
+        self.send(pool)
+        self.send(pool)
+        self.assertEqual(self.sink.commands['NOOP'], 0)
+
+        pool = self.make_pool(liveness_check_after=0)
+        self.send(pool)
+        self.send(pool)
+        self.assertEqual(self.sink.commands['NOOP'], 1)
+        self.assertEqual(self.sink.connections, 2)
+
+    def test_dead_idle_session_is_replaced_after_noop(self):
+        pool = self.make_pool(liveness_check_after=0)
+        self.send(pool)
+        self.sink.disconnect_all()
+        self.send(pool)
+        self.assertEqual((self.sink.connections, self.sink.messages), (2, 2))
+
+    def test_dropped_reused_session_is_retried_once(self):
+        # 不探活时，复用的连接在发送时才发现已断开：重连后重发一次
+        pool = self.make_pool(liveness_check_after=60)
+        self.send(pool)
+        self.sink.disconnect_all()
+        self.send(pool)
+        self.assertEqual((self.sink.connections, self.sink.messages), (2, 2))
+
+    def test_new_session_failure_is_not_retried(self):
+        pool = self.make_pool()
+        self.sink.stop_thread()
+        with self.assertRaises(OSError):
+            self.send(pool)
+        self.assertEqual(self.sink.connections, 0)
+
+    def test_dirty_session_is_reset_before_reuse(self):
+        pool = self.make_pool()
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            with pool.connection(self.key, 'secret'):
+                raise smtplib.SMTPRecipientsRefused({'to@example.com': (550, b'rejected')})
+        self.assertEqual(self.sink.commands['RSET'], 1)
+        self.assertEqual(pool.stats()['idle_connections'], 1)
+        self.send(pool)
+        self.assertEqual(self.sink.connections, 1)
+
+    def test_rejected_recipient_keeps_session(self):
+        self.sink.reject_rate = 1.0
+        pool = self.make_pool()
+        with self.assertRaises(smtplib.SMTPRecipientsRefused) as raised:
+            self.send(pool)
+        self.assertFalse(is_connection_error(raised.exception))
+        self.sink.reject_rate = 0.0
+        self.send(pool)
+        self.assertEqual((self.sink.connections, self.sink.messages), (1, 1))
+        self.assertGreaterEqual(self.sink.commands['RSET'], 1)
+
+    def test_idle_sessions_are_evicted(self):
+        pool = self.make_pool(idle_timeout=0.05)
+        self.send(pool)
+        time.sleep(0.1)
+        self.send(pool)
+        self.assertEqual(self.sink.connections, 2)
+        self.assertEqual(self.sink.commands['QUIT'], 1)
+        self.assertEqual(pool.stats()['idle_connections'], 1)
+
+    def test_max_idle_per_key(self):
+        pool = self.make_pool(max_idle_per_key=1)
+        first = pool.acquire(self.key, 'secret')
+        second = pool.acquire(self.key, 'secret')
+        pool.release(first)
+        pool.release(second)
+        self.assertEqual(pool.stats()['idle_connections'], 1)
+        self.assertEqual(self.sink.commands['QUIT'], 1)
+
+    def test_message_cap_per_session(self):
+        pool = self.make_pool(max_messages_per_connection=2)
+        for _ in range(3):
+            self.send(pool)
+        self.assertEqual((self.sink.connections, self.sink.messages), (2, 3))
+
+    def test_changed_password_opens_new_session(self):
+        pool = self.make_pool()
+        self.send(pool, 'old')
+        self.send(pool, 'new')
+        self.assertEqual((self.sink.connections, self.sink.auths), (2, 2))
+        self.assertEqual(self.sink.commands['QUIT'], 1)
+
+
+class SendDataStreamTest(unittest.TestCase):
+    """逐条等待与流水线两种信封发送方式的行为一致"""
+
+    def start_sink(self, **options) -> smtplib.SMTP:
+        self.sink = SMTPSink(keep_messages=True, **options)
+        host, port = self.sink.start_in_thread()
+        self.addCleanup(self.sink.stop_thread)
+        smtp = smtplib.SMTP(host, port, timeout=5)
+        self.addCleanup(smtp.close)
+        smtp.ehlo()
+        return smtp
+
+    def rcpt_rolls(self, *rolls):
+        """按顺序指定 RCPT 的随机数：小于 reject_rate 的被拒收"""
+        self.sink.reject_rate = 0.5
+        self.sink._random = SimpleNamespace(random=iter(rolls).__next__)
+
+    def test_message_is_delivered_intact(self):
+        for pipelining in (False, True):
+            with self.subTest(pipelining=pipelining):
+                smtp = self.start_sink()
+                chunks = [b'Subject: dots\r\n\r\n', b'..leading dot\r\n', b'last line\r\n']
+                refused = send_data_stream(smtp, 'a@example.com', 'b@example.com', chunks, pipelining)
+                self.assertEqual(refused, {})
+                self.assertEqual(self.sink.received, [b'Subject: dots\r\n\r\n.leading dot\r\nlast line\r\n'])
+
+    def test_partially_refused_recipients(self):
+        for pipelining in (False, True):
+            with self.subTest(pipelining=pipelining):
+                smtp = self.start_sink()
+                self.rcpt_rolls(0.0, 0.9)
+                refused = send_data_stream(smtp, 'a@example.com', ['x@example.com', 'y@example.com'], [MESSAGE],
+                                           pipelining)
+                self.assertEqual(list(refused), ['x@example.com'])
+                self.assertEqual(refused['x@example.com'][0], 550)
+                self.assertEqual(self.sink.messages, 1)
+
+    def test_all_recipients_refused_resets_session(self):
+        for pipelining in (False, True):
+            with self.subTest(pipelining=pipelining):
+                smtp = self.start_sink()
+                self.rcpt_rolls(0.0, 0.0, 0.9)
+                with self.assertRaises(smtplib.SMTPRecipientsRefused) as raised:
+                    send_data_stream(smtp, 'a@example.com', ['x@example.com', 'y@example.com'], [MESSAGE],
+                                     pipelining)
+                self.assertFalse(is_connection_error(raised.exception))
+                self.assertEqual(self.sink.commands['RSET'], 1)
+                # 会话已重置，可以继续发送下一封
+                send_data_stream(smtp, 'a@example.com', 'z@example.com', [MESSAGE], pipelining)
+                self.assertEqual(self.sink.messages, 1)
+
+    def test_421_closes_session(self):
+        for pipelining in (False, True):
+            with self.subTest(pipelining=pipelining):
+                smtp = self.start_sink(throttle_every=1)
+                with self.assertRaises(smtplib.SMTPSenderRefused) as raised:
+                    send_data_stream(smtp, 'a@example.com', 'b@example.com', [MESSAGE], pipelining)
+                self.assertEqual(raised.exception.smtp_code, 421)
+                self.assertTrue(is_connection_error(raised.exception))
+                self.assertIsNone(smtp.sock)
+
+    def test_pipelining_saves_round_trips(self):
+        recipients = ['x@example.com', 'y@example.com', 'z@example.com']
+        elapsed = {}
+        for pipelining in (False, True):
+            smtp = self.start_sink(latency=0.05)
+            start = time.perf_counter()
+            send_data_stream(smtp, 'a@example.com', recipients, [MESSAGE], pipelining)
+            elapsed[pipelining] = time.perf_counter() - start
+        # 逐条等待：MAIL、3 个 RCPT、DATA 与邮件内容共 6 个往返；流水线：信封 1 个、内容 1 个
+        self.assertGreaterEqual(elapsed[False], 0.28)
+        self.assertLess(elapsed[True], 0.2)
+
+    def test_falls_back_when_not_advertised(self):
+        smtp = self.start_sink(pipelining=False, latency=0.05)
+        start = time.perf_counter()
+        send_data_stream(smtp, 'a@example.com', ['x@example.com', 'y@example.com'], [MESSAGE], True)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.23)
+        self.assertEqual(self.sink.messages, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+from backend.template_engine import CompiledTemplate, TemplateCache
+
+
+class CompiledTemplateRenderTest(unittest.TestCase):
+
+    def test_render_fills_known_fields(self):
+        template = CompiledTemplate('Dear {{name}}, about {{research_area}}.', ['name', 'research_area'])
+        self.assertEqual(template.render({'name': '张三', 'research_area': 'NLP'}), 'Dear 张三, about NLP.')
+        self.assertEqual(template.fields, ('name', 'research_area'))
+
+    def test_unknown_placeholder_is_kept_verbatim(self):
+        template = CompiledTemplate('Hi {{name}} {{nickname}}', ['name'])
+        self.assertEqual(template.unknown, ('nickname',))
+        self.assertEqual(template.fields, ('name',))
+        # 即使给出未知字段的值也不替换
+        self.assertEqual(template.render({'name': 'A', 'nickname': 'B'}), 'Hi A {{nickname}}')
+
+    def test_missing_or_none_value_keeps_placeholder(self):
+        template = CompiledTemplate('{{name}}-{{email}}')
+        self.assertEqual(template.render({'name': None}), '{{name}}-{{email}}')
+        self.assertEqual(template.render({'email': 'a@b.c'}), '{{name}}-a@b.c')
+
+    def test_static_template(self):
+        template = CompiledTemplate('no placeholders', [])
+        self.assertTrue(template.is_static)
+        self.assertEqual(template.render({}), 'no placeholders')
+        self.assertEqual(template.render_columns({}, 3), ['no placeholders'] * 3)
+
+    def test_repeated_field(self):
+        template = CompiledTemplate('{{name}} and {{name}}')
+        self.assertEqual(template.fields, ('name',))
+        self.assertEqual(template.render({'name': 'X'}), 'X and X')
+
+
+class CompiledTemplateRenderColumnsTest(unittest.TestCase):
+
+    def test_matches_render_per_row(self):
+        template = CompiledTemplate('<p>{{name}} / {{university}} / {{date}}</p>',
+                                    ['name', 'university', 'date'])
+        names = ['A', 'B', None]
+        universities = ['U1', None, 'U3']
+        columns = {'name': names, 'university': universities, 'date': '2026-01-01'}
+        expected = [
+            template.render({'name': name, 'university': university, 'date': '2026-01-01'})
+            for name, university in zip(names, universities)
+        ]
+        self.assertEqual(template.render_columns(columns, 3), expected)
+        self.assertEqual(expected[1], '<p>B / {{university}} / 2026-01-01</p>')
+        self.assertEqual(expected[2], '<p>{{name}} / U3 / 2026-01-01</p>')
+
+    def test_absent_column_and_none_scalar_keep_placeholder(self):
+        template = CompiledTemplate('{{name}}:{{email}}')
+        self.assertEqual(template.render_columns({'email': None}, 2), ['{{name}}:{{email}}'] * 2)
+
+    def test_unknown_placeholder_is_kept(self):
+        template = CompiledTemplate('{{name}} {{nickname}}', ['name'])
+        self.assertEqual(template.render_columns({'name': ['A', 'B'], 'nickname': ['x', 'y']}, 2),
+                         ['A {{nickname}}', 'B {{nickname}}'])
+
+    def test_single_column_template(self):
+        template = CompiledTemplate('{{name}}')
+        self.assertEqual(template.render_columns({'name': ['A', None]}, 2), ['A', '{{name}}'])
+
+    def test_empty_values(self):
+        template = CompiledTemplate('{{name}}{{email}}')
+        self.assertEqual(template.render_columns({'name': ['', ''], 'email': ''}, 2), ['', ''])
+
+    def test_zero_rows(self):
+        template = CompiledTemplate('x {{name}}')
+        self.assertEqual(template.render_columns({'name': []}, 0), [])
+
+    def test_length_mismatch_raises(self):
+        template = CompiledTemplate('{{name}}')
+        with self.assertRaises(ValueError):
+            template.render_columns({'name': ['A']}, 2)
+
+
+class TemplateCacheTest(unittest.TestCase):
+
+    def test_compile_is_cached_per_field_set(self):
+        cache = TemplateCache(max_entries=2)
+        first = cache.compile('{{name}}', ['name'])
+        self.assertIs(cache.compile('{{name}}', ['name']), first)
+        self.assertIsNot(cache.compile('{{name}}', ['email']), first)
+
+    def test_lru_eviction(self):
+        cache = TemplateCache(max_entries=1)
+        first = cache.compile('a')
+        cache.compile('b')
+        self.assertIsNot(cache.compile('a'), first)
+
+
+if __name__ == '__main__':
+    unittest.main()